@@ -20,12 +20,12 @@ from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
 from channels.middleware import BaseMiddleware
 from django.contrib.auth.models import AnonymousUser
-from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth import get_user_model
 from urllib.parse import parse_qs
 from chats.routing import websocket_urlpatterns  # import after setup
+from delivery_agent.ws_routing import websocket_urlpatterns as delivery_websocket_urlpatterns
 from loguru import logger
-from users.models import UserProfile
+from backend.auth import AuthError, USER, authenticate_token
 from django.conf import settings
 from asgiref.sync import sync_to_async
 
@@ -42,20 +42,19 @@ class TokenAuthMiddleware(BaseMiddleware):
 
         if token:
             try:
-                # Verify the token and get the user
-                access_token = AccessToken(token)
-                user_id = access_token['user_id']
-                logger.info(f"Token decoded successfully. User ID: {user_id}")
-                
-                # Get the UserProfile asynchronously
-                user = await self.get_user_profile(user_id)
-                if user:
-                    logger.info(f"User authenticated successfully: {user.email}")
-                    scope['user'] = user
+                # Verify the token and resolve the principal through the shared auth cache
+                principal = await self.get_principal(token)
+                logger.info(f"Token decoded successfully. {principal.kind} ID: {principal.subject_id}")
+                if principal.kind == USER:
+                    logger.info(f"User authenticated successfully: {principal.email}")
+                    scope['user'] = principal.as_user_profile()
                 else:
-                    logger.warning(f"UserProfile not found for ID: {user_id}")
                     scope['user'] = AnonymousUser()
+                    scope['delivery_agent'] = principal if principal.is_approved else None
                 
+            except AuthError as e:
+                logger.warning(f"Token authentication failed: {e.message}")
+                scope['user'] = AnonymousUser()
             except Exception as e:
                 logger.error(f"Token authentication failed: {str(e)}")
                 scope['user'] = AnonymousUser()
@@ -66,17 +65,15 @@ class TokenAuthMiddleware(BaseMiddleware):
         return await super().__call__(scope, receive, send)
 
     @sync_to_async
-    def get_user_profile(self, user_id):
-        try:
-            return UserProfile.objects.get(user_id=user_id)
-        except UserProfile.DoesNotExist:
-            return None
+    def get_principal(self, token):
+        principal, _ = authenticate_token(token)
+        return principal
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AllowedHostsOriginValidator(
         TokenAuthMiddleware(
-            URLRouter(websocket_urlpatterns)
+            URLRouter(websocket_urlpatterns + delivery_websocket_urlpatterns)
         )
     ),
 })
\ No newline at end of file
@@ -0,0 +1,219 @@
+"""
+Token verification shared by the delivery-agent HTTP middleware, the WebSocket
+middleware and the refresh endpoints.
+
+Tokens are HS256-verified once, and the principal they name is kept as a small
+snapshot in the Django cache, so an authenticated request does not hit the
+database. Anything that changes a snapshot field must call invalidate_principal().
+The invalidation only reaches other workers when CACHES is shared (Redis, see
+settings); with per-process caches AUTH_PRINCIPAL_CACHE_SECONDS bounds how long
+they keep the old snapshot.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from loguru import logger
+from ninja.errors import HttpError
+from ninja.security import HttpBearer
+
+from .revocation import revocations
+
+USER = "user"
+DELIVERY_AGENT = "delivery_agent"
+
+SIGNING_KEY = settings.SIMPLE_JWT.get('SIGNING_KEY', settings.SECRET_KEY)
+ALGORITHM = settings.SIMPLE_JWT.get('ALGORITHM', 'HS256')
+USER_ID_CLAIM = settings.SIMPLE_JWT.get('USER_ID_CLAIM', 'user_id')
+PRINCIPAL_CACHE_SECONDS = getattr(settings, 'AUTH_PRINCIPAL_CACHE_SECONDS', 60)
+
+
+class AuthError(Exception):
+    def __init__(self, message: str, status: int = 401):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@dataclass(frozen=True)
+class Principal:
+    kind: str
+    subject_id: int
+    email: str
+    first_name: str
+    last_name: str
+    approval_status: Optional[str] = None  # delivery agents only
+    user_type: Optional[str] = None  # users only
+
+    @property
+    def is_approved(self) -> bool:
+        return self.kind != DELIVERY_AGENT or self.approval_status == "approved"
+
+    @property
+    def is_moderator(self) -> bool:
+        return self.kind == USER and self.user_type == "moderator"
+
+    def as_user_profile(self):
+        """Unsaved UserProfile carrying the snapshot; usable as a foreign key value."""
+        from users.models import UserProfile
+        return UserProfile(
+            user_id=self.subject_id,
+            email=self.email,
+            first_name=self.first_name,
+            last_name=self.last_name,
+        )
+
+    def as_delivery_agent(self):
+        """Unsaved DeliveryAgent carrying the snapshot, e.g. for generate_tokens."""
+        from delivery_agent.models import DeliveryAgent
+        return DeliveryAgent(
+            agent_id=self.subject_id,
+            email=self.email,
+            first_name=self.first_name,
+            last_name=self.last_name,
+            approval_status=self.approval_status,
+        )
+
+
+def _verify(token: str, expected_type: str) -> dict:
+    """
+    Verify signature and expiry of a SimpleJWT user token or a delivery-agent token.
+    SimpleJWT names the type claim 'token_type'; agent tokens use 'type'.
+    """
+    try:
+        payload = jwt.decode(token, SIGNING_KEY, algorithms=[ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise AuthError("Token has expired")
+    except jwt.InvalidTokenError:
+        raise AuthError("Invalid token")
+
+    token_type = payload.get("token_type") or payload.get("type")
+    if token_type != expected_type:
+        raise AuthError("Invalid token type")
+    return payload
+
+
+def decode_token(token: str, expected_type: str = "access") -> dict:
+    """Verify a token and check it has not been revoked."""
+    payload = _verify(token, expected_type)
+    jti = payload.get("jti")
+    if jti and revocations.is_revoked(jti):
+        raise AuthError("Token has been revoked")
+    return payload
+
+
+def subject_of(payload: dict) -> tuple[str, int]:
+    if "agent_id" in payload:
+        return DELIVERY_AGENT, int(payload["agent_id"])
+    if USER_ID_CLAIM in payload:
+        return USER, int(payload[USER_ID_CLAIM])
+    raise AuthError("Invalid token")
+
+
+def _cache_key(kind: str, subject_id: int) -> str:
+    return f"auth:principal:{kind}:{subject_id}"
+
+
+def _load_principal(kind: str, subject_id: int) -> Principal:
+    if kind == DELIVERY_AGENT:
+        from delivery_agent.models import DeliveryAgent
+        row = (
+            DeliveryAgent.objects.filter(agent_id=subject_id)
+            .values("email", "first_name", "last_name", "approval_status")
+            .first()
+        )
+        if row is None:
+            raise AuthError("Delivery agent not found")
+    else:
+        from users.models import UserProfile
+        row = (
+            UserProfile.objects.filter(user_id=subject_id)
+            .values("email", "first_name", "last_name", "user_type")
+            .first()
+        )
+        if row is None:
+            raise AuthError("User not found")
+    return Principal(kind=kind, subject_id=subject_id, **row)
+
+
+def get_principal(kind: str, subject_id: int) -> Principal:
+    key = _cache_key(kind, subject_id)
+    principal = cache.get(key)
+    if principal is None:
+        principal = _load_principal(kind, subject_id)
+        cache.set(key, principal, PRINCIPAL_CACHE_SECONDS)
+    return principal
+
+
+def invalidate_principal(kind: str, subject_id: int):
+    logger.info(f"Invalidating cached {kind} principal {subject_id}.")
+    cache.delete(_cache_key(kind, subject_id))
+
+
+def authenticate_token(token: str, expected_type: str = "access") -> tuple[Principal, dict]:
+    """Verify a token and return the cached principal it names together with its payload."""
+    payload = decode_token(token, expected_type)
+    kind, subject_id = subject_of(payload)
+    return get_principal(kind, subject_id), payload
+
+
+def authenticate_token_cached(token: str, expected_type: str = "access") -> Optional[tuple[Principal, dict]]:
+    """
+    authenticate_token() without I/O, for async callers: answered from the token,
+    the revocation filter and the principal cache. Returns None when I/O would be
+    needed (filter due for a sync or a possible hit, principal not cached, or a
+    principal cache that is not in-process, such as Redis); the caller then falls
+    back to authenticate_token() in a thread.
+    """
+    if not isinstance(caches['default'], LocMemCache):
+        return None
+    payload = _verify(token, expected_type)
+    jti = payload.get("jti")
+    if jti and revocations.is_revoked_cached(jti) is not False:
+        return None
+    kind, subject_id = subject_of(payload)
+    principal = cache.get(_cache_key(kind, subject_id))
+    if principal is None:
+        return None
+    return principal, payload
+
+
+def consume_refresh_token(token: str) -> tuple[Principal, dict]:
+    """
+    Verify a refresh token and revoke it in the same step, so each refresh token
+    can be rotated exactly once. Tokens without a jti cannot be revoked and are refused.
+    """
+    principal, payload = authenticate_token(token, expected_type="refresh")
+    jti = payload.get("jti")
+    if not jti or not revocations.revoke(jti, principal.kind, principal.subject_id, payload["exp"]):
+        raise AuthError("Token has been revoked")
+    return principal, payload
+
+
+class BearerAuth(HttpBearer):
+    """Ninja auth for routes open to any signed-in user or approved delivery agent."""
+
+    def authenticate(self, request, token: str) -> Optional[Principal]:
+        try:
+            principal, _ = authenticate_token(token)
+        except AuthError as e:
+            logger.warning(f"Bearer authentication failed: {e.message}")
+            return None
+        return principal if principal.is_approved else None
+
+
+class ModeratorAuth(HttpBearer):
+    """Ninja auth for moderator-only routes: a user access token naming a moderator."""
+
+    def authenticate(self, request, token: str) -> Optional[Principal]:
+        try:
+            principal, _ = authenticate_token(token)
+        except AuthError as e:
+            logger.warning(f"Moderator authentication failed: {e.message}")
+            return None
+        if not principal.is_moderator:
+            raise HttpError(403, "Moderator access required")
+        return principal
@@ -0,0 +1,136 @@
+"""
+Revocation lookup for refresh-token rotation.
+
+Revoked jtis live in the append-only revoked_tokens table. Each process keeps a
+Bloom filter over the unexpired rows so the common "not revoked" answer needs no
+query; only a filter hit falls through to the database. The filter picks up rows
+written by other workers every REVOCATION_SYNC_SECONDS and is rebuilt from scratch
+every REVOCATION_REBUILD_SECONDS, which also drops expired entries.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from loguru import logger
+
+SYNC_SECONDS = getattr(settings, 'REVOCATION_SYNC_SECONDS', 10)
+REBUILD_SECONDS = getattr(settings, 'REVOCATION_REBUILD_SECONDS', 3600)
+FALSE_POSITIVE_RATE = 0.01
+MIN_CAPACITY = 1024
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, false_positive_rate: float = FALSE_POSITIVE_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.capacity = capacity
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationFilter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._last_id = 0
+        self._synced_at = 0.0
+        self._built_at = 0.0
+
+    def rebuild(self):
+        from users.models import RevokedToken
+        live = RevokedToken.objects.filter(expires_at__gt=timezone.now())
+        rows = list(live.values_list("id", "jti"))
+        bloom = BloomFilter(max(MIN_CAPACITY, len(rows) * 2))
+        for _, jti in rows:
+            bloom.add(jti)
+        with self._lock:
+            self._bloom = bloom
+            self._last_id = max((row_id for row_id, _ in rows), default=self._last_id)
+            self._synced_at = self._built_at = time.monotonic()
+        logger.info(f"Rebuilt token revocation filter with {len(rows)} entries.")
+
+    def _sync(self):
+        from users.models import RevokedToken
+        new_rows = list(RevokedToken.objects.filter(id__gt=self._last_id).values_list("id", "jti"))
+        with self._lock:
+            for row_id, jti in new_rows:
+                self._bloom.add(jti)
+                self._last_id = max(self._last_id, row_id)
+            self._synced_at = time.monotonic()
+            overfull = self._bloom.count > self._bloom.capacity
+        if overfull:
+            self.rebuild()
+
+    def _refresh_if_stale(self):
+        now = time.monotonic()
+        if self._bloom is None or now - self._built_at >= REBUILD_SECONDS:
+            self.rebuild()
+        elif now - self._synced_at >= SYNC_SECONDS:
+            self._sync()
+
+    def is_revoked(self, jti: str) -> bool:
+        self._refresh_if_stale()
+        if jti not in self._bloom:
+            return False
+        from users.models import RevokedToken
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def is_revoked_cached(self, jti: str):
+        """
+        is_revoked() without touching the database: False when the filter is fresh
+        and rules the jti out, None when only a query could tell.
+        """
+        now = time.monotonic()
+        if self._bloom is None or now - self._synced_at >= SYNC_SECONDS or now - self._built_at >= REBUILD_SECONDS:
+            return None
+        return None if jti in self._bloom else False
+
+    def revoke(self, jti: str, token_family: str, subject_id: int, expires_at: int) -> bool:
+        """
+        Record a revoked jti. Returns False when it was already revoked, which makes
+        a refresh token single-use even if two rotations race.
+        """
+        from users.models import RevokedToken
+        try:
+            RevokedToken.objects.create(
+                jti=jti,
+                token_family=token_family,
+                subject_id=subject_id,
+                expires_at=datetime.fromtimestamp(expires_at, tz=dt_timezone.utc),
+            )
+        except IntegrityError:
+            return False
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+        return True
+
+
+revocations = RevocationFilter()
+
+
+def prune_expired_revocations() -> int:
+    from users.models import RevokedToken
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    logger.info(f"Pruned {deleted} expired revoked tokens.")
+    return deleted
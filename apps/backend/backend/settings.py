@@ -84,6 +84,24 @@ AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator'},
 ]
 
+# Password hashing runs on a bounded process pool (users/passwords.py)
+PASSWORD_HASHERS = [
+    'users.passwords.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = 1_000_000      # changing this rehashes passwords on next login
+PASSWORD_HASHING_WORKERS = int(os.getenv('PASSWORD_HASHING_WORKERS', '2'))
+PASSWORD_HASHING_MAX_QUEUE = 32           # queued hashes per process before returning 429
+PASSWORD_HASHING_TIMEOUT_SECONDS = 10
+
+# Bulk user import (users/importer.py)
+USER_IMPORT_CHUNK_SIZE = 500   # rows hashed and inserted per transaction
+USER_IMPORT_WORKERS = int(os.getenv('USER_IMPORT_WORKERS', str(os.cpu_count() or 1)))
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -107,6 +125,8 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+# The delivery agent middleware validates CSRF tokens; let the frontend origins pass the Origin check
+CSRF_TRUSTED_ORIGINS = CORS_ALLOWED_ORIGINS
 
 # Additional CORS settings for production
 CORS_ALLOW_ALL_ORIGINS = False  # Keep this False for security
@@ -130,13 +150,44 @@ CORS_ALLOW_HEADERS = [
     'X-Csrftoken',
     'x-requested-with',
 ]
+# Cursor of the next page on paginated delivery history endpoints
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor']
+
+# ✅ Channels WebSocket layer (in-memory for development). With several workers set
+# CHANNEL_REDIS_URL, so delivery events reach sockets held by the other processes.
+if os.getenv('CHANNEL_REDIS_URL'):
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [os.getenv('CHANNEL_REDIS_URL')]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
 
-# ✅ Channels WebSocket layer (in-memory for development)
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-    },
-}
+# Cache for principal snapshots, profiles and (optionally) rate limits. Point
+# CACHE_REDIS_URL (or CHANNEL_REDIS_URL) at Redis when running several workers:
+# without it every worker has its own LocMemCache and an invalidation only reaches
+# the worker that made it.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL') or os.getenv('CHANNEL_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+            "KEY_PREFIX": "backend",
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    }
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
@@ -148,7 +199,7 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=120),  # Access token expires in 15 minutes
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),     # Refresh token expires in 1 day
     'ROTATE_REFRESH_TOKENS': True,                   # Get new refresh token with each refresh
-    'BLACKLIST_AFTER_ROTATION': True,                # Blacklist old refresh tokens
+    'BLACKLIST_AFTER_ROTATION': True,                # Old refresh tokens are revoked via backend/revocation.py
     'UPDATE_LAST_LOGIN': True,                       # Update last login timestamp
     'ALGORITHM': 'HS256',                            # Algorithm used for signing
     'SIGNING_KEY': SECRET_KEY,                       # Use Django's secret key
@@ -156,4 +207,30 @@ SIMPLE_JWT = {
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
 }
 
+# Product popularity (products/popularity.py)
+POPULARITY_VIEW_FLUSH_SECONDS = 30   # how often buffered product views are written out
+POPULARITY_HALF_LIFE_HOURS = 72      # popularity score halves every 3 days without activity
+
+# Cached principal snapshots for token authentication (backend/auth.py). With a
+# shared cache, approve/reject/edit invalidate the snapshot for every worker and it
+# can live a minute. With per-worker caches the other workers only notice when it
+# expires, so it is kept to a few seconds (at the cost of a query per principal
+# every few seconds).
+AUTH_PRINCIPAL_CACHE_SECONDS = 60 if CACHE_REDIS_URL else 5
+
+# Cached UserOut profile snapshots (users/profiles.py). Edits bump a version in the
+# cache, which only reaches the other workers when the cache is shared; with
+# per-worker caches they would serve the old address or 2FA flag until expiry.
+PROFILE_CACHE_SECONDS = 300 if CACHE_REDIS_URL else 5
+
+# Refresh-token revocation filter (backend/revocation.py)
+REVOCATION_SYNC_SECONDS = 10        # pick up jtis revoked by other workers
+REVOCATION_REBUILD_SECONDS = 3600   # full rebuild, dropping expired entries
+
+# Sliding-window rate limits (backend/throttling.py). "memory" counts per process;
+# "cache" shares counters through CACHES, which should then be a shared backend such as Redis.
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+# Trusted reverse proxies in front of the app; the client IP is read from X-Forwarded-For accordingly
+NINJA_NUM_PROXIES = int(os.getenv('NINJA_NUM_PROXIES', '0'))
+
 # AUTH_USER_MODEL = 'users.UserProfile'
@@ -0,0 +1,127 @@
+"""
+Sliding-window rate limiting for Ninja routes.
+
+Limits are declared per operation with Ninja's ``throttle=`` argument, e.g.
+
+    @user_router.post("/login", throttle=[RateLimit("20/m", scope="login", key="ip"),
+                                          RateLimit("5/m", scope="login", key="user", user_field="email")])
+
+Counts use the sliding-window-counter approximation: the previous fixed window is
+weighted by how much of it still overlaps the sliding window. By default counters
+live in process memory; set RATE_LIMIT_BACKEND = "cache" to share them between
+workers through the Django cache (e.g. Redis).
+"""
+import json
+import math
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from ninja.throttling import BaseThrottle
+
+from .auth import Principal
+
+BACKEND = getattr(settings, 'RATE_LIMIT_BACKEND', 'memory')
+SWEEP_THRESHOLD = 10_000
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate: str) -> tuple[int, int]:
+    count, period = rate.split("/")
+    return int(count), PERIODS[period[0].lower()]
+
+
+class MemoryWindowStore:
+    """Per-process counters: key -> [window index, previous window count, current window count]."""
+
+    def __init__(self):
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, period: int, now: float) -> tuple[bool, float]:
+        index, offset = divmod(now, period)
+        index = int(index)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or window[0] < index - 1:
+                window = [index, 0, 0]
+                self._windows[key] = window
+            elif window[0] == index - 1:
+                window[0], window[1], window[2] = index, window[2], 0
+            estimate = window[1] * (1 - offset / period) + window[2]
+            if estimate >= limit:
+                return False, period - offset
+            window[2] += 1
+            if len(self._windows) > SWEEP_THRESHOLD:
+                self._sweep(index)
+        return True, 0.0
+
+    def _sweep(self, index: int):
+        stale = [key for key, window in self._windows.items() if window[0] < index - 1]
+        for key in stale:
+            del self._windows[key]
+
+
+class CacheWindowStore:
+    """Counters in the Django cache, shared by every worker using the same cache."""
+
+    def hit(self, key: str, limit: int, period: int, now: float) -> tuple[bool, float]:
+        index, offset = divmod(now, period)
+        previous_key, current_key = f"rl:{key}:{int(index) - 1}", f"rl:{key}:{int(index)}"
+        counts = cache.get_many([previous_key, current_key])
+        estimate = counts.get(previous_key, 0) * (1 - offset / period) + counts.get(current_key, 0)
+        if estimate >= limit:
+            return False, period - offset
+        if not cache.add(current_key, 1, period * 2):
+            cache.incr(current_key)
+        return True, 0.0
+
+
+store = CacheWindowStore() if BACKEND == "cache" else MemoryWindowStore()
+
+
+class RateLimit(BaseThrottle):
+    """
+    key="ip" counts per client address; key="user" counts per authenticated
+    principal, or per the value of ``user_field`` in the JSON body (e.g. the email
+    a login is attempted for). Requests without a user identity fall back to the IP.
+    """
+
+    def __init__(self, rate: str, scope: str, key: str = "ip", user_field: Optional[str] = None):
+        self.limit, self.period = parse_rate(rate)
+        self.scope = scope
+        self.key = key
+        self.user_field = user_field
+        # One object serves every thread; Ninja calls wait() right after a refusal
+        # on the same thread, without the request, so the wait is kept per thread
+        self._local = threading.local()
+
+    def _user_ident(self, request) -> Optional[str]:
+        # Set by the delivery agent middleware, or by Ninja auth such as ModeratorAuth
+        principal = getattr(request, "delivery_agent", None) or getattr(request, "auth", None)
+        if isinstance(principal, Principal):
+            return f"{principal.kind}:{principal.subject_id}"
+        if self.user_field and request.body:
+            try:
+                value = json.loads(request.body).get(self.user_field)
+            except (ValueError, AttributeError):
+                return None
+            return str(value).strip().lower() if value is not None else None
+        return None
+
+    def allow_request(self, request) -> bool:
+        ident = self._user_ident(request) if self.key == "user" else None
+        kind = "user" if ident else "ip"
+        ident = ident or self.get_ident(request)
+        allowed, wait = store.hit(f"{self.scope}:{kind}:{ident}", self.limit, self.period, time.time())
+        self._local.wait = wait
+        return allowed
+
+    def wait(self) -> Optional[float]:
+        return getattr(self._local, "wait", None)
+
+
+def retry_after_seconds(wait: Optional[float]) -> Optional[str]:
+    return str(max(1, math.ceil(wait))) if wait else None
@@ -17,6 +17,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from ninja import NinjaAPI
+from ninja.errors import Throttled
+from backend.throttling import retry_after_seconds
 from products.api import prodcut_router
 from users.api import user_router
 from users.moderator_api import moderator_router
@@ -29,6 +31,16 @@ api.add_router("users", user_router)
 api.add_router("moderator", moderator_router)
 api.add_router("delivery-agent", delivery_agent_router)
 api.add_router("/reports", report_router, tags=["Reports"])
+
+
+@api.exception_handler(Throttled)
+def throttled(request, exc):
+    response = api.create_response(request, {"detail": str(exc)}, status=429)
+    retry_after = retry_after_seconds(exc.wait)
+    if retry_after:
+        response["Retry-After"] = retry_after
+    return response
+
 from django.urls import path, include
 
 
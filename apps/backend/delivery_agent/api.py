@@ -1,20 +1,30 @@
-from ninja import Router
+from ninja import Query, Router
 from ninja.errors import HttpError
 from loguru import logger
 from django.views.decorators.csrf import csrf_exempt
 from .models import DeliveryRequest
-from .schemas import DeliveryRequestOut, DeliveryRequestIn, DeliveryAgentSignup, DeliveryAgentOut, DeliveryAgentLogin, AuthResponse, RefreshTokenRequest, DeliveryDetailsOut, DeliveryAgentStats
+from .schemas import DeliveryStatusEventOut, DeliveryRequestOut, DeliveryRequestIn, DeliveryAgentSignup, DeliveryAgentOut, DeliveryAgentLogin, AuthResponse, RefreshTokenRequest, DeliveryDetailsOut, DeliveryAgentStats, RouteOut, QuoteIn, QuoteOut, AvailableAgentsOut, AgentReviewOut, DeliveryRequestBatchIn, TelemetryIn, TelemetryAckOut
+from .pricing import quote_options
+from .telemetry import record_pings
 from .database import (
+    NEXT_CURSOR_HEADER,
+    get_agent_reviews,
+    get_delivery_timeline,
+    get_available_agents,
     get_accepted_requests_for_agent,
     create_delivery_request,
+    create_delivery_requests,
     get_previous_deliveries_for_agent,
     create_delivery_agent,
     login_delivery_agent,
     refresh_access_token
 )
 from django.middleware.csrf import get_token
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from pydantic import BaseModel
+from datetime import date, datetime
+from typing import Optional
+from backend.throttling import RateLimit
 
 class UpdateStatusRequest(BaseModel):
     status: str
@@ -30,14 +40,18 @@ def get_csrf_token(request):
     return {"csrf_token": get_token(request)}
 
 @delivery_agent_router.get("/previous-deliveries/{agent_id}", response=list[DeliveryRequestOut], tags=["DeliveryAgent"])
-def get_previous_deliveries_api(request, agent_id: int):
+def get_previous_deliveries_api(request, response: HttpResponse, agent_id: int,
+                                cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=200),
+                                date_from: Optional[date] = Query(None, alias="from"),
+                                date_to: Optional[date] = Query(None, alias="to")):
     """
-    API endpoint to fetch previous deliveries for a specific delivery agent.
+    API endpoint to fetch previous deliveries for a specific delivery agent, newest first.
+    With a limit, the X-Next-Cursor header holds the cursor of the next page.
     """
     try:
-        deliveries = get_previous_deliveries_for_agent(agent_id)
-        if not deliveries:
-            return []
+        deliveries, next_cursor = get_previous_deliveries_for_agent(agent_id, cursor, limit, date_from, date_to)
+        if next_cursor:
+            response[NEXT_CURSOR_HEADER] = next_cursor
         return deliveries
     except HttpError:
         raise
@@ -46,17 +60,52 @@ def get_previous_deliveries_api(request, agent_id: int):
         raise HttpError(500, f"An error occurred while fetching previous deliveries: {str(e)}")
     
 @delivery_agent_router.get("/pending-requests/{agent_id}", response=list[DeliveryRequestOut], tags=["DeliveryAgent"])
-def get_pending_requests_api(request, agent_id: int):
+def get_pending_requests_api(request, agent_id: int, limit: int = Query(50, ge=1, le=200)):
     """
-    API endpoint to fetch pending delivery requests for a specific delivery agent.
+    API endpoint to fetch the pending delivery requests a delivery agent can take,
+    matched on their categories and availability and ranked best first.
     """
     try:
         from .database import get_pending_requests_for_agent
-        return get_pending_requests_for_agent(agent_id)
+        return get_pending_requests_for_agent(agent_id, limit)
+    except Http404 as e:
+        raise HttpError(404, str(e))
     except Exception as e:
         logger.error(f"Error fetching pending requests for agent ID {agent_id}: {e}")
         raise HttpError(500, f"An error occurred: {str(e)}")
 
+@delivery_agent_router.get("/available", response=AvailableAgentsOut, tags=["DeliveryAgent"])
+def get_available_agents_api(request, at: datetime, until: Optional[datetime] = None):
+    """
+    API endpoint listing the approved agents whose weekly availability covers the
+    time at, or the whole stretch from at to until.
+    """
+    try:
+        return get_available_agents(at, until)
+    except HttpError:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching agents available at {at}: {e}")
+        raise HttpError(500, f"An error occurred while fetching available agents: {str(e)}")
+
+@delivery_agent_router.get("/route/{agent_id}", response=RouteOut, tags=["DeliveryAgent"])
+def get_route_api(request, agent_id: int,
+                  latitude: float = Query(None, ge=-90, le=90), longitude: float = Query(None, ge=-180, le=180)):
+    """
+    API endpoint to plan the order in which an agent visits the pickups and dropoffs
+    of their accepted deliveries, optionally starting from the agent's position.
+    """
+    try:
+        from .database import get_route_for_agent
+        return get_route_for_agent(agent_id, latitude, longitude)
+    except Http404 as e:
+        raise HttpError(404, str(e))
+    except HttpError:
+        raise
+    except Exception as e:
+        logger.error(f"Error planning route for agent ID {agent_id}: {e}")
+        raise HttpError(500, f"An error occurred while planning the route: {str(e)}")
+
 @delivery_agent_router.post("/accept-request/{request_id}/{agent_id}", tags=["DeliveryAgent"])
 def accept_request_api(request, request_id: int, agent_id: int):
     """
@@ -65,6 +114,8 @@ def accept_request_api(request, request_id: int, agent_id: int):
     from .database import accept_delivery_request
     try:
         return accept_delivery_request(request_id, agent_id)
+    except Http404 as e:
+        raise HttpError(404, str(e))
     except HttpError:
         raise
     except Exception as e:
@@ -72,14 +123,18 @@ def accept_request_api(request, request_id: int, agent_id: int):
         raise HttpError(500, f"Failed to accept request: {str(e)}")
 
 @delivery_agent_router.get("/accepted-deliveries/{agent_id}", response=list[DeliveryRequestOut], tags=["DeliveryAgent"])
-def get_accepted_deliveries_api(request, agent_id: int):
+def get_accepted_deliveries_api(request, response: HttpResponse, agent_id: int,
+                                cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=200),
+                                date_from: Optional[date] = Query(None, alias="from"),
+                                date_to: Optional[date] = Query(None, alias="to")):
     """
-    API endpoint to fetch accepted deliveries for a specific delivery agent.
+    API endpoint to fetch accepted deliveries for a specific delivery agent, newest first.
+    With a limit, the X-Next-Cursor header holds the cursor of the next page.
     """
     try:
-        deliveries = get_accepted_requests_for_agent(agent_id)
-        if not deliveries:
-            return []
+        deliveries, next_cursor = get_accepted_requests_for_agent(agent_id, cursor, limit, date_from, date_to)
+        if next_cursor:
+            response[NEXT_CURSOR_HEADER] = next_cursor
         return deliveries
     except HttpError:
         raise
@@ -94,12 +149,61 @@ def create_delivery_request_api(request, delivery_request: DeliveryRequestIn):
     """
     try:
         return create_delivery_request(delivery_request)
+    except Http404 as e:
+        raise HttpError(404, str(e))
     except HttpError:
         raise
     except Exception as e:
         logger.error(f"Error creating delivery request: {e}")
         raise HttpError(500, f"Failed to create delivery request: {str(e)}")
+
+@delivery_agent_router.post("/create-delivery-requests", response=list[DeliveryRequestOut], tags=["DeliveryAgent"])
+def create_delivery_requests_api(request, batch: DeliveryRequestBatchIn):
+    """
+    API endpoint to create the delivery requests of a multi-item checkout in one call,
+    all or none; results are in the order of the entries.
+    """
+    try:
+        return create_delivery_requests(batch.requests)
+    except Http404 as e:
+        raise HttpError(404, str(e))
+    except HttpError:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating {len(batch.requests)} delivery requests: {e}")
+        raise HttpError(500, f"Failed to create delivery requests: {str(e)}")
     
+@delivery_agent_router.post("/quote", response=QuoteOut, tags=["DeliveryAgent"],
+                            throttle=[RateLimit("60/m", scope="delivery-quote")])
+def quote_delivery_options_api(request, quote: QuoteIn):
+    """
+    Price up to 1,000 delivery options (product, route, mode, time) in one call, e.g.
+    every delivery mode for every product on a checkout page.
+    """
+    try:
+        return {"options": quote_options(quote.options)}
+    except Http404 as e:
+        raise HttpError(404, str(e))
+    except HttpError:
+        raise
+    except Exception as e:
+        logger.error(f"Error quoting {len(quote.options)} delivery options: {e}")
+        raise HttpError(500, f"Failed to quote delivery options: {str(e)}")
+
+@delivery_agent_router.post("/telemetry", response=TelemetryAckOut, tags=["DeliveryAgent"])
+def post_telemetry_api(request, batch: TelemetryIn):
+    """
+    API endpoint for an agent to upload buffered location pings in one call, e.g.
+    after being offline. Live apps should prefer the ws/delivery/telemetry/ socket.
+    """
+    try:
+        return {"accepted": record_pings(request.delivery_agent.subject_id, batch.pings)}
+    except HttpError:
+        raise
+    except Exception as e:
+        logger.error(f"Error recording {len(batch.pings)} telemetry pings: {e}")
+        raise HttpError(500, f"Failed to record telemetry: {str(e)}")
+
 @delivery_agent_router.post("/update-status/{request_id}", tags=["DeliveryAgent"])
 def update_delivery_status_api(request, request_id: int, status_data: UpdateStatusRequest):
     """
@@ -144,7 +248,9 @@ def signup_delivery_agent(request, agent_data: DeliveryAgentSignup):
         logger.error(f"Error in signup API: {e}")
         raise HttpError(500, f"Failed to create delivery agent account: {str(e)}")
 
-@delivery_agent_router.post("/login", response=AuthResponse, tags=["DeliveryAgent"])
+@delivery_agent_router.post("/login", response=AuthResponse, tags=["DeliveryAgent"],
+                            throttle=[RateLimit("30/m", scope="agent-login"),
+                                      RateLimit("5/m", scope="agent-login", key="user", user_field="email")])
 def login_agent(request, login_data: DeliveryAgentLogin):
     """
     API endpoint for delivery agent login.
@@ -170,6 +276,19 @@ def refresh_token(request, refresh_data: RefreshTokenRequest):
         logger.error(f"Error in refresh token API: {e}")
         raise HttpError(500, f"Failed to refresh token: {str(e)}")
     
+@delivery_agent_router.get("/timeline/{request_id}", response=list[DeliveryStatusEventOut], tags=["DeliveryAgent"])
+def get_delivery_timeline_api(request, request_id: int):
+    """
+    API endpoint for an agent to fetch the status history of one of their deliveries, oldest first.
+    """
+    try:
+        return get_delivery_timeline(request_id, agent_id=request.delivery_agent.subject_id)
+    except Http404 as e:
+        raise HttpError(404, str(e))
+    except Exception as e:
+        logger.error(f"Error fetching timeline for request ID {request_id}: {e}")
+        raise HttpError(500, f"An error occurred while fetching the delivery timeline: {str(e)}")
+
 @delivery_agent_router.get("/accepted-delivery-details/{request_id}", response=DeliveryDetailsOut)
 def get_delivery_details(request, request_id: int):
     try:
@@ -193,6 +312,26 @@ def get_delivery_details(request, request_id: int):
         raise HttpError(500, "Failed to fetch delivery details.")
 
 
+@delivery_agent_router.get("/reviews/{agent_id}", response=list[AgentReviewOut], tags=["DeliveryAgent"])
+def get_agent_reviews_api(request, response: HttpResponse, agent_id: int,
+                          cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=100)):
+    """
+    API endpoint to fetch a page of an agent's reviews, newest first.
+    The X-Next-Cursor header holds the cursor of the next page.
+    """
+    try:
+        reviews, next_cursor = get_agent_reviews(agent_id, cursor, limit)
+        if next_cursor:
+            response[NEXT_CURSOR_HEADER] = next_cursor
+        return reviews
+    except Http404 as e:
+        raise HttpError(404, str(e))
+    except HttpError:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching reviews for agent ID {agent_id}: {e}")
+        raise HttpError(500, f"An error occurred while fetching reviews: {str(e)}")
+
 @delivery_agent_router.get("/stats/{agent_id}", response=DeliveryAgentStats)
 def get_agent_stats(request, agent_id: int):
     """
@@ -200,51 +339,23 @@ def get_agent_stats(request, agent_id: int):
     """
     logger.info(f"Fetching delivery agent statistics for agent ID: {agent_id}")
     try:
-        from .models import DeliveryAgent
-        
-        # Check if agent exists
-        try:
-            agent = DeliveryAgent.objects.get(agent_id=agent_id)
-        except DeliveryAgent.DoesNotExist:
+        from .stats import get_agent_stats as load_agent_stats
+
+        stats = load_agent_stats(agent_id)
+        if stats is None:
             raise HttpError(404, f"Delivery agent with ID {agent_id} not found")
-        
-        # Get pending requests count (requests with no agent assigned and status pending)
-        pending_requests = DeliveryRequest.objects.filter(
-            agent__isnull=True,
-            status="pending"
-        ).count()
-        
-        # Get accepted deliveries count (requests accepted by this agent but not completed)
-        accepted_deliveries = DeliveryRequest.objects.filter(
-            agent=agent,
-            status="accepted"
-        ).count()
-        
-        # Get completed deliveries count
-        completed_deliveries = DeliveryRequest.objects.filter(
-            agent=agent,
-            status="completed"
-        ).count()
-        
-        # Calculate total earnings (sum of delivery fees for completed deliveries)
-        from django.db.models import Sum
-        total_earnings = DeliveryRequest.objects.filter(
-            agent=agent,
-            status="completed"
-        ).aggregate(total=Sum('delivery_fee'))['total'] or 0
-        
         stats = DeliveryAgentStats(
-            pending_requests=pending_requests,
-            accepted_deliveries=accepted_deliveries,
-            completed_deliveries=completed_deliveries,
-            total_earnings=float(total_earnings)
+            pending_requests=stats["pending_requests"],
+            accepted_deliveries=stats["accepted_deliveries"],
+            completed_deliveries=stats["completed_deliveries"],
+            total_earnings=float(stats["total_earnings"]),
         )
-        
+
         logger.success(f"Fetched agent stats for agent {agent_id}: {stats}")
         return stats
-        
+
     except HttpError:
         raise
     except Exception as e:
         logger.error(f"Error fetching agent stats for agent {agent_id}: {e}")
-        raise HttpError(500, f"An error occurred while fetching stats: {str(e)}")
\ No newline at end of file
+        raise HttpError(500, f"An error occurred while fetching stats: {str(e)}")
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class DeliveryAgentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'delivery_agent'
+
+    def ready(self):
+        from .pricing import get_tariff
+
+        # Parse the tariff once per process instead of on the first quote
+        get_tariff()
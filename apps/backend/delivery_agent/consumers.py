@@ -0,0 +1,141 @@
+import json
+from datetime import time
+
+from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Q
+from loguru import logger
+from ninja.errors import HttpError
+
+from .events import agent_job_groups, order_group
+from .matching import get_agent_profile
+from .models import DeliveryRequest
+from .telemetry import telemetry
+
+UNAUTHORIZED = 4401
+FORBIDDEN = 4403
+
+
+class DeliveryJobsConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes job.opened / job.taken events to an approved delivery agent for the jobs
+    they can take: the agent joins the groups of their categories, and openings
+    outside their availability windows are filtered out before sending.
+    """
+
+    async def connect(self):
+        principal = self.scope.get("delivery_agent")
+        if principal is None:
+            logger.warning("Rejected delivery jobs socket without an approved delivery agent")
+            await self.close(code=UNAUTHORIZED)
+            return
+        self.agent_id = principal.subject_id
+        categories, self.windows = await sync_to_async(get_agent_profile)(self.agent_id)
+        self.job_groups = agent_job_groups(categories)
+        for group in self.job_groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.accept()
+        logger.info(f"Agent {self.agent_id} subscribed to {self.job_groups}")
+
+    async def disconnect(self, close_code):
+        for group in getattr(self, "job_groups", []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    def in_availability(self, event) -> bool:
+        if not self.windows or event["weekday"] is None:
+            return True
+        at = time.fromisoformat(event["delivery_time"])
+        return any(
+            weekday == event["weekday"] and start <= at < end
+            for weekday, start, end in self.windows
+        )
+
+    async def job_opened(self, event):
+        if self.in_availability(event):
+            await self.send_event(event)
+
+    async def job_taken(self, event):
+        await self.send_event(event)
+
+    async def send_event(self, event):
+        await self.send(text_data=json.dumps({"event": event["type"], **{k: v for k, v in event.items() if k != "type"}}))
+
+
+class DeliveryOrderConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes order.status events for one delivery request to its buyer, its seller or
+    the agent delivering it, starting with the current status.
+    """
+
+    async def connect(self):
+        self.request_id = int(self.scope["url_route"]["kwargs"]["request_id"])
+        user = self.scope.get("user")
+        agent = self.scope.get("delivery_agent")
+        user_id = None if user is None or isinstance(user, AnonymousUser) else user.user_id
+        agent_id = agent.subject_id if agent is not None else None
+        if user_id is None and agent_id is None:
+            await self.close(code=UNAUTHORIZED)
+            return
+
+        current = await self.load_order(user_id, agent_id)
+        if current is None:
+            logger.warning(f"Rejected order socket for request {self.request_id}: not a party to it")
+            await self.close(code=FORBIDDEN)
+            return
+        self.group_name = order_group(self.request_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send(text_data=json.dumps({"event": "order.status", "request_id": self.request_id, **current}))
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    @sync_to_async
+    def load_order(self, user_id, agent_id):
+        parties = Q()
+        if user_id is not None:
+            parties |= Q(buyer_id=user_id) | Q(seller_id=user_id)
+        if agent_id is not None:
+            parties |= Q(agent_id=agent_id)
+        return (
+            DeliveryRequest.objects.filter(parties, request_id=self.request_id)
+            .values('status', 'agent_id').first()
+        )
+
+    async def order_status(self, event):
+        await self.send(text_data=json.dumps({"event": event["type"], **{k: v for k, v in event.items() if k != "type"}}))
+
+
+class AgentTelemetryConsumer(AsyncWebsocketConsumer):
+    """
+    Receives location pings from an approved delivery agent. Each text frame is
+    {"pings": [[unix seconds, latitude, longitude], ...]}; nothing is sent back
+    unless a frame is rejected. Pings go to this worker's ring buffers (see
+    telemetry.py) from the event loop; only the periodic flush uses a thread.
+    """
+
+    async def connect(self):
+        principal = self.scope.get("delivery_agent")
+        if principal is None:
+            logger.warning("Rejected telemetry socket without an approved delivery agent")
+            await self.close(code=UNAUTHORIZED)
+            return
+        self.agent_id = principal.subject_id
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        # Write the agent's last position now rather than on someone else's ping
+        if hasattr(self, "agent_id"):
+            await sync_to_async(telemetry.flush)()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            telemetry.ingest(self.agent_id, json.loads(text_data or bytes_data)["pings"])
+        except HttpError as e:
+            await self.send(text_data=json.dumps({"event": "telemetry.rejected", "error": e.message}))
+        except (ValueError, KeyError, TypeError):
+            await self.send(text_data=json.dumps({"event": "telemetry.rejected", "error": "Expected {\"pings\": [...]}"}))
+        if telemetry.flush_due():
+            await sync_to_async(telemetry.flush)()
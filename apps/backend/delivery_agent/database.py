@@ -1,16 +1,33 @@
+from collections import Counter
 from itertools import product
 from django.http import Http404
-from .models import DeliveryAgent, DeliveryRequest
+from .models import AgentAvailability, AgentReview, AgentStats, DeliveryAgent, DeliveryRequest
 from ninja.errors import HttpError
 from loguru import logger  
-from products.database import get_product_by_id
+from products.database import serialize_product
 from products.models import Product
-from .schemas import DeliveryRequestIn, DeliveryAgentOut, DeliveryAgentSignup, DeliveryAgentLogin, AuthResponse, RefreshTokenRequest
-from django.contrib.auth.hashers import make_password, check_password
-from datetime import datetime, timedelta
+from .schemas import DeliveryRequestIn, DeliveryAgentOut, QuoteOptionIn, DeliveryAgentSignup, DeliveryAgentLogin, AuthResponse, RefreshTokenRequest
+from users.passwords import hash_password, verify_password
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime, time, timedelta
+from typing import Optional
 import jwt
 from django.conf import settings
+from backend.auth import AuthError, DELIVERY_AGENT, consume_refresh_token, get_principal, invalidate_principal
+import uuid
 from django.db.models import Q
+from django.db import IntegrityError, transaction
+from users.counters import adjust_buy_count
+from .matching import match_open_requests, sync_agent_open_requests, sync_agent_profile, sync_open_requests
+from .geocoding import geocode_many
+from .stats import adjust_agent_rating, adjust_agent_stats
+from . import events
+from .timeline import build_event, get_timeline, record_transition, record_transitions, status_entered_at
+from django.utils import timezone
+from .routing import distance_km, plan_route
+from .pricing import quote_options
+from .schedule import canonical_category_ids, canonical_schedule
+from .telemetry import latest_position
 
 def get_pending_delivery_agent(agent_id: int):
     """
@@ -18,7 +35,7 @@ def get_pending_delivery_agent(agent_id: int):
     """
     logger.info(f"Fetching pending delivery agent with ID {agent_id}.")
     try:
-        agent = DeliveryAgent.objects.get(agent_id=agent_id, approval_status="pending")
+        agent = DeliveryAgent.objects.select_related('stats').get(agent_id=agent_id, approval_status="pending")
         logger.success(f"Found pending delivery agent with ID {agent_id}.")
         return serialize_delivery_agent(agent)
     except DeliveryAgent.DoesNotExist:
@@ -34,7 +51,10 @@ def get_pending_delivery_agents():
     """
     logger.info("Fetching all pending delivery agents.")
     try:
-        agents = [serialize_delivery_agent(agent) for agent in DeliveryAgent.objects.filter(approval_status="pending")]
+        agents = [
+            serialize_delivery_agent(agent)
+            for agent in DeliveryAgent.objects.select_related('stats').filter(approval_status="pending")
+        ]
         logger.success(f"Fetched {len(agents)} pending delivery agents.")
         return agents
     except DeliveryAgent.DoesNotExist:
@@ -50,9 +70,11 @@ def approve_agent(agent_id: int):
     """
     logger.info(f"Approving delivery agent with ID {agent_id}.")
     try:
-        agent = DeliveryAgent.objects.get(agent_id=agent_id, approval_status="pending")
+        agent = DeliveryAgent.objects.select_related('stats').get(agent_id=agent_id, approval_status="pending")
         agent.approval_status = "approved"
         agent.save()
+        invalidate_principal(DELIVERY_AGENT, agent_id)
+        sync_agent_open_requests(agent_id)
         logger.success(f"Delivery agent {agent_id} approved.")
         return serialize_delivery_agent(agent)
     except DeliveryAgent.DoesNotExist:
@@ -68,7 +90,7 @@ def reject_agent(agent_id: int):
     """
     logger.info(f"Rejecting delivery agent with ID {agent_id}.")
     try:
-        agent = DeliveryAgent.objects.get(agent_id=agent_id)
+        agent = DeliveryAgent.objects.select_related('stats').get(agent_id=agent_id)
         if agent.approval_status == "approved":
             logger.warning(f"Delivery agent {agent_id} is already approved.")
             raise HttpError(400, "Delivery agent is already approved.")
@@ -77,6 +99,8 @@ def reject_agent(agent_id: int):
             raise HttpError(400, "Delivery agent is already rejected.")
         agent.approval_status = "rejected"
         agent.save()
+        invalidate_principal(DELIVERY_AGENT, agent_id)
+        sync_agent_open_requests(agent_id)
         logger.success(f"Delivery agent {agent_id} rejected.")
         return serialize_delivery_agent(agent)
     except DeliveryAgent.DoesNotExist:
@@ -87,37 +111,83 @@ def reject_agent(agent_id: int):
         raise Exception(f"Error rejecting delivery agent: {str(e)}")
     
 
-def get_previous_deliveries_for_agent(agent_id: int):
+# Paginated history endpoints return the next page's cursor in this response header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(at: datetime, row_id: int) -> str:
+    """Opaque keyset cursor for a (timestamp, id) position, e.g. (request_date, request_id)."""
+    return urlsafe_b64encode(f"{at.isoformat()}|{row_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        at, row_id = raw.split("|")
+        return datetime.fromisoformat(at), int(row_id)
+    except ValueError:
+        raise HttpError(400, "Invalid cursor")
+
+def paginate_delivery_requests(deliveries, cursor: Optional[str] = None, limit: Optional[int] = None,
+                               date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """
+    Newest-first page of a DeliveryRequest queryset using keyset pagination on
+    (request_date, request_id), optionally limited to requests made between
+    date_from and date_to (inclusive, local dates). Returns (serialized page,
+    cursor of the next page or None). Without a limit the whole range is returned.
+    """
+    if date_from is not None:
+        deliveries = deliveries.filter(request_date__gte=_start_of_day(date_from))
+    if date_to is not None:
+        deliveries = deliveries.filter(request_date__lt=_start_of_day(date_to + timedelta(days=1)))
+    if cursor is not None:
+        request_date, request_id = decode_cursor(cursor)
+        deliveries = deliveries.filter(
+            Q(request_date__lt=request_date) | Q(request_date=request_date, request_id__lt=request_id)
+        )
+    deliveries = deliveries.order_by('-request_date', '-request_id')
+    rows = list(deliveries[:limit + 1] if limit is not None else deliveries)
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].request_date, rows[-1].request_id)
+    return serialize_delivery_requests(rows), next_cursor
+
+def _start_of_day(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+def get_previous_deliveries_for_agent(agent_id: int, cursor: Optional[str] = None, limit: Optional[int] = None,
+                                      date_from: Optional[date] = None, date_to: Optional[date] = None):
     """
-    Fetch previous deliveries for a specific delivery agent.
+    Fetch a page of an agent's completed deliveries, newest first; see paginate_delivery_requests.
     """
     logger.info(f"Fetching previous deliveries for agent ID {agent_id}.")
     try:
-        deliveries = DeliveryRequest.objects.filter(agent_id=agent_id, status="completed").order_by('-request_date')
-        if not deliveries.exists():
-            logger.warning(f"No previous deliveries found for agent ID {agent_id}.")
-            return []
-        logger.success(f"Found {deliveries.count()} previous deliveries for agent ID {agent_id}.")
-        return [serialize_delivery_request(delivery) for delivery in deliveries]
+        deliveries = DeliveryRequest.objects.filter(agent_id=agent_id, status="completed")
+        serialized, next_cursor = paginate_delivery_requests(deliveries, cursor, limit, date_from, date_to)
+        logger.success(f"Found {len(serialized)} previous deliveries for agent ID {agent_id}.")
+        return serialized, next_cursor
+    except HttpError:
+        raise
     except Exception as e:
         logger.error(f"Error fetching previous deliveries for agent ID {agent_id}: {e}")
         raise Exception(f"Error fetching previous deliveries: {str(e)}")
 
-def get_previous_deliveries_for_user(user_id: int):
+def get_previous_deliveries_for_user(user_id: int, cursor: Optional[str] = None, limit: Optional[int] = None,
+                                     date_from: Optional[date] = None, date_to: Optional[date] = None):
     """
-    Fetch previous deliveries for a specific user.
+    Fetch a page of a user's deliveries, newest first; see paginate_delivery_requests.
     """
     logger.info(f"Fetching previous deliveries for user ID {user_id}.")
     try:
         deliveries = DeliveryRequest.objects.filter(
             buyer_id=user_id,
             status__in=["completed", "pending", "accepted"]
-        ).order_by('-request_date')
-        if not deliveries.exists():
-            logger.warning(f"No previous deliveries found for user ID {user_id}.")
-            return []
-        logger.success(f"Found {deliveries.count()} previous deliveries for user ID {user_id}.")
-        return [serialize_delivery_request(delivery) for delivery in deliveries]
+        )
+        serialized, next_cursor = paginate_delivery_requests(deliveries, cursor, limit, date_from, date_to)
+        logger.success(f"Found {len(serialized)} previous deliveries for user ID {user_id}.")
+        return serialized, next_cursor
+    except HttpError:
+        raise
     except Exception as e:
         logger.error(f"Error fetching previous deliveries for user ID {user_id}: {e}")
         raise Exception(f"Error fetching previous deliveries: {str(e)}")
@@ -139,18 +209,104 @@ def get_delivery_request_by_id(request_id: int):
         logger.error(f"Error fetching delivery request {request_id}: {e}")
         raise Exception(f"Error fetching delivery request: {str(e)}")
     
+def get_delivery_timeline(request_id: int, agent_id: Optional[int] = None):
+    """
+    Fetch the status history of a delivery request, oldest first. With agent_id,
+    requests assigned to another agent are reported as not found.
+    """
+    logger.info(f"Fetching status timeline for delivery request {request_id}.")
+    requests = DeliveryRequest.objects.filter(request_id=request_id)
+    if agent_id is not None:
+        requests = requests.filter(agent_id=agent_id)
+    if not requests.exists():
+        raise Http404(f"Delivery request with ID {request_id} not found.")
+    return get_timeline(request_id)
+
+def add_delivery_review(request_id: int, user_id: int, rating: int, comment: str = ""):
+    """
+    Record the buyer's review of the agent who completed a delivery: one per delivery,
+    also kept as the request's delivery_rating and counted into the agent's rollup.
+    """
+    logger.info(f"Adding review for delivery request {request_id} by user {user_id}.")
+    try:
+        with transaction.atomic():
+            request = DeliveryRequest.objects.select_for_update().get(request_id=request_id)
+            if request.buyer_id != user_id:
+                raise HttpError(403, "Only the buyer can review this delivery.")
+            if request.status != "completed" or request.agent_id is None:
+                raise HttpError(400, "Only completed deliveries can be reviewed.")
+            if AgentReview.objects.filter(request_id=request_id).exists():
+                raise HttpError(409, "This delivery has already been reviewed.")
+            review = AgentReview.objects.create(
+                agent_id=request.agent_id, request_id=request_id, reviewer_id=user_id,
+                rating=rating, comment=comment or "",
+            )
+            request.delivery_rating = rating
+            request.save(update_fields=['delivery_rating'])
+            adjust_agent_rating(request.agent_id, rating)
+        logger.success(f"Review {review.review_id} added for agent {request.agent_id}.")
+        return serialize_agent_review(review)
+    except DeliveryRequest.DoesNotExist:
+        raise Http404(f"Delivery request with ID {request_id} not found.")
+    except HttpError:
+        raise
+    except Exception as e:
+        logger.error(f"Error adding review for delivery request {request_id}: {e}")
+        raise Exception(f"Failed to add review: {str(e)}")
+
+def get_agent_reviews(agent_id: int, cursor: Optional[str] = None, limit: int = 20):
+    """
+    Fetch a page of an agent's reviews, newest first, keyset-paginated on
+    (created_at, review_id). Returns (reviews, cursor of the next page or None).
+    """
+    logger.info(f"Fetching reviews for agent ID {agent_id}.")
+    if not DeliveryAgent.objects.filter(agent_id=agent_id).exists():
+        raise Http404(f"Delivery agent with ID {agent_id} not found.")
+    reviews = AgentReview.objects.filter(agent_id=agent_id)
+    if cursor is not None:
+        created_at, review_id = decode_cursor(cursor)
+        reviews = reviews.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, review_id__lt=review_id))
+    rows = list(reviews.order_by('-created_at', '-review_id')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].review_id)
+    return [serialize_agent_review(review) for review in rows], next_cursor
+
+def serialize_agent_review(review):
+    return {
+        "review_id": review.review_id,
+        "agent_id": review.agent_id,
+        "request_id": review.request_id,
+        "rating": review.rating,
+        "comment": review.comment,
+        "created_at": review.created_at,
+    }
+
+def serialize_delivery_requests(requests):
+    """
+    Serialize delivery requests with their products, fetching all products and
+    their categories in a single IN query. Missing products serialize as None.
+    """
+    requests = list(requests)
+    product_ids = {request.product_id for request in requests if request.product_id}
+    products = {}
+    if product_ids:
+        products = {
+            product.product_id: serialize_product(product)
+            for product in Product.objects.select_related('category').filter(product_id__in=product_ids)
+        }
+    return [_serialize_delivery_request(request, products.get(request.product_id)) for request in requests]
+
+
 def serialize_delivery_request(request):
-    # Get product details using the existing function
-    product = None
-    if request.product_id:
-        try:
-            product = get_product_by_id(request.product_id)
-        except Exception:
-            product = None
+    return serialize_delivery_requests([request])[0]
+
 
+def _serialize_delivery_request(request, product):
     return {
         "request_id": request.request_id,
-        "agent_id": request.agent.agent_id if request.agent else None,
+        "agent_id": request.agent_id,
         "product_id": request.product_id,
         "product": product, 
         "request_date": request.request_date.isoformat() if request.request_date else None,
@@ -167,27 +323,9 @@ def serialize_delivery_request(request):
     }
 
 def serialize_delivery_agent(agent):
-    if isinstance(agent.category_ids, str):
-        category_ids = [x.strip() for x in agent.category_ids.split(",") if x.strip()]
-    else:
-        category_ids = [str(x) for x in agent.category_ids] if agent.category_ids else []
-
-    if isinstance(agent.day_of_week, str):
-        day_of_week = [agent.day_of_week]
-    else:
-        day_of_week = [str(x) for x in agent.day_of_week] if agent.day_of_week else []
-
-    if isinstance(agent.time_slot, int):
-        time_slot = [[agent.time_slot]]
-    elif isinstance(agent.time_slot, str):
-        time_slot = [[int(x)] for x in agent.time_slot.split(",") if x.strip()]
-    elif isinstance(agent.time_slot, list):
-        if all(isinstance(x, int) for x in agent.time_slot):
-            time_slot = [[x] for x in agent.time_slot]
-        else:
-            time_slot = agent.time_slot
-    else:
-        time_slot = []
+    # category_ids, day_of_week and time_slot are stored canonically (see schedule.py), so they go out as they are
+    # Reviews are paged separately (get_agent_reviews); only the rollup's aggregate is included
+    stats = getattr(agent, 'stats', None)
 
     # Convert joined_date to string
     joined_date = (
@@ -202,82 +340,237 @@ def serialize_delivery_agent(agent):
         "agent_id": agent.agent_id,
         "first_name": agent.first_name,
         "last_name": agent.last_name,
-        "category_ids": category_ids,
+        "category_ids": agent.category_ids,
         "email": agent.email,
         "phone_number": agent.phone_number,
         "transport_mode": agent.transport_mode,
-        "reviews": agent.reviews,
+        "review_count": stats.review_count if stats else 0,
+        "average_rating": stats.average_rating if stats else None,
         "deliveries_completed": agent.deliveries_completed,
         "identity_img_url": agent.identity_img_url,
-        "day_of_week": day_of_week,
-        "time_slot": time_slot,
+        "day_of_week": agent.day_of_week,
+        "time_slot": agent.time_slot,
         "joined_date": joined_date,
         "user_type": "delivery_agent",
     }
 
-def get_pending_requests_for_agent(agent_id: int):
+def get_available_agents(at: datetime, until: Optional[datetime] = None):
     """
-    Fetch delivery requests that are pending and either unassigned (agent is null)
-    or assigned to a non-approved agent.
+    Approved agents whose weekly availability covers the local time at (or the whole
+    stretch from at to until, on the same day). One range scan of the interval index.
+    """
+    start = timezone.localtime(at) if timezone.is_aware(at) else at
+    end = start
+    if until is not None:
+        end = timezone.localtime(until) if timezone.is_aware(until) else until
+        if end.date() != start.date() or end < start:
+            raise HttpError(400, "until must be later on the same day as at")
+    logger.info(f"Fetching agents available on weekday {start.weekday()} from {start.time()} to {end.time()}.")
+    windows = AgentAvailability.objects.filter(
+        weekday=start.weekday(), start_time__lte=start.time(), agent__approval_status="approved"
+    )
+    # Windows end exclusively: an agent free 12-16 is not free at 16:00, but is for 14-16
+    windows = windows.filter(end_time__gte=end.time()) if until is not None else windows.filter(end_time__gt=start.time())
+    agent_ids = sorted(windows.values_list('agent_id', flat=True))
+    return {
+        "weekday": start.weekday(),
+        "start": start.time(),
+        "end": end.time(),
+        "agent_ids": agent_ids,
+    }
+
+def get_pending_requests_for_agent(agent_id: int, limit: int = 50):
+    """
+    Fetch the pending delivery requests this agent can take: unassigned (or held by
+    a non-approved agent), in one of the agent's categories and inside their
+    availability, best ranked first.
     """
     logger.info(f"Fetching pending delivery requests for agent ID {agent_id}.")
     try:
         # Ensure requesting agent is approved
-        agent = DeliveryAgent.objects.get(agent_id=agent_id, approval_status="approved")
+        if not get_principal(DELIVERY_AGENT, agent_id).is_approved:
+            raise Http404("Approved delivery agent not found.")
+    except AuthError:
+        raise Http404("Approved delivery agent not found.")
 
-        # Get all pending requests that are either:
-        # - Not assigned to any agent (agent is null)
-        # - Assigned to agents who are not approved
-        requests = DeliveryRequest.objects.filter(
-            status="pending"
-        ).filter(Q(agent=None) | ~Q(agent__approval_status="approved"))
+    return serialize_delivery_requests(match_open_requests(agent_id, limit))
 
-        return [serialize_delivery_request(req) for req in requests]
 
-    except DeliveryAgent.DoesNotExist:
+# Jobs on an agent's route; once out for delivery only the dropoff is left
+ROUTE_STATUSES = ("accepted", "out_for_delivery", "on_the_way")
+PICKED_UP_STATUSES = ("out_for_delivery", "on_the_way")
+
+
+def get_route_for_agent(agent_id: int, latitude: float = None, longitude: float = None):
+    """
+    Plan the agent's route over their open jobs: a pickup and a dropoff stop per
+    job, pickups first, ordered to keep the path short. Consecutive stops at the
+    same place share a visit number. Jobs with a stop that cannot be geocoded are
+    listed under "unlocated" in job order. Without a position given, the route
+    starts from the agent's last telemetry ping, if any.
+    """
+    logger.info(f"Planning route for agent ID {agent_id}.")
+    try:
+        if not get_principal(DELIVERY_AGENT, agent_id).is_approved:
+            raise Http404("Approved delivery agent not found.")
+    except AuthError:
         raise Http404("Approved delivery agent not found.")
 
+    jobs = list(
+        DeliveryRequest.objects.filter(agent_id=agent_id, status__in=ROUTE_STATUSES)
+        .order_by('delivery_date', 'request_date')
+        .only('request_id', 'status', 'pickup_location', 'dropoff_location')
+    )
+    coordinates = geocode_many(
+        [job.pickup_location for job in jobs] + [job.dropoff_location for job in jobs]
+    )
+
+    stops, unlocated, points, predecessors = [], [], [], []
+    for job in jobs:
+        picked_up = job.status in PICKED_UP_STATUSES
+        pickup = None if picked_up else coordinates[job.pickup_location]
+        dropoff = coordinates[job.dropoff_location]
+        if dropoff is None or (pickup is None and not picked_up):
+            # Without both ends the job cannot be placed on the route
+            if not picked_up:
+                unlocated.append(_route_stop(job, "pickup", pickup))
+            unlocated.append(_route_stop(job, "dropoff", dropoff))
+            continue
+        pickup_index = -1
+        if not picked_up:
+            pickup_index = len(stops)
+            stops.append(_route_stop(job, "pickup", pickup))
+            points.append(pickup)
+            predecessors.append(-1)
+        stops.append(_route_stop(job, "dropoff", dropoff))
+        points.append(dropoff)
+        predecessors.append(pickup_index)
+
+    start = (latitude, longitude) if latitude is not None and longitude is not None else None
+    if start is None and points:
+        position = latest_position(agent_id)
+        start = (position["latitude"], position["longitude"]) if position else None
+    order, distance = plan_route(points, predecessors, start)
+
+    route, previous, visit = [], start, 0
+    for index in order:
+        stop = stops[index]
+        here = (stop["latitude"], stop["longitude"])
+        leg = distance_km(previous, here) if previous is not None else 0.0
+        if not route or leg > 0:
+            visit += 1
+        route.append({**stop, "visit": visit, "leg_km": round(leg, 3)})
+        previous = here
+    logger.success(f"Planned route of {len(route)} stops ({distance:.1f} km) for agent {agent_id}.")
+    return {
+        "agent_id": agent_id,
+        "distance_km": round(distance, 3),
+        "stops": route,
+        "unlocated": unlocated,
+    }
+
+
+def get_delivery_location(request_id: int, user_id: Optional[int] = None, agent_id: Optional[int] = None):
+    """
+    Where the agent delivering a request is, from their telemetry, while the
+    request is on the agent's route. Only the request's buyer, seller (user_id) or
+    agent (agent_id) may see it; for anyone else the request is not found.
+    """
+    try:
+        parties = Q()
+        if user_id is not None:
+            parties |= Q(buyer_id=user_id) | Q(seller_id=user_id)
+        if agent_id is not None:
+            parties |= Q(agent_id=agent_id)
+        if not parties:
+            raise Http404(f"Delivery request with ID {request_id} not found.")
+        delivery = DeliveryRequest.objects.filter(parties, request_id=request_id).values('agent_id', 'status').first()
+        if delivery is None:
+            raise Http404(f"Delivery request with ID {request_id} not found.")
+        if delivery['agent_id'] is None or delivery['status'] not in ROUTE_STATUSES:
+            raise HttpError(409, f"Delivery request {request_id} is not being delivered.")
+        position = latest_position(delivery['agent_id'])
+        if position is None:
+            raise Http404(f"No location reported yet for delivery request {request_id}.")
+        return {
+            "request_id": request_id,
+            "agent_id": delivery['agent_id'],
+            **position,
+            "age_seconds": round((timezone.now() - position["recorded_at"]).total_seconds(), 1),
+        }
+    except (Http404, HttpError):
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching location for delivery request {request_id}: {e}")
+        raise Exception(f"Failed to fetch delivery location: {str(e)}")
+
+
+def _route_stop(job, kind: str, point=None):
+    return {
+        "request_id": job.request_id,
+        "kind": kind,
+        "location": job.pickup_location if kind == "pickup" else job.dropoff_location,
+        "latitude": point[0] if point else None,
+        "longitude": point[1] if point else None,
+    }
+
 
 def accept_delivery_request(request_id: int, agent_id: int):
     """
     Assigns the delivery request to an agent and marks it as accepted.
+
+    The claim is a single conditional UPDATE, so when several agents accept the
+    same request at once exactly one of them gets it; the others get a 409.
     """
     logger.info(f"Agent {agent_id} accepting delivery request {request_id}.")
     try:
-        delivery_request = DeliveryRequest.objects.get(request_id=request_id)
-        if delivery_request.status != "pending" or delivery_request.agent_id is not None:
-            raise HttpError(400, "Request is already assigned or not pending.")
-        agent = DeliveryAgent.objects.get(agent_id=agent_id, approval_status="approved")
-        delivery_request.agent = agent
-        delivery_request.status = "accepted"
-        delivery_request.save()
+        if not DeliveryAgent.objects.filter(agent_id=agent_id, approval_status="approved").exists():
+            raise Http404(f"Delivery agent {agent_id} not found.")
+        current = (
+            DeliveryRequest.objects.filter(request_id=request_id)
+            .values('status_changed_at', 'request_date', 'open_entry__category_id').first()
+        )
+        if current is None:
+            raise Http404(f"Delivery request {request_id} not found.")
+        now = timezone.now()
+        with transaction.atomic():
+            claimed = DeliveryRequest.objects.filter(
+                request_id=request_id, status="pending", agent__isnull=True
+            ).update(agent_id=agent_id, status="accepted", status_changed_at=now)
+            if not claimed:
+                logger.warning(f"Agent {agent_id} lost delivery request {request_id}: already taken.")
+                raise HttpError(409, "Request is already assigned or not pending.")
+            record_transition(request_id, "pending", "accepted", agent_id,
+                              entered_at=current['status_changed_at'] or current['request_date'], at=now)
+            adjust_agent_stats(agent_id, "pending", "accepted", None)
+            sync_open_requests([request_id])
+            events.job_taken(request_id, current['open_entry__category_id'])
+            events.order_status(request_id, "accepted", agent_id)
         logger.success(f"Request {request_id} assigned to agent {agent_id}.")
-        return serialize_delivery_request(delivery_request)
-    except DeliveryRequest.DoesNotExist:
-        raise Http404(f"Delivery request {request_id} not found.")
-    except DeliveryAgent.DoesNotExist:
-        raise Http404(f"Delivery agent {agent_id} not found.")
+        return serialize_delivery_request(DeliveryRequest.objects.get(request_id=request_id))
+    except (Http404, HttpError):
+        raise
     except Exception as e:
         logger.error(f"Error accepting delivery request {request_id}: {e}")
         raise Exception(f"Failed to accept delivery request: {str(e)}")
 
-def get_accepted_requests_for_agent(agent_id: int):
+def get_accepted_requests_for_agent(agent_id: int, cursor: Optional[str] = None, limit: Optional[int] = None,
+                                    date_from: Optional[date] = None, date_to: Optional[date] = None):
     """
-    Fetch delivery requests that were accepted or completed by a specific delivery agent.
+    Fetch a page of the delivery requests accepted or completed by an agent, newest first;
+    see paginate_delivery_requests.
     """
     logger.info(f"Fetching accepted or completed deliveries for agent ID {agent_id}.")
     try:
         deliveries = DeliveryRequest.objects.filter(
             agent_id=agent_id,
             status__in=["accepted", "completed"]
-        ).order_by('-request_date')
-        
-        if not deliveries.exists():
-            logger.warning(f"No accepted or completed deliveries found for agent ID {agent_id}.")
-            return []
-        
-        logger.success(f"Found {deliveries.count()} accepted or completed deliveries for agent ID {agent_id}.")
-        return [serialize_delivery_request(delivery) for delivery in deliveries]
+        )
+        serialized, next_cursor = paginate_delivery_requests(deliveries, cursor, limit, date_from, date_to)
+        logger.success(f"Found {len(serialized)} accepted or completed deliveries for agent ID {agent_id}.")
+        return serialized, next_cursor
+    except HttpError:
+        raise
     except Exception as e:
         logger.error(f"Error fetching deliveries for agent ID {agent_id}: {e}")
         raise Exception(f"Error fetching deliveries: {str(e)}")
@@ -305,15 +598,27 @@ def update_delivery_status(request_id: int, status: str):
         status = "completed"  # ✅ Normalize to internal status
 
     try:
-        request = DeliveryRequest.objects.get(request_id=request_id)
-        if request.status == "completed":
-            raise HttpError(400, "Delivery already marked as completed.")
-        request.status = status
-        request.save()
+        with transaction.atomic():
+            request = DeliveryRequest.objects.select_for_update().get(request_id=request_id)
+            if request.status == "completed":
+                raise HttpError(400, "Delivery already marked as completed.")
+            previous_status, entered_at = request.status, status_entered_at(request)
+            request.status = status
+            request.status_changed_at = timezone.now()
+            request.save()
+            record_transition(request_id, previous_status, status, request.agent_id,
+                              entered_at=entered_at, at=request.status_changed_at)
+            adjust_agent_stats(request.agent_id, previous_status, status, request.delivery_fee)
+            if status == "completed":
+                adjust_buy_count(request.buyer_id, 1)
+            sync_open_requests([request_id])
+            events.order_status(request_id, status, request.agent_id)
         logger.success(f"Delivery status updated to {status} for request {request_id}.")
         return serialize_delivery_request(request)
     except DeliveryRequest.DoesNotExist:
         raise Http404(f"Request {request_id} not found.")
+    except HttpError:
+        raise
     except Exception as e:
         logger.error(f"Error updating delivery status: {e}")
         raise Exception(f"Failed to update delivery status: {str(e)}")
@@ -323,27 +628,96 @@ def create_delivery_request(delivery_request: DeliveryRequestIn):
     """
     Create a new delivery request.
     """
-    logger.info("Creating a new delivery request.")
-    product = Product.objects.get(product_id=delivery_request.product_id)
-    seller_id = product.seller_id
+    return create_delivery_requests([delivery_request])[0]
+
+def create_delivery_requests(delivery_requests: list[DeliveryRequestIn]):
+    """
+    Create pending delivery requests for several products at once (e.g. a multi-item
+    checkout), all or none. Products are resolved in one query, each fee is priced
+    server-side, and the rows are inserted with one bulk INSERT.
+    """
+    logger.info(f"Creating {len(delivery_requests)} delivery requests.")
+    product_ids = [delivery_request.product_id for delivery_request in delivery_requests]
+    duplicates = sorted(product_id for product_id, count in Counter(product_ids).items() if count > 1)
+    if duplicates:
+        raise HttpError(400, f"Products listed more than once: {duplicates}")
     try:
-        new_request = DeliveryRequest.objects.create(
-            product_id=delivery_request.product_id,
-            seller_id=seller_id,
-            dropoff_location=delivery_request.dropoff_location,
-            pickup_location=delivery_request.pickup_location,
-            status="pending",
-            delivery_fee=delivery_request.delivery_fee,
-            delivery_mode=delivery_request.delivery_mode,
-            delivery_notes=delivery_request.delivery_notes,
-            buyer_id=delivery_request.buyer_id,
-            delivery_date=delivery_request.delivery_date_time,
+        products = Product.objects.select_related('category').in_bulk(product_ids)
+        missing = sorted(set(product_ids) - products.keys())
+        if missing:
+            raise Http404(f"Products not found: {missing}")
+        taken = sorted(DeliveryRequest.objects.filter(product_id__in=product_ids).values_list('product_id', flat=True))
+        if taken:
+            raise HttpError(409, f"Delivery already requested for products: {taken}")
+
+        # The fee is always priced server-side; a client-supplied one is only compared
+        quotes = quote_options(
+            [
+                QuoteOptionIn(
+                    product_id=delivery_request.product_id, pickup_location=delivery_request.pickup_location,
+                    dropoff_location=delivery_request.dropoff_location,
+                    delivery_mode=delivery_request.delivery_mode or "standard",
+                    delivery_date_time=delivery_request.delivery_date_time,
+                )
+                for delivery_request in delivery_requests
+            ],
+            products={
+                product.product_id: (product.category.category_name if product.category else None, product.location)
+                for product in products.values()
+            },
         )
-        logger.success(f"Delivery request {new_request.request_id} created successfully.")
-        return serialize_delivery_request(new_request)
+        for delivery_request, quote in zip(delivery_requests, quotes):
+            if delivery_request.delivery_fee is not None and abs(delivery_request.delivery_fee - quote["fee"]) >= 0.01:
+                logger.warning(
+                    f"Client fee {delivery_request.delivery_fee} for product {delivery_request.product_id} "
+                    f"differs from the quoted {quote['fee']}; using the quote."
+                )
+
+        now = timezone.now()
+        new_requests = [
+            DeliveryRequest(
+                product_id=delivery_request.product_id,
+                seller_id=products[delivery_request.product_id].seller_id,
+                dropoff_location=delivery_request.dropoff_location,
+                pickup_location=delivery_request.pickup_location,
+                status="pending",
+                status_changed_at=now,
+                delivery_fee=quote["fee"],
+                delivery_mode=delivery_request.delivery_mode,
+                delivery_notes=delivery_request.delivery_notes,
+                buyer_id=delivery_request.buyer_id,
+                delivery_date=delivery_request.delivery_date_time,
+            )
+            for delivery_request, quote in zip(delivery_requests, quotes)
+        ]
+        with transaction.atomic():
+            DeliveryRequest.objects.bulk_create(new_requests)
+            if any(request.request_id is None for request in new_requests):
+                # MySQL does not return the ids of bulk-inserted rows; product_id is unique, so look them up
+                request_ids = dict(
+                    DeliveryRequest.objects.filter(product_id__in=product_ids).values_list('product_id', 'request_id')
+                )
+                for request in new_requests:
+                    request.request_id = request_ids[request.product_id]
+            record_transitions([build_event(request.request_id, None, "pending", at=now) for request in new_requests])
+            by_id = {request.request_id: request for request in new_requests}
+            for entry in sync_open_requests(by_id):
+                events.job_opened(entry, by_id[entry.request_id])
+            for request in new_requests:
+                events.order_status(request.request_id, request.status)
+        logger.success(f"Created delivery requests {sorted(by_id)}.")
+        return [
+            _serialize_delivery_request(request, serialize_product(products[request.product_id]))
+            for request in new_requests
+        ]
+    except (Http404, HttpError):
+        raise
+    except IntegrityError:
+        # Another checkout claimed one of the products between the check and the insert
+        raise HttpError(409, "Delivery already requested for one of the products")
     except Exception as e:
-        logger.error(f"Error creating delivery request: {e}")
-        raise Exception(f"Failed to create delivery request: {str(e)}")
+        logger.error(f"Error creating delivery requests: {e}")
+        raise Exception(f"Failed to create delivery requests: {str(e)}")
 
 def create_delivery_agent(agent_data: DeliveryAgentSignup):
     """
@@ -360,7 +734,8 @@ def create_delivery_agent(agent_data: DeliveryAgentSignup):
             raise HttpError(400, "Phone number already registered")
 
         # Hash the password
-        hashed_password = make_password(agent_data.password)
+        hashed_password = hash_password(agent_data.password)
+        day_of_week, time_slot = canonical_schedule(agent_data.day_of_week, agent_data.time_slot)
 
         # Create new delivery agent
         new_agent = DeliveryAgent.objects.create(
@@ -370,13 +745,15 @@ def create_delivery_agent(agent_data: DeliveryAgentSignup):
             password=hashed_password,
             phone_number=agent_data.phone_number,
             transport_mode=agent_data.transport_mode,
-            category_ids=agent_data.category_ids,
+            category_ids=canonical_category_ids(agent_data.category_ids),
             identity_img_url=agent_data.identity_img_url,
-            day_of_week=agent_data.day_of_week,
-            time_slot=agent_data.time_slot,
+            day_of_week=day_of_week,
+            time_slot=time_slot,
             joined_date=datetime.now().strftime("%Y-%m-%d"),
             approval_status="pending"
         )
+        sync_agent_profile(new_agent)
+        AgentStats.objects.create(agent=new_agent)
         
         logger.success(f"Delivery agent account created successfully with ID {new_agent.agent_id}")
         return serialize_delivery_agent(new_agent)
@@ -397,6 +774,7 @@ def generate_tokens(agent: DeliveryAgent) -> tuple[str, str]:
         'first_name': agent.first_name,
         'last_name': agent.last_name,
         'exp': datetime.utcnow() + timedelta(minutes=30),
+        'jti': uuid.uuid4().hex,
         'type': 'access',
         'user_type':'delivery_agent'
     }
@@ -406,6 +784,7 @@ def generate_tokens(agent: DeliveryAgent) -> tuple[str, str]:
         'agent_id': agent.agent_id,
         'email': agent.email,
         'exp': datetime.utcnow() + timedelta(days=7),
+        'jti': uuid.uuid4().hex,
         'type': 'refresh'
     }
     
@@ -419,27 +798,22 @@ def refresh_access_token(refresh_data: RefreshTokenRequest) -> AuthResponse:
     Generate a new access token using a valid refresh token.
     """
     try:
-        # Verify the refresh token
-        payload = jwt.decode(refresh_data.refresh_token, settings.SECRET_KEY, algorithms=['HS256'])
-        
-        # Check if it's a refresh token
-        if payload.get('type') != 'refresh':
+        # Verify the refresh token and revoke it (rotation)
+        agent, _ = consume_refresh_token(refresh_data.refresh_token)
+        if agent.kind != DELIVERY_AGENT:
             raise HttpError(401, "Invalid token type")
         
-        # Get the agent
-        agent = DeliveryAgent.objects.get(agent_id=payload['agent_id'])
-        
         # Check if agent is approved
-        if agent.approval_status != 'approved':
+        if not agent.is_approved:
             raise HttpError(403, "Account is not approved")
         
         # Generate new tokens
-        access_token, refresh_token = generate_tokens(agent)
+        access_token, refresh_token = generate_tokens(agent.as_delivery_agent())
         
         return AuthResponse(
-            access_token=access_token,
+            token=access_token,
             refresh_token=refresh_token,
-            agent_id=agent.agent_id,
+            user_id=agent.subject_id,
             first_name=agent.first_name,
             last_name=agent.last_name,
             email=agent.email,
@@ -447,12 +821,10 @@ def refresh_access_token(refresh_data: RefreshTokenRequest) -> AuthResponse:
             user_type="delivery_agent"
         )
         
-    except jwt.ExpiredSignatureError:
-        raise HttpError(401, "Refresh token has expired")
-    except jwt.InvalidTokenError:
-        raise HttpError(401, "Invalid refresh token")
-    except DeliveryAgent.DoesNotExist:
-        raise HttpError(401, "Delivery agent not found")
+    except AuthError as e:
+        raise HttpError(e.status, e.message)
+    except HttpError:
+        raise
     except Exception as e:
         logger.error(f"Error refreshing token: {e}")
         raise HttpError(500, f"Failed to refresh token: {str(e)}")
@@ -466,8 +838,12 @@ def login_delivery_agent(login_data: DeliveryAgentLogin) -> AuthResponse:
         # Find the agent by email
         agent = DeliveryAgent.objects.get(email=login_data.email)
 
-        # Verify password
-        if not check_password(login_data.password, agent.password):
+        # Verify password, upgrading the stored hash if the hasher settings changed
+        def rehash(new_password):
+            agent.password = new_password
+            DeliveryAgent.objects.filter(agent_id=agent.agent_id).update(password=new_password)
+
+        if not verify_password(login_data.password, agent.password, setter=rehash):
             raise HttpError(401, "Invalid credentials")
         if agent.approval_status != 'approved':
             raise HttpError(401, "Delivery Agent Account is not approved yet. Please wait for approval.")
@@ -488,6 +864,8 @@ def login_delivery_agent(login_data: DeliveryAgentLogin) -> AuthResponse:
 
     except DeliveryAgent.DoesNotExist:
         raise HttpError(401, "Invalid credentials")
+    except HttpError:
+        raise
     except Exception as e:
         logger.error(f"Login error for email {login_data.email}: {e}")
         raise HttpError(500, f"Login failed: {str(e)}")
@@ -0,0 +1,89 @@
+"""
+Delivery events pushed over Channels, so agents and buyers do not have to poll.
+
+Open jobs are announced to eligible-job groups: one per category, plus
+"delivery_jobs_uncategorized" for requests without a category and
+"delivery_jobs_all" for agents who take every category (see consumers.py for
+which groups an agent joins). Status changes go to "delivery_order_<id>", which
+the buyer and seller of the order may join.
+
+Payloads are small deltas: the client patches its list or order view instead of
+re-fetching it. Events are sent once the surrounding transaction commits, and a
+failed send is logged, never raised.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
+from loguru import logger
+
+ALL_JOBS_GROUP = "delivery_jobs_all"
+UNCATEGORIZED_JOBS_GROUP = "delivery_jobs_uncategorized"
+
+
+def category_group(category_id: int) -> str:
+    return f"delivery_jobs_{category_id}"
+
+
+def order_group(request_id: int) -> str:
+    return f"delivery_order_{request_id}"
+
+
+def agent_job_groups(categories) -> list[str]:
+    """The eligible-job groups of an agent with the given category ids."""
+    if not categories:
+        return [ALL_JOBS_GROUP]
+    return [category_group(category_id) for category_id in categories] + [UNCATEGORIZED_JOBS_GROUP]
+
+
+def job_groups(category_id) -> list[str]:
+    """The groups that hear about a job in the given category."""
+    if category_id is None:
+        return [UNCATEGORIZED_JOBS_GROUP, ALL_JOBS_GROUP]
+    return [category_group(category_id), ALL_JOBS_GROUP]
+
+
+def _send(groups, message: dict):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        for group in groups:
+            async_to_sync(channel_layer.group_send)(group, message)
+    except Exception as e:
+        logger.error(f"Failed to broadcast {message['type']} to {groups}: {e}")
+
+
+def _send_on_commit(groups, message: dict):
+    transaction.on_commit(lambda: _send(groups, message))
+
+
+def job_opened(entry, request):
+    """A request became claimable. entry is its OpenDeliveryRequest row."""
+    _send_on_commit(job_groups(entry.category_id), {
+        "type": "job.opened",
+        "request_id": request.request_id,
+        "product_id": request.product_id,
+        "category_id": entry.category_id,
+        "weekday": entry.weekday,
+        "delivery_time": entry.delivery_time.isoformat() if entry.delivery_time else None,
+        "delivery_date": entry.due_at.isoformat() if entry.due_at else None,
+        "delivery_fee": str(entry.delivery_fee),
+        "pickup_location": request.pickup_location,
+        "dropoff_location": request.dropoff_location,
+    })
+
+
+def job_taken(request_id: int, category_id):
+    """A request is no longer claimable; agents drop it from their list."""
+    _send_on_commit(job_groups(category_id), {"type": "job.taken", "request_id": request_id})
+
+
+def order_status(request_id: int, status: str, agent_id=None):
+    _send_on_commit([order_group(request_id)], {
+        "type": "order.status",
+        "request_id": request_id,
+        "status": status,
+        "agent_id": agent_id,
+        "at": timezone.now().isoformat(),
+    })
@@ -0,0 +1,72 @@
+"""
+Offline geocoding of the free-text pickup/dropoff locations against the local
+geocodes table, which holds coordinates for postal codes, place names and, if
+loaded, full addresses. No external service is called.
+
+A location resolves to the first hit among: the whole normalized address, any
+five-digit postal code in it, then its comma-separated parts (right to left, as
+the town usually comes last) with house numbers and postal codes stripped.
+"""
+import csv
+import re
+from pathlib import Path
+
+from loguru import logger
+
+from .models import Geocode
+
+DEFAULT_GEOCODES = Path(__file__).resolve().parent / "data" / "geocodes.csv"
+
+_POSTAL_CODE = re.compile(r"\b\d{5}\b")
+_DIGITS = re.compile(r"\d+\w*")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(value: str) -> str:
+    return _SPACES.sub(" ", str(value).casefold()).strip(" ,")
+
+
+def candidate_keys(location: str) -> list[str]:
+    """Lookup keys for a location, most specific first."""
+    text = normalize(location)
+    if not text:
+        return []
+    keys = [text]
+    keys += _POSTAL_CODE.findall(text)
+    for part in reversed(text.split(",")):
+        place = normalize(_DIGITS.sub(" ", part))
+        if place:
+            keys.append(place)
+    return list(dict.fromkeys(keys))
+
+
+def geocode_many(locations) -> dict:
+    """Map each location to (latitude, longitude), or None if it is not in the table. One query."""
+    keys = {location: candidate_keys(location) for location in set(locations)}
+    known = {
+        key: (latitude, longitude)
+        for key, latitude, longitude in Geocode.objects.filter(
+            key__in={key for candidates in keys.values() for key in candidates}
+        ).values_list('key', 'latitude', 'longitude')
+    }
+    return {
+        location: next((known[key] for key in candidates if key in known), None)
+        for location, candidates in keys.items()
+    }
+
+
+def load_geocodes(path=DEFAULT_GEOCODES) -> int:
+    """Insert or update geocodes from a key,latitude,longitude CSV file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = {
+            normalize(row["key"]): Geocode(
+                key=normalize(row["key"]), latitude=float(row["latitude"]), longitude=float(row["longitude"])
+            )
+            for row in csv.DictReader(f)
+        }
+    Geocode.objects.bulk_create(
+        rows.values(), batch_size=1000,
+        update_conflicts=True, unique_fields=['key'], update_fields=['latitude', 'longitude'],
+    )
+    logger.success(f"Loaded {len(rows)} geocodes from {path}.")
+    return len(rows)
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.middleware.csrf import _get_new_csrf_string
+from django.test import RequestFactory
+
+from backend.auth import DELIVERY_AGENT, get_principal
+from delivery_agent.database import generate_tokens
+from delivery_agent.middleware import DeliveryAgentAuthMiddleware
+from delivery_agent.models import DeliveryAgent
+
+
+def ok_view(request):
+    return HttpResponse()
+
+
+async def async_ok_view(request):
+    return HttpResponse()
+
+
+class Command(BaseCommand):
+    help = "Time DeliveryAgentAuthMiddleware per request, sync and async, for non-agent and agent requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20_000)
+
+    def handle(self, *args, **options):
+        agent = DeliveryAgent.objects.filter(approval_status="approved").first()
+        if agent is None:
+            self.stderr.write("Needs an approved delivery agent in the database.")
+            return
+        get_principal(DELIVERY_AGENT, agent.agent_id)  # warm the principal cache
+        token, _ = generate_tokens(agent)
+        csrf_secret = _get_new_csrf_string()
+
+        factory = RequestFactory()
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+        post = factory.post(f"/api/delivery-agent/update-status/1", data={}, HTTP_X_CSRFTOKEN=csrf_secret, **auth)
+        post.COOKIES[settings.CSRF_COOKIE_NAME] = csrf_secret
+        scenarios = {
+            "non-agent GET": factory.get("/api/products/"),
+            "agent GET": factory.get(f"/api/delivery-agent/stats/{agent.agent_id}", **auth),
+            "agent POST (CSRF)": post,
+        }
+
+        sync_middleware = DeliveryAgentAuthMiddleware(ok_view)
+        async_middleware = DeliveryAgentAuthMiddleware(async_ok_view)
+        iterations = options["iterations"]
+        for label, request in scenarios.items():
+            status = sync_middleware(request).status_code
+            started = time.perf_counter()
+            for _ in range(iterations):
+                sync_middleware(request)
+            sync_us = (time.perf_counter() - started) / iterations * 1e6
+
+            async def run():
+                begin = time.perf_counter()
+                for _ in range(iterations):
+                    await async_middleware(request)
+                return (time.perf_counter() - begin) / iterations * 1e6
+            async_us = asyncio.run(run())
+            self.stdout.write(f"{label:<20} status={status} sync={sync_us:7.2f}us async={async_us:7.2f}us")
@@ -0,0 +1,74 @@
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from delivery_agent.database import get_available_agents
+from delivery_agent.matching import rebuild_matching_index
+from delivery_agent.models import DeliveryAgent
+from delivery_agent.schedule import WEEKDAYS, canonical_schedule
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic agents with random weekly availability inside a transaction, time "
+        "get_available_agents for random instants and two-hour stretches, then roll everything back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--agents", type=int, default=10_000)
+        parser.add_argument("--samples", type=int, default=200)
+        parser.add_argument("--budget-ms", type=float, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options)
+                self.measure(options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def seed(self, options):
+        rng = random.Random(42)
+        started = time.perf_counter()
+        agents = []
+        for i in range(options["agents"]):
+            days = rng.sample(WEEKDAYS, rng.randint(1, 5))
+            day_of_week, time_slot = canonical_schedule(
+                days, [rng.sample([1, 2, 3], rng.randint(1, 3)) for _ in days]
+            )
+            agents.append(DeliveryAgent(
+                first_name="Bench", last_name=str(i), email=f"bench-agent-{i}@example.com", password="x",
+                phone_number=f"bench{i}", transport_mode="Bike", joined_date=date(2024, 1, 1),
+                approval_status="approved", day_of_week=day_of_week, time_slot=time_slot,
+            ))
+        DeliveryAgent.objects.bulk_create(agents, batch_size=1000)
+        rebuild_matching_index()
+        self.stdout.write(f"Seeded {options['agents']} agents in {time.perf_counter() - started:.1f}s.")
+
+    def measure(self, options):
+        rng = random.Random(7)
+        monday = timezone.make_aware(datetime(2025, 6, 2))
+        for label, span in (("instant", None), ("2h stretch", timedelta(hours=2))):
+            latencies, sizes = [], []
+            for _ in range(options["samples"]):
+                at = monday + timedelta(days=rng.randrange(7), hours=rng.randint(7, 19), minutes=rng.choice([0, 30]))
+                started = time.perf_counter()
+                sizes.append(len(get_available_agents(at, at + span if span else None)["agent_ids"]))
+                latencies.append((time.perf_counter() - started) * 1000)
+            latencies.sort()
+            p99 = latencies[int(len(latencies) * 0.99)]
+            verdict = "OK" if p99 < options["budget_ms"] else "OVER BUDGET"
+            self.stdout.write(
+                f"{label}: mean={statistics.mean(latencies):.1f}ms p50={latencies[len(latencies) // 2]:.1f}ms "
+                f"p99={p99:.1f}ms (avg {statistics.mean(sizes):.0f} agents) [{verdict}, budget {options['budget_ms']:.0f}ms]"
+            )
@@ -0,0 +1,98 @@
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.functions import Mod
+
+from delivery_agent.matching import (
+    get_agent_profile, invalidate_agent_profile, match_open_requests, rebuild_matching_index,
+)
+from delivery_agent.models import DeliveryAgent, DeliveryRequest, OpenDeliveryRequest
+from delivery_agent.schedule import WEEKDAYS
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic agents and open delivery requests inside a transaction, time "
+        "match_open_requests for random agents, then roll everything back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--agents", type=int, default=10_000)
+        parser.add_argument("--requests", type=int, default=100_000)
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument("--samples", type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options)
+                sample = self.measure(options)
+                raise Rollback()
+        except Rollback:
+            pass
+        # Agent ids may be reused after the rollback, so drop the profiles cached during the run
+        for agent_id in sample:
+            invalidate_agent_profile(agent_id)
+
+    def seed(self, options):
+        rng = random.Random(42)
+        started = time.perf_counter()
+        agents = [
+            DeliveryAgent(
+                first_name="Bench", last_name=str(i), email=f"bench-agent-{i}@example.com", password="x",
+                phone_number=f"bench{i}", transport_mode="Bike", joined_date=date(2024, 1, 1),
+                approval_status="approved",
+                category_ids=[str(c) for c in rng.sample(range(1, options["categories"] + 1), 3)],
+                day_of_week=rng.sample(WEEKDAYS, 3),
+                time_slot=[[rng.randint(1, 3)] for _ in range(3)],
+            )
+            for i in range(options["agents"])
+        ]
+        DeliveryAgent.objects.bulk_create(agents, batch_size=1000)
+
+        base = datetime.now(dt_timezone.utc)
+        first_product_id = 10_000_000  # product_id is unique; stay clear of real products
+        DeliveryRequest.objects.bulk_create([
+            DeliveryRequest(
+                product_id=first_product_id + i, seller_id=1, buyer_id=1,
+                dropoff_location="A", pickup_location="B", status="pending",
+                delivery_fee=rng.randint(3, 30),
+                delivery_date=base + timedelta(hours=rng.randint(0, 24 * 14)) if rng.random() < 0.8 else None,
+            )
+            for i in range(options["requests"])
+        ], batch_size=1000)
+        # The synthetic requests have no products, so spread them over the categories directly
+        rebuild_matching_index()
+        OpenDeliveryRequest.objects.filter(request__product_id__gte=first_product_id).update(
+            category_id=Mod('request_id', options["categories"]) + 1
+        )
+        self.stdout.write(f"Seeded {options['agents']} agents and {options['requests']} requests "
+                          f"in {time.perf_counter() - started:.1f}s.")
+
+    def measure(self, options):
+        agent_ids = list(DeliveryAgent.objects.filter(email__startswith="bench-agent-").values_list("agent_id", flat=True))
+        sample = random.Random(7).sample(agent_ids, min(options["samples"], len(agent_ids)))
+        for label, warm in (("cold profile", False), ("cached profile", True)):
+            latencies, sizes = [], []
+            for agent_id in sample:
+                invalidate_agent_profile(agent_id)
+                if warm:
+                    get_agent_profile(agent_id)
+                started = time.perf_counter()
+                sizes.append(len(match_open_requests(agent_id)))
+                latencies.append((time.perf_counter() - started) * 1000)
+            latencies.sort()
+            self.stdout.write(
+                f"{label}: mean={statistics.mean(latencies):.1f}ms "
+                f"p50={latencies[len(latencies) // 2]:.1f}ms p99={latencies[int(len(latencies) * 0.99)]:.1f}ms "
+                f"(avg {statistics.mean(sizes):.0f} results)"
+            )
+        return sample
@@ -0,0 +1,51 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from delivery_agent.models import Geocode
+from delivery_agent.pricing import get_tariff, quote_options
+from delivery_agent.schemas import QuoteOptionIn
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Time quoting a batch of --options delivery options over existing products and geocodes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--options", type=int, default=1000)
+        parser.add_argument("--samples", type=int, default=50)
+        parser.add_argument("--budget-ms", type=float, default=100)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        product_ids = list(Product.objects.values_list('product_id', flat=True)[:200]) or [None]
+        places = list(Geocode.objects.values_list('key', flat=True)[:500]) or ["36037"]
+        modes = list(get_tariff().modes)
+        start = timezone.make_aware(datetime(2025, 6, 2))
+        batch = [
+            QuoteOptionIn(
+                product_id=rng.choice(product_ids),
+                pickup_location=rng.choice(places),
+                dropoff_location=rng.choice(places),
+                delivery_mode=rng.choice(modes),
+                delivery_date_time=start + timedelta(minutes=rng.randrange(7 * 24 * 60)),
+            )
+            for _ in range(options["options"])
+        ]
+
+        latencies = []
+        for _ in range(options["samples"]):
+            started = time.perf_counter()
+            quote_options(batch)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99)] if len(latencies) > 1 else latencies[0]
+        verdict = "OK" if p99 < options["budget_ms"] else "OVER BUDGET"
+        self.stdout.write(
+            f"{len(batch)} options: mean={statistics.mean(latencies):.1f}ms p50={latencies[len(latencies) // 2]:.1f}ms "
+            f"p99={p99:.1f}ms max={latencies[-1]:.1f}ms [{verdict}, budget {options['budget_ms']:.0f}ms]"
+        )
@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.auth import DELIVERY_AGENT, invalidate_principal
+from delivery_agent.database import get_route_for_agent
+from delivery_agent.models import DeliveryAgent, DeliveryRequest, Geocode
+from delivery_agent.routing import plan_route
+
+# Roughly the Fulda district
+AREA = ((50.40, 9.50), (50.75, 9.95))
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time route planning for an agent with --stops pickup/dropoff stops, for the solver alone "
+        "and end to end through get_route_for_agent on seeded data that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stops", type=int, default=50)
+        parser.add_argument("--samples", type=int, default=50)
+        parser.add_argument("--budget-ms", type=float, default=200)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        jobs = max(1, options["stops"] // 2)
+
+        def random_point():
+            return rng.uniform(AREA[0][0], AREA[1][0]), rng.uniform(AREA[0][1], AREA[1][1])
+
+        latencies = []
+        for _ in range(options["samples"]):
+            points = [random_point() for _ in range(2 * jobs)]
+            predecessors = [-1 if k % 2 == 0 else k - 1 for k in range(2 * jobs)]
+            started = time.perf_counter()
+            plan_route(points, predecessors)
+            latencies.append((time.perf_counter() - started) * 1000)
+        self.report("solver", latencies, options["budget_ms"])
+
+        agent_id = None
+        try:
+            with transaction.atomic():
+                agent = DeliveryAgent.objects.create(
+                    first_name="Bench", last_name="Route", email="bench-route@example.com", password="x",
+                    phone_number="bench-route", transport_mode="Bike", joined_date=date(2024, 1, 1),
+                    approval_status="approved",
+                )
+                agent_id = agent.agent_id
+                Geocode.objects.bulk_create([
+                    Geocode(key=f"bench street {i}, fulda", latitude=latitude, longitude=longitude)
+                    for i, (latitude, longitude) in enumerate(random_point() for _ in range(2 * jobs))
+                ])
+                DeliveryRequest.objects.bulk_create([
+                    DeliveryRequest(
+                        agent=agent, product_id=20_000_000 + i, seller_id=1, buyer_id=1, status="accepted",
+                        pickup_location=f"Bench Street {2 * i}, Fulda",
+                        dropoff_location=f"Bench Street {2 * i + 1}, Fulda",
+                    )
+                    for i in range(jobs)
+                ])
+                latencies = []
+                for _ in range(options["samples"]):
+                    started = time.perf_counter()
+                    route = get_route_for_agent(agent_id)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                self.report(f"endpoint ({len(route['stops'])} stops)", latencies, options["budget_ms"])
+                raise Rollback()
+        except Rollback:
+            pass
+        if agent_id is not None:
+            invalidate_principal(DELIVERY_AGENT, agent_id)
+
+    def report(self, label, latencies, budget_ms):
+        latencies = sorted(latencies)
+        p99 = latencies[int(len(latencies) * 0.99)] if len(latencies) > 1 else latencies[0]
+        verdict = "OK" if p99 < budget_ms else "OVER BUDGET"
+        self.stdout.write(
+            f"{label}: mean={statistics.mean(latencies):.1f}ms p50={latencies[len(latencies) // 2]:.1f}ms "
+            f"p99={p99:.1f}ms max={latencies[-1]:.1f}ms [{verdict}, budget {budget_ms:.0f}ms]"
+        )
@@ -0,0 +1,81 @@
+import json
+import random
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from delivery_agent.models import AgentTrackPoint, DeliveryAgent
+from delivery_agent.telemetry import TelemetryStore
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay --seconds of pings from --agents synthetic agents, one JSON frame per ping as the "
+        "telemetry socket receives them, through a telemetry store with real flushes, report the "
+        "ingest rate, then roll everything back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--agents", type=int, default=5000)
+        parser.add_argument("--seconds", type=int, default=60)
+        parser.add_argument("--ping-every", type=float, default=2.0)
+        parser.add_argument("--budget", type=float, default=5000, help="pings per second")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def run(self, options):
+        DeliveryAgent.objects.bulk_create([
+            DeliveryAgent(
+                first_name="Bench", last_name=str(i), email=f"bench-telemetry-{i}@example.com", password="x",
+                phone_number=f"telemetry{i}", transport_mode="Bike", joined_date=date(2024, 1, 1),
+                approval_status="approved",
+            )
+            for i in range(options["agents"])
+        ], batch_size=1000)
+        # bulk_create does not return primary keys on MySQL
+        agent_ids = list(
+            DeliveryAgent.objects.filter(email__startswith="bench-telemetry-").values_list('agent_id', flat=True)
+        )
+
+        rng = random.Random(42)
+        start = time.time() - options["seconds"]
+        frames = []
+        for tick in range(int(options["seconds"] / options["ping_every"])):
+            for agent_id in agent_ids:
+                frames.append((agent_id, json.dumps({"pings": [[
+                    start + tick * options["ping_every"] + rng.random(),
+                    52.5 + rng.uniform(-0.1, 0.1), 13.4 + rng.uniform(-0.1, 0.1),
+                ]]})))
+
+        store = TelemetryStore(flush_seconds=1)
+        flushes, flush_seconds = 0, 0.0
+        started = time.perf_counter()
+        for agent_id, frame in frames:
+            store.ingest(agent_id, json.loads(frame)["pings"])
+            if store.flush_due():
+                flush_started = time.perf_counter()
+                store.flush()
+                flushes += 1
+                flush_seconds += time.perf_counter() - flush_started
+        store.flush()
+        elapsed = time.perf_counter() - started
+
+        rate = len(frames) / elapsed
+        verdict = "OK" if rate >= options["budget"] else "UNDER BUDGET"
+        self.stdout.write(
+            f"{len(frames)} pings from {len(agent_ids)} agents in {elapsed:.2f}s: {rate:,.0f} pings/s, "
+            f"{flushes} flushes taking {flush_seconds:.2f}s, {AgentTrackPoint.objects.count()} track points "
+            f"[{verdict}, budget {options['budget']:,.0f}/s]"
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from delivery_agent.geocoding import DEFAULT_GEOCODES, load_geocodes
+
+
+class Command(BaseCommand):
+    help = "Insert or update route-planning geocodes from a key,latitude,longitude CSV file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default=str(DEFAULT_GEOCODES))
+
+    def handle(self, *args, **options):
+        count = load_geocodes(options["path"])
+        self.stdout.write(f"Loaded {count} geocodes.")
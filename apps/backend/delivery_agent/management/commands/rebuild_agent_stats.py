@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from delivery_agent.stats import rebuild_agent_stats
+
+
+class Command(BaseCommand):
+    help = "Build or repair the per-agent dashboard stats rollup from delivery requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_agent_stats(chunk_size=options["chunk_size"])
+        self.stdout.write(f"Rebuilt stats for {rebuilt} agents.")
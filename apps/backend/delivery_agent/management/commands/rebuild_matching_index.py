@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from delivery_agent.matching import rebuild_matching_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild agent category/availability rows and the open delivery request index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuild_matching_index(chunk_size=options["chunk_size"])
+        self.stdout.write("Matching index rebuilt.")
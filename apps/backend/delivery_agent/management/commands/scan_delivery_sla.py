@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from delivery_agent.sla import SCAN_BATCH_SIZE, run_sla_scan
+
+
+class Command(BaseCommand):
+    help = (
+        "Record SLA breaches for delivery requests that stayed too long in a status. "
+        "Runs once (for cron) or, with --loop, every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=SCAN_BATCH_SIZE)
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--interval", type=float, default=300)
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            run = run_sla_scan(batch_size=options["batch_size"])
+            self.stdout.write(
+                f"{run.warnings} warnings, {run.escalations} escalations "
+                f"in {run.duration_ms:.1f}ms" + ("" if run.caught_up else f" (behind by {run.max_lag_seconds or 0:.0f}s)")
+            )
+            if not options["loop"]:
+                return
+            # A scanner that is behind goes again right away
+            if run.caught_up:
+                time.sleep(options["interval"])
@@ -0,0 +1,153 @@
+"""
+Matching of delivery agents to open delivery requests.
+
+An agent's match profile is their normalized categories and weekly availability
+windows (agent_categories / agent_availability), cached per agent. Requests that
+can still be claimed are mirrored into open_delivery_requests together with the
+product category and the requested weekday/time, so an agent's feasible jobs are
+one indexed query: category in the agent's categories and delivery time inside
+one of their windows. Requests without a category or date match every agent, as
+do agents who declared no categories or no availability.
+
+Call sync_open_requests() after any change to a request's status or agent, and
+sync_agent_profile() after changing an agent's categories or availability.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+from loguru import logger
+
+from .models import AgentAvailability, AgentCategory, DeliveryAgent, DeliveryRequest, OpenDeliveryRequest
+from .schedule import availability_windows, parse_category_ids
+
+PROFILE_CACHE_SECONDS = getattr(settings, 'MATCHING_PROFILE_CACHE_SECONDS', 300)
+SYNC_CHUNK_SIZE = 1000
+
+
+def _profile_key(agent_id: int) -> str:
+    return f"matching:agent:{agent_id}"
+
+
+def sync_agent_profile(agent: DeliveryAgent):
+    """Rewrite the agent's category and availability rows from its JSON fields."""
+    categories = parse_category_ids(agent.category_ids)
+    windows = availability_windows(agent.day_of_week, agent.time_slot)
+    with transaction.atomic():
+        AgentCategory.objects.filter(agent=agent).delete()
+        AgentAvailability.objects.filter(agent=agent).delete()
+        AgentCategory.objects.bulk_create(
+            [AgentCategory(agent=agent, category_id=category_id) for category_id in categories]
+        )
+        AgentAvailability.objects.bulk_create(
+            [AgentAvailability(agent=agent, weekday=weekday, start_time=start, end_time=end)
+             for weekday, start, end in windows]
+        )
+    invalidate_agent_profile(agent.agent_id)
+
+
+def invalidate_agent_profile(agent_id: int):
+    cache.delete(_profile_key(agent_id))
+
+
+def get_agent_profile(agent_id: int) -> tuple[list, list]:
+    """(category ids, [(weekday, start, end), ...]) for an agent, cached."""
+    key = _profile_key(agent_id)
+    profile = cache.get(key)
+    if profile is None:
+        profile = (
+            list(AgentCategory.objects.filter(agent_id=agent_id).values_list('category_id', flat=True)),
+            list(AgentAvailability.objects.filter(agent_id=agent_id).values_list('weekday', 'start_time', 'end_time')),
+        )
+        cache.set(key, profile, PROFILE_CACHE_SECONDS)
+    return profile
+
+
+def sync_open_requests(request_ids) -> list:
+    """Add, refresh or drop the matching-index rows of the given requests; returns the open ones."""
+    from products.models import Product
+
+    request_ids = list(request_ids)
+    if not request_ids:
+        return []
+    requests = list(
+        DeliveryRequest.objects.filter(request_id__in=request_ids)
+        .values('request_id', 'product_id', 'status', 'agent_id', 'agent__approval_status',
+                'delivery_date', 'delivery_fee', 'request_date')
+    )
+    open_requests = [
+        row for row in requests
+        if row['status'] == "pending" and (row['agent_id'] is None or row['agent__approval_status'] != "approved")
+    ]
+    categories = dict(
+        Product.objects.filter(product_id__in=[row['product_id'] for row in open_requests])
+        .values_list('product_id', 'category_id')
+    )
+    entries = []
+    for row in open_requests:
+        due_at = row['delivery_date']
+        local = timezone.localtime(due_at) if due_at and timezone.is_aware(due_at) else due_at
+        entries.append(OpenDeliveryRequest(
+            request_id=row['request_id'],
+            category_id=categories.get(row['product_id']),
+            weekday=local.weekday() if local else None,
+            delivery_time=local.time().replace(microsecond=0) if local else None,
+            due_at=due_at,
+            delivery_fee=row['delivery_fee'] or 0,
+            request_date=row['request_date'],
+        ))
+    with transaction.atomic():
+        OpenDeliveryRequest.objects.filter(request_id__in=request_ids).delete()
+        OpenDeliveryRequest.objects.bulk_create(entries)
+    return entries
+
+
+def sync_agent_open_requests(agent_id: int):
+    """Re-evaluate the pending requests held by an agent, e.g. after their approval status changed."""
+    sync_open_requests(
+        DeliveryRequest.objects.filter(agent_id=agent_id, status="pending").values_list('request_id', flat=True)
+    )
+
+
+def match_open_requests(agent_id: int, limit: int = 50) -> list:
+    """
+    The agent's feasible open requests, ranked by due date (undated last), then
+    delivery fee (highest first), then age (oldest first).
+    """
+    categories, windows = get_agent_profile(agent_id)
+    entries = OpenDeliveryRequest.objects.select_related('request')
+    if categories:
+        entries = entries.filter(Q(category_id__in=categories) | Q(category_id__isnull=True))
+    if windows:
+        in_window = Q(weekday__isnull=True)
+        for weekday, start, end in windows:
+            in_window |= Q(weekday=weekday, delivery_time__gte=start, delivery_time__lt=end)
+        entries = entries.filter(in_window)
+    entries = entries.order_by(F('due_at').asc(nulls_last=True), '-delivery_fee', 'request_date')[:limit]
+    return [entry.request for entry in entries]
+
+
+def rebuild_matching_index(chunk_size: int = SYNC_CHUNK_SIZE):
+    """Rebuild agent profiles and the open-request index from the source tables."""
+    categories, windows, agent_ids = [], [], []
+    for agent in DeliveryAgent.objects.only('agent_id', 'category_ids', 'day_of_week', 'time_slot').iterator():
+        agent_ids.append(agent.agent_id)
+        categories += [AgentCategory(agent_id=agent.agent_id, category_id=category_id)
+                       for category_id in parse_category_ids(agent.category_ids)]
+        windows += [AgentAvailability(agent_id=agent.agent_id, weekday=weekday, start_time=start, end_time=end)
+                    for weekday, start, end in availability_windows(agent.day_of_week, agent.time_slot)]
+    with transaction.atomic():
+        AgentCategory.objects.all().delete()
+        AgentAvailability.objects.all().delete()
+        AgentCategory.objects.bulk_create(categories, batch_size=chunk_size)
+        AgentAvailability.objects.bulk_create(windows, batch_size=chunk_size)
+    cache.delete_many([_profile_key(agent_id) for agent_id in agent_ids])
+
+    max_id = DeliveryRequest.objects.aggregate(last=Max('request_id'))['last'] or 0
+    for start in range(0, max_id, chunk_size):
+        sync_open_requests(range(start + 1, start + chunk_size + 1))
+    logger.success(
+        f"Rebuilt matching index: {len(agent_ids)} agent profiles, "
+        f"{OpenDeliveryRequest.objects.count()} open requests."
+    )
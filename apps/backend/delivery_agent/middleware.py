@@ -1,118 +1,132 @@
-from django.http import JsonResponse
-from ninja.errors import HttpError
-from loguru import logger
-from functools import lru_cache
-import jwt
+import re
 import time
-from django.conf import settings
-from .models import DeliveryAgent
-from typing import Callable
-from django.http import HttpRequest, HttpResponse
-from django.middleware.csrf import get_token, CsrfViewMiddleware
-from django.utils.deprecation import MiddlewareMixin
-# from functools import lru_cache
+from typing import Callable, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from loguru import logger
+
+from backend.auth import AuthError, DELIVERY_AGENT, authenticate_token, authenticate_token_cached
+
+# Requests outside the delivery agent API pass straight through after one regex match
+AGENT_PATH = re.compile(r"/api/delivery-agent")
+# Paths that need neither a CSRF token nor authentication
+PUBLIC_PATHS = frozenset({
+    '/api/delivery-agent/signup',
+    '/api/delivery-agent/login',
+    '/api/delivery-agent/csrf-token',
+    # Fee quotes are read-only and asked for by buyers at checkout
+    '/api/delivery-agent/quote',
+})
+# HTTP methods that don't require authentication (CORS preflight)
+PUBLIC_METHODS = frozenset({'OPTIONS'})
+# GET requests are exempt from CSRF protection as they should be safe operations
+CSRF_SAFE_METHODS = frozenset({'GET', 'OPTIONS'})
+
+
+def _no_response(request):
+    return None
+
 
 class DeliveryAgentAuthMiddleware:
+    """
+    Authenticates requests to the delivery agent API: CSRF check for unsafe
+    methods, then a bearer token naming an approved agent, whose cached principal
+    is attached as request.delivery_agent.
+
+    Works in both sync and async stacks. Under ASGI the token is checked in the
+    event loop from in-process state, and only a lookup that needs I/O (a
+    principal cache miss, a shared cache such as Redis, or a revocation filter
+    refresh) is handed to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response: Callable):
         self.get_response = get_response
-        # List of paths that don't require CSRF token (GET requests are exempt by default)
-        self.csrf_exempt_paths = [
-            '/api/delivery-agent/signup',
-            '/api/delivery-agent/login',
-            '/api/delivery-agent/csrf-token'
-        ]
-        # HTTP methods that don't require authentication
-        self.public_methods = ['OPTIONS']
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # One validator for all requests; it only uses the request it is given
+        self.csrf = CsrfViewMiddleware(_no_response)
 
     def __call__(self, request: HttpRequest) -> HttpResponse:
-        # Check if the request is for delivery agent API
-        if not request.path.startswith('/api/delivery-agent'):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.requires_auth(request):
             return self.get_response(request)
 
-        # Allow access to public methods (like OPTIONS for CORS)
-        if request.method in self.public_methods:
-            return self.get_response(request)
+        rejection, token = self.precheck(request)
+        if rejection is None:
+            try:
+                rejection = self.admit(request, *authenticate_token(token))
+            except Exception as e:
+                rejection = self.auth_failed(e)
+        return rejection or self.get_response(request)
 
-        # Allow access to public paths
-        if request.path in self.csrf_exempt_paths:
-            return self.get_response(request)
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        if not self.requires_auth(request):
+            return await self.get_response(request)
+
+        rejection, token = self.precheck(request)
+        if rejection is None:
+            try:
+                authenticated = authenticate_token_cached(token)
+                if authenticated is None:
+                    authenticated = await sync_to_async(authenticate_token)(token)
+                rejection = self.admit(request, *authenticated)
+            except Exception as e:
+                rejection = self.auth_failed(e)
+        return rejection or await self.get_response(request)
+
+    @staticmethod
+    def requires_auth(request: HttpRequest) -> bool:
+        return (
+            AGENT_PATH.match(request.path) is not None
+            and request.method not in PUBLIC_METHODS
+            and request.path not in PUBLIC_PATHS
+        )
 
-        # CSRF validation for non-GET requests (except exempt paths and OPTIONS)
-        # GET requests are typically exempt from CSRF protection as they should be safe operations
-        if request.method not in ['GET', 'OPTIONS'] and request.path not in self.csrf_exempt_paths:
+    def precheck(self, request: HttpRequest) -> tuple[Optional[HttpResponse], Optional[str]]:
+        """CSRF validation and bearer token extraction; returns (rejection, token)."""
+        if request.method not in CSRF_SAFE_METHODS:
             csrf_token = request.headers.get('X-CSRFToken') or request.POST.get('csrfmiddlewaretoken')
             if not csrf_token:
-                return JsonResponse(
-                    {'error': 'CSRF token missing'}, 
-                    status=403
-                )
-            
+                return JsonResponse({'error': 'CSRF token missing'}, status=403), None
             # Validate CSRF token using Django's built-in validation
-            csrf_middleware = CsrfViewMiddleware(self.get_response)
             try:
-                csrf_middleware.process_request(request)
-                csrf_middleware.process_view(request, None, (), {})
-            except Exception as e:
-                return JsonResponse(
-                    {'error': 'CSRF token validation failed'}, 
-                    status=403
-                )
+                self.csrf.process_request(request)
+                failed = self.csrf.process_view(request, None, (), {})
+            except Exception:
+                failed = True
+            if failed:
+                return JsonResponse({'error': 'CSRF token validation failed'}, status=403), None
 
-        # Get the authorization header
         auth_header = request.headers.get('Authorization')
         if not auth_header or not auth_header.startswith('Bearer '):
-            return JsonResponse(
-                {'error': 'Authentication required'}, 
-                status=401
-            )
-
-        try:
-            # Extract and verify the token
-            token = auth_header.split(' ')[1]
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-            
-            # Proactive token expiry check
-            if payload.get('exp') and payload['exp'] - time.time() < 300:  # 5 minutes
-                logger.warning(f"Token for agent {payload['agent_id']} expires soon")
-            
-            # Get the agent from database (with caching)
-            agent = self.get_agent_by_id(payload['agent_id'])
-            
-            # Check if agent is approved
-            if agent.approval_status != 'approved':
-                return JsonResponse(
-                    {'error': 'Account is not approved'}, 
-                    status=403
-                )
-            
-            # Add agent to request for use in views
-            request.delivery_agent = agent
-            
-            return self.get_response(request)
+            return JsonResponse({'error': 'Authentication required'}, status=401), None
+        return None, auth_header.split(' ')[1]
+
+    @staticmethod
+    def admit(request: HttpRequest, principal, payload: dict) -> Optional[HttpResponse]:
+        if principal.kind != DELIVERY_AGENT:
+            return JsonResponse({'error': 'Invalid token'}, status=401)
+
+        # Proactive token expiry check
+        if payload.get('exp') and payload['exp'] - time.time() < 300:  # 5 minutes
+            logger.warning(f"Token for agent {principal.subject_id} expires soon")
+
+        if not principal.is_approved:
+            return JsonResponse({'error': 'Account is not approved'}, status=403)
+
+        # Add agent snapshot to request for use in views
+        request.delivery_agent = principal
+        return None
 
-        except jwt.ExpiredSignatureError:
-            return JsonResponse(
-                {'error': 'Token has expired'}, 
-                status=401
-            )
-        except jwt.InvalidTokenError:
-            return JsonResponse(
-                {'error': 'Invalid token'}, 
-                status=401
-            )
-        except DeliveryAgent.DoesNotExist:
-            return JsonResponse(
-                {'error': 'Delivery agent not found'}, 
-                status=401
-            )
-        except Exception as e:
-            logger.error(f"Authentication error: {str(e)}")
-            return JsonResponse(
-                {'error': 'Authentication failed'}, 
-                status=500
-            )
-
-    # @lru_cache(maxsize=10)
-    def get_agent_by_id(self, agent_id):
-        """Cache frequently accessed delivery agents"""
-        return DeliveryAgent.objects.get(agent_id=agent_id)
\ No newline at end of file
+    @staticmethod
+    def auth_failed(error: Exception) -> HttpResponse:
+        if isinstance(error, AuthError):
+            return JsonResponse({'error': error.message}, status=error.status)
+        logger.error(f"Authentication error: {str(error)}")
+        return JsonResponse({'error': 'Authentication failed'}, status=500)
@@ -0,0 +1,173 @@
+# Generated by Django 5.2 on 2026-10-18 23:56
+
+from datetime import time
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q
+
+# Copied from delivery_agent/schedule.py as it stood when this migration was written,
+# so later changes to the parsers cannot change what the migration does.
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# Mirrors the slots offered by the frontend's DeliveryAgentAvailability form
+TIME_SLOTS = {
+    1: (time(8, 0), time(12, 0)),
+    2: (time(12, 0), time(16, 0)),
+    3: (time(16, 0), time(20, 0)),
+}
+
+
+def parse_category_ids(value) -> list[int]:
+    if value is None or value == "":
+        return []
+    if isinstance(value, (int, str)):
+        value = str(value).split(",")
+    category_ids = []
+    for item in value:
+        try:
+            category_ids.append(int(str(item).strip()))
+        except ValueError:
+            continue
+    return sorted(set(category_ids))
+
+
+def parse_weekday(value):
+    """0 for Monday .. 6 for Sunday; accepts full or abbreviated names. None if unknown."""
+    name = str(value).strip().lower()
+    if len(name) < 3:
+        return None
+    for index, weekday in enumerate(WEEKDAYS):
+        if weekday.lower().startswith(name):
+            return index
+    return None
+
+
+def _parse_slots(value) -> list[int]:
+    if value is None or value == "":
+        return []
+    if isinstance(value, (int, str)):
+        value = str(value).split(",")
+    slots = []
+    for item in value:
+        try:
+            slot = int(str(item).strip())
+        except ValueError:
+            continue
+        if slot in TIME_SLOTS:
+            slots.append(slot)
+    return slots
+
+
+def parse_availability(day_of_week, time_slot) -> list[tuple[int, time, time]]:
+    """Return sorted, de-duplicated (weekday, start, end) windows."""
+    days = [day_of_week] if isinstance(day_of_week, str) else list(day_of_week or [])
+    weekdays = [parse_weekday(day) for day in days]
+
+    if isinstance(time_slot, list) and time_slot and all(isinstance(item, list) for item in time_slot):
+        per_day = [_parse_slots(slots) for slots in time_slot]
+        if len(per_day) == 1:
+            per_day = per_day * len(weekdays)
+    else:
+        per_day = [_parse_slots(time_slot)] * len(weekdays)
+
+    windows = set()
+    for weekday, slots in zip(weekdays, per_day):
+        if weekday is None:
+            continue
+        for slot in slots:
+            start, end = TIME_SLOTS[slot]
+            windows.add((weekday, start, end))
+    return sorted(windows)
+
+
+def build_matching_index(apps, schema_editor):
+    """Normalize existing agents' categories/availability and index the open requests."""
+    DeliveryAgent = apps.get_model('delivery_agent', 'DeliveryAgent')
+    DeliveryRequest = apps.get_model('delivery_agent', 'DeliveryRequest')
+    AgentCategory = apps.get_model('delivery_agent', 'AgentCategory')
+    AgentAvailability = apps.get_model('delivery_agent', 'AgentAvailability')
+    OpenDeliveryRequest = apps.get_model('delivery_agent', 'OpenDeliveryRequest')
+    Product = apps.get_model('products', 'Product')
+
+    categories, windows = [], []
+    for agent in DeliveryAgent.objects.all().iterator():
+        categories += [AgentCategory(agent_id=agent.agent_id, category_id=category_id)
+                       for category_id in parse_category_ids(agent.category_ids)]
+        windows += [AgentAvailability(agent_id=agent.agent_id, weekday=weekday, start_time=start, end_time=end)
+                    for weekday, start, end in parse_availability(agent.day_of_week, agent.time_slot)]
+    AgentCategory.objects.bulk_create(categories, batch_size=1000)
+    AgentAvailability.objects.bulk_create(windows, batch_size=1000)
+
+    product_categories = dict(Product.objects.values_list('product_id', 'category_id'))
+    open_requests = DeliveryRequest.objects.filter(status="pending").filter(
+        Q(agent__isnull=True) | ~Q(agent__approval_status="approved")
+    )
+    OpenDeliveryRequest.objects.bulk_create([
+        OpenDeliveryRequest(
+            request_id=request.request_id,
+            category_id=product_categories.get(request.product_id),
+            weekday=request.delivery_date.weekday() if request.delivery_date else None,
+            delivery_time=request.delivery_date.time().replace(microsecond=0) if request.delivery_date else None,
+            due_at=request.delivery_date,
+            delivery_fee=request.delivery_fee or 0,
+            request_date=request.request_date,
+        )
+        for request in open_requests.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_agent', '0001_initial'),
+        ('products', '0009_productstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpenDeliveryRequest',
+            fields=[
+                ('request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='open_entry', serialize=False, to='delivery_agent.deliveryrequest')),
+                ('category_id', models.IntegerField(null=True)),
+                ('weekday', models.PositiveSmallIntegerField(null=True)),
+                ('delivery_time', models.TimeField(null=True)),
+                ('due_at', models.DateTimeField(null=True)),
+                ('delivery_fee', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('request_date', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'open_delivery_requests',
+                'indexes': [models.Index(fields=['category_id', 'weekday', 'delivery_time'], name='open_request_match_idx'), models.Index(fields=['due_at', '-delivery_fee', 'request_date'], name='open_request_rank_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AgentAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField()),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='delivery_agent.deliveryagent')),
+            ],
+            options={
+                'db_table': 'delivery_agent_availability',
+                'indexes': [models.Index(fields=['weekday', 'start_time', 'end_time'], name='availability_window_idx')],
+                'constraints': [models.UniqueConstraint(fields=('agent', 'weekday', 'start_time'), name='unique_agent_window')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AgentCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category_id', models.IntegerField()),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_links', to='delivery_agent.deliveryagent')),
+            ],
+            options={
+                'db_table': 'delivery_agent_categories',
+                'indexes': [models.Index(fields=['category_id', 'agent'], name='agent_category_idx')],
+                'constraints': [models.UniqueConstraint(fields=('agent', 'category_id'), name='unique_agent_category')],
+            },
+        ),
+        migrations.RunPython(build_matching_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 00:01
+
+import csv
+
+from django.db import migrations, models
+
+from delivery_agent.geocoding import DEFAULT_GEOCODES, normalize
+
+
+def load_default_geocodes(apps, schema_editor):
+    """Seed the table with the postal codes and towns of the Fulda area."""
+    Geocode = apps.get_model('delivery_agent', 'Geocode')
+    with open(DEFAULT_GEOCODES, newline="", encoding="utf-8") as f:
+        Geocode.objects.bulk_create([
+            Geocode(key=normalize(row["key"]), latitude=float(row["latitude"]), longitude=float(row["longitude"]))
+            for row in csv.DictReader(f)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_agent', '0002_matching_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Geocode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+            ],
+            options={
+                'db_table': 'geocodes',
+            },
+        ),
+        migrations.RunPython(load_default_geocodes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-19 00:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def build_agent_stats(apps, schema_editor):
+    """Fill the rollup for existing agents."""
+    DeliveryAgent = apps.get_model('delivery_agent', 'DeliveryAgent')
+    DeliveryRequest = apps.get_model('delivery_agent', 'DeliveryRequest')
+    AgentStats = apps.get_model('delivery_agent', 'AgentStats')
+
+    totals = {
+        row['agent_id']: row for row in
+        DeliveryRequest.objects.filter(agent__isnull=False).order_by().values('agent_id').annotate(
+            accepted=Count('request_id', filter=Q(status="accepted")),
+            completed=Count('request_id', filter=Q(status="completed")),
+            earnings=Sum('delivery_fee', filter=Q(status="completed")),
+        )
+    }
+    AgentStats.objects.bulk_create([
+        AgentStats(
+            agent_id=agent_id,
+            accepted_deliveries=totals.get(agent_id, {}).get('accepted', 0),
+            completed_deliveries=totals.get(agent_id, {}).get('completed', 0),
+            total_earnings=totals.get(agent_id, {}).get('earnings') or 0,
+        )
+        for agent_id in DeliveryAgent.objects.values_list('agent_id', flat=True)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_agent', '0003_geocodes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentStats',
+            fields=[
+                ('agent', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='delivery_agent.deliveryagent')),
+                ('accepted_deliveries', models.IntegerField(default=0)),
+                ('completed_deliveries', models.IntegerField(default=0)),
+                ('total_earnings', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+            ],
+            options={
+                'db_table': 'delivery_agent_stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrequest',
+            index=models.Index(fields=['status', 'agent'], name='delivery_status_agent_idx'),
+        ),
+        migrations.RunPython(build_agent_stats, migrations.RunPython.noop),
+    ]
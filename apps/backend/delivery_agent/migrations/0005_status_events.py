@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-19 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_agent', '0004_agent_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryrequest',
+            name='status_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='DeliveryStatusEvent',
+            fields=[
+                ('event_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('request_id', models.IntegerField()),
+                ('from_status', models.CharField(max_length=20, null=True)),
+                ('to_status', models.CharField(max_length=20)),
+                ('agent_id', models.IntegerField(null=True)),
+                ('occurred_at', models.DateTimeField()),
+                ('seconds_in_previous', models.FloatField(null=True)),
+            ],
+            options={
+                'db_table': 'delivery_status_events',
+                'indexes': [models.Index(fields=['request_id', 'occurred_at'], name='status_event_request_idx'), models.Index(fields=['from_status', 'occurred_at'], name='status_event_from_idx')],
+            },
+        ),
+    ]
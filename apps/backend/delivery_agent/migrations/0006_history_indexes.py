@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-19 00:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_agent', '0005_status_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deliveryrequest',
+            index=models.Index(fields=['agent', 'status', 'request_date'], name='delivery_agent_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrequest',
+            index=models.Index(fields=['buyer_id', 'status', 'request_date'], name='delivery_buyer_history_idx'),
+        ),
+    ]
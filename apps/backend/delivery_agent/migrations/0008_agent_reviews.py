@@ -0,0 +1,104 @@
+# Generated by Django 5.2 on 2026-10-19 00:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def _legacy_review(agent_id, entry):
+    """A row for one entry of the old DeliveryAgent.reviews JSON list, or None if it has no usable rating."""
+    if not isinstance(entry, dict):
+        return None
+    try:
+        rating = int(entry.get("rating"))
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= rating <= 5:
+        return None
+    created_at = parse_datetime(str(entry.get("created_at") or entry.get("date") or "")) or timezone.now()
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at)
+    return {
+        "agent_id": agent_id,
+        "reviewer_id": entry.get("user_id") or entry.get("reviewer_id"),
+        "rating": rating,
+        "comment": str(entry.get("comment") or entry.get("review") or entry.get("text") or ""),
+        "created_at": created_at,
+    }
+
+
+def move_reviews(apps, schema_editor):
+    """
+    Copy the JSON reviews and the ratings of completed deliveries into the reviews
+    table, then fill the rating rollup.
+    """
+    DeliveryAgent = apps.get_model('delivery_agent', 'DeliveryAgent')
+    DeliveryRequest = apps.get_model('delivery_agent', 'DeliveryRequest')
+    AgentReview = apps.get_model('delivery_agent', 'AgentReview')
+    AgentStats = apps.get_model('delivery_agent', 'AgentStats')
+
+    reviews = []
+    for agent_id, entries in DeliveryAgent.objects.values_list('agent_id', 'reviews').iterator():
+        for entry in entries or []:
+            row = _legacy_review(agent_id, entry)
+            if row:
+                reviews.append(AgentReview(**row))
+    rated = DeliveryRequest.objects.filter(
+        agent__isnull=False, status="completed", delivery_rating__gte=1, delivery_rating__lte=5
+    )
+    for request in rated.iterator():
+        reviews.append(AgentReview(
+            agent_id=request.agent_id, request_id=request.request_id, reviewer_id=request.buyer_id,
+            rating=request.delivery_rating, created_at=request.status_changed_at or request.request_date,
+        ))
+    AgentReview.objects.bulk_create(reviews, batch_size=1000)
+
+    totals = AgentReview.objects.order_by().values('agent_id').annotate(count=Count('review_id'), total=Sum('rating'))
+    for row in totals:
+        AgentStats.objects.update_or_create(
+            agent_id=row['agent_id'], defaults={'review_count': row['count'], 'rating_sum': row['total']}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_agent', '0007_clean_agent_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agentstats',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='agentstats',
+            name='review_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='AgentReview',
+            fields=[
+                ('review_id', models.AutoField(primary_key=True, serialize=False)),
+                ('reviewer_id', models.IntegerField(blank=True, null=True)),
+                ('rating', models.PositiveSmallIntegerField()),
+                ('comment', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agent_reviews', to='delivery_agent.deliveryagent')),
+                ('request', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='review', to='delivery_agent.deliveryrequest')),
+            ],
+            options={
+                'db_table': 'delivery_agent_reviews',
+                'indexes': [models.Index(fields=['agent', 'created_at', 'review_id'], name='agent_review_page_idx')],
+            },
+        ),
+        migrations.RunPython(move_reviews, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='deliveryagent',
+            name='reviews',
+        ),
+    ]
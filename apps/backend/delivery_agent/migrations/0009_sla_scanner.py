@@ -0,0 +1,86 @@
+# Generated by Django 5.2 on 2026-10-19 00:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_entered_at(apps, schema_editor):
+    """
+    Give requests that predate the status log a status_changed_at (their
+    request_date, as status_entered_at() assumes), so the scan can see them.
+    """
+    DeliveryRequest = apps.get_model('delivery_agent', 'DeliveryRequest')
+    DeliveryRequest.objects.filter(status_changed_at__isnull=True).update(status_changed_at=F('request_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_agent', '0008_agent_reviews'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlaBreach',
+            fields=[
+                ('breach_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('status', models.CharField(max_length=20)),
+                ('level', models.CharField(max_length=20)),
+                ('entered_at', models.DateTimeField()),
+                ('detected_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'delivery_sla_breaches',
+            },
+        ),
+        migrations.CreateModel(
+            name='SlaScanRun',
+            fields=[
+                ('run_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('started_at', models.DateTimeField()),
+                ('duration_ms', models.FloatField()),
+                ('warnings', models.IntegerField()),
+                ('escalations', models.IntegerField()),
+                ('max_lag_seconds', models.FloatField(null=True)),
+                ('caught_up', models.BooleanField()),
+            ],
+            options={
+                'db_table': 'delivery_sla_scan_runs',
+            },
+        ),
+        migrations.CreateModel(
+            name='SlaWatermark',
+            fields=[
+                ('rule', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('scanned_until', models.DateTimeField(null=True)),
+                ('last_request_id', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'delivery_sla_watermarks',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrequest',
+            index=models.Index(fields=['status', 'status_changed_at'], name='delivery_status_entered_idx'),
+        ),
+        migrations.AddField(
+            model_name='slabreach',
+            name='request',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sla_breaches', to='delivery_agent.deliveryrequest'),
+        ),
+        migrations.AddIndex(
+            model_name='slascanrun',
+            index=models.Index(fields=['started_at'], name='sla_scan_run_started_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='slabreach',
+            index=models.Index(fields=['level', 'detected_at'], name='sla_breach_level_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='slabreach',
+            constraint=models.UniqueConstraint(fields=('request', 'level', 'entered_at'), name='unique_sla_breach'),
+        ),
+        migrations.RunPython(backfill_entered_at, migrations.RunPython.noop),
+    ]
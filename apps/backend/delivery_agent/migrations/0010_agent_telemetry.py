@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 00:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_agent', '0009_sla_scanner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentPosition',
+            fields=[
+                ('agent', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='position', serialize=False, to='delivery_agent.deliveryagent')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('recorded_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'delivery_agent_positions',
+            },
+        ),
+        migrations.CreateModel(
+            name='AgentTrackPoint',
+            fields=[
+                ('point_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('recorded_at', models.DateTimeField()),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='track_points', to='delivery_agent.deliveryagent')),
+            ],
+            options={
+                'db_table': 'delivery_agent_track',
+                'indexes': [models.Index(fields=['agent', 'recorded_at'], name='agent_track_idx')],
+            },
+        ),
+    ]
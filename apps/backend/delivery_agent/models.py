@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 
@@ -12,7 +13,6 @@ class DeliveryAgent(models.Model):
     phone_number = models.CharField(max_length=15, unique=True)
     transport_mode = models.CharField(max_length=50)  
     phone_number = models.CharField(max_length=15, unique=True)
-    reviews = models.JSONField(default=list)  
     deliveries_completed = models.IntegerField(default=0)
     identity_img_url = models.URLField(null=True, blank=True)
     day_of_week = models.JSONField(default=list)  # Store array of strings as JSON
@@ -40,6 +40,7 @@ class DeliveryRequest(models.Model):
     dropoff_location = models.CharField(max_length=255)
     pickup_location = models.CharField(max_length=255)
     status = models.CharField(max_length=20, default="pending")  # pending, accepted, rejected, completed
+    status_changed_at = models.DateTimeField(null=True, blank=True)  # null on rows older than the status log
     delivery_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     delivery_rating = models.IntegerField(null=True, blank=True) 
     delivery_mode = models.CharField(max_length=50, default="standard")  # e.g., "standard", "express"
@@ -52,4 +53,213 @@ class DeliveryRequest(models.Model):
         db_table = "delivery_requests"
         verbose_name = "Delivery Request"
         verbose_name_plural = "Delivery Requests"
-        ordering = ['-request_date']
\ No newline at end of file
+        ordering = ['-request_date']
+        indexes = [
+            models.Index(fields=['status', 'agent'], name='delivery_status_agent_idx'),
+            # Keyset pagination of agent and buyer history; InnoDB appends request_id to both
+            models.Index(fields=['agent', 'status', 'request_date'], name='delivery_agent_history_idx'),
+            models.Index(fields=['buyer_id', 'status', 'request_date'], name='delivery_buyer_history_idx'),
+            # Incremental SLA scans walk each status in the order requests entered it
+            models.Index(fields=['status', 'status_changed_at'], name='delivery_status_entered_idx'),
+        ]
+
+class AgentCategory(models.Model):
+    """Normalized DeliveryAgent.category_ids, used for matching agents to requests."""
+    agent = models.ForeignKey(DeliveryAgent, on_delete=models.CASCADE, related_name='category_links')
+    category_id = models.IntegerField()
+
+    class Meta:
+        db_table = "delivery_agent_categories"
+        constraints = [
+            models.UniqueConstraint(fields=['agent', 'category_id'], name='unique_agent_category'),
+        ]
+        indexes = [
+            models.Index(fields=['category_id', 'agent'], name='agent_category_idx'),
+        ]
+
+
+class AgentAvailability(models.Model):
+    """
+    One weekly availability window of an agent, normalized from day_of_week/time_slot.
+    Back-to-back slots are stored as one window, so "free from a to b" is a single
+    containment test: start_time <= a and end_time >= b.
+    """
+    agent = models.ForeignKey(DeliveryAgent, on_delete=models.CASCADE, related_name='availability')
+    weekday = models.PositiveSmallIntegerField()  # 0 = Monday
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        db_table = "delivery_agent_availability"
+        constraints = [
+            models.UniqueConstraint(fields=['agent', 'weekday', 'start_time'], name='unique_agent_window'),
+        ]
+        indexes = [
+            # Covers the interval lookup, so finding the agents free at a time never reads the table
+            models.Index(fields=['weekday', 'start_time', 'end_time', 'agent'], name='availability_interval_idx'),
+        ]
+
+
+class OpenDeliveryRequest(models.Model):
+    """
+    Matching index over requests agents can still claim (pending and not held by an
+    approved agent), with the attributes they are matched and ranked on.
+    """
+    request = models.OneToOneField(DeliveryRequest, on_delete=models.CASCADE, primary_key=True, related_name='open_entry')
+    category_id = models.IntegerField(null=True)
+    weekday = models.PositiveSmallIntegerField(null=True)  # of delivery_date; null when no date was requested
+    delivery_time = models.TimeField(null=True)
+    due_at = models.DateTimeField(null=True)
+    delivery_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    request_date = models.DateTimeField()
+
+    class Meta:
+        db_table = "open_delivery_requests"
+        indexes = [
+            models.Index(fields=['category_id', 'weekday', 'delivery_time'], name='open_request_match_idx'),
+            models.Index(fields=['due_at', '-delivery_fee', 'request_date'], name='open_request_rank_idx'),
+        ]
+
+
+class DeliveryStatusEvent(models.Model):
+    """
+    Append-only log of delivery request status transitions. seconds_in_previous is
+    the time the request spent in from_status, so time-in-state analytics need no
+    self-join.
+    """
+    event_id = models.BigAutoField(primary_key=True)
+    request_id = models.IntegerField()  # kept after the request itself is deleted
+    from_status = models.CharField(max_length=20, null=True)  # null for the creation event
+    to_status = models.CharField(max_length=20)
+    agent_id = models.IntegerField(null=True)
+    occurred_at = models.DateTimeField()
+    seconds_in_previous = models.FloatField(null=True)
+
+    class Meta:
+        db_table = "delivery_status_events"
+        indexes = [
+            models.Index(fields=['request_id', 'occurred_at'], name='status_event_request_idx'),
+            models.Index(fields=['from_status', 'occurred_at'], name='status_event_from_idx'),
+        ]
+
+
+class SlaWatermark(models.Model):
+    """How far the SLA scanner has got for one rule: the (status_changed_at, request_id) of the last request checked."""
+    rule = models.CharField(max_length=50, primary_key=True)  # "<status>:<level>"
+    scanned_until = models.DateTimeField(null=True)
+    last_request_id = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "delivery_sla_watermarks"
+
+
+class SlaBreach(models.Model):
+    """A request that stayed in a status longer than an SLA rule allows."""
+    breach_id = models.BigAutoField(primary_key=True)
+    request = models.ForeignKey(DeliveryRequest, on_delete=models.CASCADE, related_name='sla_breaches')
+    status = models.CharField(max_length=20)
+    level = models.CharField(max_length=20)  # "warning" or "escalated"
+    entered_at = models.DateTimeField()  # when the request entered the status
+    detected_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "delivery_sla_breaches"
+        constraints = [
+            models.UniqueConstraint(fields=['request', 'level', 'entered_at'], name='unique_sla_breach'),
+        ]
+        indexes = [
+            models.Index(fields=['level', 'detected_at'], name='sla_breach_level_idx'),
+        ]
+
+
+class SlaScanRun(models.Model):
+    """Metrics of one SLA scanner run."""
+    run_id = models.BigAutoField(primary_key=True)
+    started_at = models.DateTimeField()
+    duration_ms = models.FloatField()
+    warnings = models.IntegerField()
+    escalations = models.IntegerField()
+    max_lag_seconds = models.FloatField(null=True)  # how far the slowest rule's watermark trails its cutoff
+    caught_up = models.BooleanField()
+
+    class Meta:
+        db_table = "delivery_sla_scan_runs"
+        indexes = [
+            models.Index(fields=['started_at'], name='sla_scan_run_started_idx'),
+        ]
+
+
+class AgentStats(models.Model):
+    """
+    Per-agent rollup behind the dashboard stats: requests currently "accepted",
+    requests "completed" and the delivery fees earned on them, plus the number and
+    sum of the agent's review ratings.
+    """
+    agent = models.OneToOneField(DeliveryAgent, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    accepted_deliveries = models.IntegerField(default=0)
+    completed_deliveries = models.IntegerField(default=0)
+    total_earnings = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    review_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "delivery_agent_stats"
+
+    @property
+    def average_rating(self):
+        return round(self.rating_sum / self.review_count, 2) if self.review_count else None
+
+
+class AgentReview(models.Model):
+    """A rating of a delivery agent, left by the buyer of a completed delivery."""
+    review_id = models.AutoField(primary_key=True)
+    agent = models.ForeignKey(DeliveryAgent, on_delete=models.CASCADE, related_name='agent_reviews')
+    request = models.OneToOneField(DeliveryRequest, on_delete=models.SET_NULL, null=True, blank=True, related_name='review')
+    reviewer_id = models.IntegerField(null=True, blank=True)  # buyer's user id
+    rating = models.PositiveSmallIntegerField()  # 1 to 5
+    comment = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "delivery_agent_reviews"
+        indexes = [
+            # Newest-first keyset pagination of an agent's reviews
+            models.Index(fields=['agent', 'created_at', 'review_id'], name='agent_review_page_idx'),
+        ]
+
+
+class AgentPosition(models.Model):
+    """Newest known position of a delivery agent, written by the telemetry flush (see telemetry.py)."""
+    agent = models.OneToOneField(DeliveryAgent, on_delete=models.CASCADE, primary_key=True, related_name='position')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    recorded_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "delivery_agent_positions"
+
+
+class AgentTrackPoint(models.Model):
+    """One downsampled telemetry ping: at most one per agent per sample interval."""
+    point_id = models.BigAutoField(primary_key=True)
+    agent = models.ForeignKey(DeliveryAgent, on_delete=models.CASCADE, related_name='track_points')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    recorded_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "delivery_agent_track"
+        indexes = [
+            models.Index(fields=['agent', 'recorded_at'], name='agent_track_idx'),
+        ]
+
+
+class Geocode(models.Model):
+    """Local geocoding table: a normalized postal code, place name or address and its coordinates."""
+    key = models.CharField(max_length=255, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    class Meta:
+        db_table = "geocodes"
@@ -0,0 +1,188 @@
+"""
+Delivery fee quoting from the tariff in data/tariffs.json (or DELIVERY_TARIFF_FILE).
+
+A fee is
+
+    clip((base + per_km * road_km) * size * time slot * weekday, min, max)
+
+with base, per_km, min and max taken from the delivery mode. road_km is the
+great-circle distance between the geocoded pickup and dropoff times the road
+factor; when either end is not in the geocodes table the tariff's fallback
+distance is used instead. The size class comes from the option, or from the
+product's category, or is the tariff default. Options without a delivery time
+get no time slot or weekday surcharge.
+
+The tariff is parsed once into lookup arrays (at app startup, see apps.py) and a
+batch of options is priced with a handful of NumPy operations, after one query
+for the products and one for the geocodes.
+"""
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+from django.http import Http404
+from django.utils import timezone
+from loguru import logger
+from ninja.errors import HttpError
+
+from products.models import Product
+
+from .geocoding import geocode_many
+from .routing import haversine_pairs
+
+DEFAULT_TARIFF = Path(__file__).resolve().parent / "data" / "tariffs.json"
+MAX_QUOTE_OPTIONS = 1000
+# Time slot row used for options without a delivery time
+ANY_TIME = 24
+
+
+@dataclass(frozen=True)
+class Tariff:
+    currency: str
+    road_factor: float
+    fallback_distance_km: float
+    modes: dict  # mode name -> row in the per-mode arrays
+    base: np.ndarray
+    per_km: np.ndarray
+    min_fee: np.ndarray
+    max_fee: np.ndarray
+    sizes: dict  # size name -> row in size_multipliers
+    size_multipliers: np.ndarray
+    default_size: str
+    category_sizes: dict  # lower-case category name -> size name
+    hour_multipliers: np.ndarray  # 24 hours plus ANY_TIME
+    weekday_multipliers: np.ndarray  # Monday first, plus a neutral row for ANY_TIME
+
+
+def parse_tariff(data: dict) -> Tariff:
+    modes = list(data["modes"])
+    sizes = list(data["sizes"])
+    hours = np.full(ANY_TIME + 1, np.nan)
+    for slot in data["time_slots"]:
+        hours[slot["from"]:slot["to"]] = slot["multiplier"]
+    if np.isnan(hours[:ANY_TIME]).any():
+        raise ValueError("Tariff time slots must cover all 24 hours")
+    hours[ANY_TIME] = 1.0
+    weekdays = [float(m) for m in data["weekday_multipliers"]]
+    if len(weekdays) != 7:
+        raise ValueError("Tariff needs one weekday multiplier per day")
+    if data["default_size"] not in data["sizes"]:
+        raise ValueError(f"Unknown default size {data['default_size']}")
+    return Tariff(
+        currency=data["currency"],
+        road_factor=float(data["road_factor"]),
+        fallback_distance_km=float(data["fallback_distance_km"]),
+        modes={mode: i for i, mode in enumerate(modes)},
+        base=np.array([data["modes"][mode]["base"] for mode in modes], dtype=float),
+        per_km=np.array([data["modes"][mode]["per_km"] for mode in modes], dtype=float),
+        min_fee=np.array([data["modes"][mode]["min"] for mode in modes], dtype=float),
+        max_fee=np.array([data["modes"][mode]["max"] for mode in modes], dtype=float),
+        sizes={size: i for i, size in enumerate(sizes)},
+        size_multipliers=np.array([data["sizes"][size] for size in sizes], dtype=float),
+        default_size=data["default_size"],
+        category_sizes={name.casefold(): size for name, size in data["category_sizes"].items()},
+        hour_multipliers=hours,
+        weekday_multipliers=np.array(weekdays + [1.0]),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_tariff() -> Tariff:
+    path = getattr(settings, 'DELIVERY_TARIFF_FILE', DEFAULT_TARIFF)
+    with open(path, encoding="utf-8") as f:
+        tariff = parse_tariff(json.load(f))
+    logger.info(f"Loaded delivery tariff from {path} ({len(tariff.modes)} modes).")
+    return tariff
+
+
+def reload_tariff() -> Tariff:
+    get_tariff.cache_clear()
+    return get_tariff()
+
+
+def quote_options(options, products: Optional[dict] = None) -> list[dict]:
+    """
+    Price a batch of delivery options. Each option has product_id, pickup_location,
+    dropoff_location, delivery_mode, size and delivery_date_time attributes; a
+    missing pickup location defaults to the product's location. Callers that have
+    already loaded the products pass them as {product_id: (category name, location)}.
+    """
+    if len(options) > MAX_QUOTE_OPTIONS:
+        raise HttpError(400, f"At most {MAX_QUOTE_OPTIONS} options can be quoted at once")
+    tariff = get_tariff()
+    count = len(options)
+    if count == 0:
+        return []
+
+    product_ids = {option.product_id for option in options if option.product_id is not None}
+    if products is None:
+        products = {
+            product_id: (category_name, location)
+            for product_id, category_name, location in Product.objects.filter(product_id__in=product_ids)
+            .values_list('product_id', 'category__category_name', 'location')
+        }
+    missing = product_ids - products.keys()
+    if missing:
+        raise Http404(f"Products not found: {sorted(missing)}")
+
+    modes = np.empty(count, dtype=int)
+    sizes = np.empty(count, dtype=int)
+    hours = np.full(count, ANY_TIME)
+    weekdays = np.full(count, 7)
+    pickups, size_names = [], []
+    for k, option in enumerate(options):
+        mode = option.delivery_mode or "standard"
+        if mode not in tariff.modes:
+            raise HttpError(400, f"Unknown delivery mode '{mode}'")
+        modes[k] = tariff.modes[mode]
+
+        category_name, product_location = products.get(option.product_id, (None, None))
+        size = option.size or tariff.category_sizes.get((category_name or "").casefold(), tariff.default_size)
+        if size not in tariff.sizes:
+            raise HttpError(400, f"Unknown size '{size}'")
+        sizes[k] = tariff.sizes[size]
+        size_names.append(size)
+
+        pickups.append(option.pickup_location or product_location)
+        if option.delivery_date_time is not None:
+            at = option.delivery_date_time
+            local = timezone.localtime(at) if timezone.is_aware(at) else at
+            hours[k] = local.hour
+            weekdays[k] = local.weekday()
+
+    dropoffs = [option.dropoff_location for option in options]
+    coordinates = geocode_many([location for location in pickups + dropoffs if location])
+    origin = np.full((count, 2), np.nan)
+    destination = np.full((count, 2), np.nan)
+    for k in range(count):
+        origin[k] = coordinates.get(pickups[k]) or (np.nan, np.nan)
+        destination[k] = coordinates.get(dropoffs[k]) or (np.nan, np.nan)
+
+    road_km = haversine_pairs(origin, destination) * tariff.road_factor
+    located = ~np.isnan(road_km)
+    road_km = np.where(located, road_km, tariff.fallback_distance_km)
+    fees = (
+        (tariff.base[modes] + tariff.per_km[modes] * road_km)
+        * tariff.size_multipliers[sizes]
+        * tariff.hour_multipliers[hours]
+        * tariff.weekday_multipliers[weekdays]
+    )
+    fees = np.round(np.clip(fees, tariff.min_fee[modes], tariff.max_fee[modes]), 2)
+
+    return [
+        {
+            "index": k,
+            "product_id": option.product_id,
+            "delivery_mode": option.delivery_mode or "standard",
+            "size": size_names[k],
+            "distance_km": round(float(road_km[k]), 2) if located[k] else None,
+            "fee": float(fees[k]),
+            "currency": tariff.currency,
+        }
+        for k, option in enumerate(options)
+    ]
+
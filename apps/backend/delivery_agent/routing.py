@@ -0,0 +1,136 @@
+"""
+Stop sequencing for an agent's route: an open path over pickup and dropoff stops
+in which every dropoff comes after its pickup.
+
+The tour is built with nearest neighbour over a haversine distance matrix (from
+the agent's position if known, otherwise from every feasible first stop, keeping
+the shortest), then improved with 2-opt. A 2-opt move reverses a stretch of the
+path, so it is only allowed when that stretch does not hold both stops of a job.
+"""
+from typing import Optional, Sequence
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_2OPT_PASSES = 50
+
+
+def haversine_matrix(points: np.ndarray) -> np.ndarray:
+    """Pairwise great-circle distances in km between (latitude, longitude) rows."""
+    lat, lng = np.radians(points[:, 0]), np.radians(points[:, 1])
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_pairs(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Great-circle distances in km between row k of a and row k of b."""
+    lat1, lng1 = np.radians(a[:, 0]), np.radians(a[:, 1])
+    lat2, lng2 = np.radians(b[:, 0]), np.radians(b[:, 1])
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def distance_km(a: Sequence, b: Sequence) -> float:
+    return float(haversine_matrix(np.array([a, b], dtype=float))[0, 1])
+
+
+def plan_route(points: Sequence, predecessors: Sequence[int], start: Optional[Sequence] = None) -> tuple[list, float]:
+    """
+    Order the stops and return (stop indices in visiting order, path length in km).
+
+    points are (latitude, longitude) per stop; predecessors[k] is the index of the
+    stop that must be visited before stop k (its pickup), or -1.
+    """
+    n = len(points)
+    if n == 0:
+        return [], 0.0
+    coordinates = np.asarray(points, dtype=float).reshape(n, 2)
+    if start is not None:
+        coordinates = np.vstack([coordinates, np.asarray(start, dtype=float)])
+    # An extra sentinel node at distance 0 from everything stands in for the open ends of the path
+    size = len(coordinates)
+    dist = np.zeros((size + 1, size + 1))
+    dist[:size, :size] = haversine_matrix(coordinates)
+
+    predecessors = np.asarray(predecessors, dtype=int)
+    successors = np.full(n, -1)
+    for stop, pickup in enumerate(predecessors):
+        if pickup >= 0:
+            successors[pickup] = stop
+
+    if start is not None:
+        path = _nearest_neighbour(dist, predecessors, successors, origin=n)
+    else:
+        firsts = np.flatnonzero(predecessors < 0)
+        path = min(
+            (_nearest_neighbour(dist, predecessors, successors, first=int(first)) for first in firsts),
+            key=lambda candidate: _length(dist, candidate),
+        )
+    path = _two_opt(dist, path, predecessors, fixed_start=start is not None)
+    length = _length(dist, path)
+    return [int(stop) for stop in (path[1:] if start is not None else path)], length
+
+
+def _length(dist: np.ndarray, path: np.ndarray) -> float:
+    return float(dist[path[:-1], path[1:]].sum())
+
+
+def _nearest_neighbour(dist, predecessors, successors, first=None, origin=None) -> np.ndarray:
+    n = len(predecessors)
+    visited = np.zeros(n, dtype=bool)
+    ready = predecessors < 0
+    path = []
+    current = origin
+    if first is not None:
+        path.append(first)
+        visited[first] = True
+        if successors[first] >= 0:
+            ready[successors[first]] = True
+        current = first
+    else:
+        path.append(origin)
+    while len(path) < n + (origin is not None):
+        candidates = np.where(ready & ~visited, dist[current, :n], np.inf)
+        current = int(np.argmin(candidates))
+        path.append(current)
+        visited[current] = True
+        if successors[current] >= 0:
+            ready[successors[current]] = True
+    return np.asarray(path)
+
+
+def _two_opt(dist, path, predecessors, fixed_start: bool) -> np.ndarray:
+    path = path.copy()
+    m = len(path)
+    sentinel = len(dist) - 1
+    pickups = np.flatnonzero(predecessors >= 0)
+    pairs = np.stack([predecessors[pickups], pickups], axis=1) if len(pickups) else np.empty((0, 2), dtype=int)
+    first = 1 if fixed_start else 0
+
+    for _ in range(MAX_2OPT_PASSES):
+        improved = False
+        for i in range(first, m - 1):
+            position = np.empty(len(dist), dtype=int)
+            position[path] = np.arange(m)
+            # Reversing path[i..j] would put a dropoff before its pickup once j reaches
+            # the dropoff of a job whose pickup is at or after i
+            pickup_at, dropoff_at = position[pairs[:, 0]], position[pairs[:, 1]]
+            blocking = dropoff_at[pickup_at >= i]
+            last = min(int(blocking.min()) - 1, m - 1) if len(blocking) else m - 1
+            if last <= i:
+                continue
+            js = np.arange(i + 1, last + 1)
+            before = path[i - 1] if i > 0 else sentinel
+            after = np.append(path, sentinel)[js + 1]
+            delta = (dist[before, path[js]] + dist[path[i], after]
+                     - dist[before, path[i]] - dist[path[js], after])
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                j = int(js[best])
+                path[i:j + 1] = path[i:j + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return path
@@ -0,0 +1,116 @@
+"""
+Parsing of the free-form category_ids / day_of_week / time_slot values stored on
+DeliveryAgent. The signup form sends parallel lists, e.g.
+
+    day_of_week=["Monday", "Friday"], time_slot=[[1, 2], [3]]
+
+where slot numbers index the form's fixed time windows. Older rows hold single
+values instead ("1,2", "Monday", 1), which apply to every listed day; migration
+0007 rewrote those into the canonical form above, and new values are stored
+canonically (see canonical_schedule), so readers can use the fields as they are.
+"""
+from datetime import time
+
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# Mirrors the slots offered by the frontend's DeliveryAgentAvailability form
+TIME_SLOTS = {
+    1: (time(8, 0), time(12, 0)),
+    2: (time(12, 0), time(16, 0)),
+    3: (time(16, 0), time(20, 0)),
+}
+SLOT_NUMBERS = {window: slot for slot, window in TIME_SLOTS.items()}
+
+
+def parse_category_ids(value) -> list[int]:
+    if value is None or value == "":
+        return []
+    if isinstance(value, (int, str)):
+        value = str(value).split(",")
+    category_ids = []
+    for item in value:
+        try:
+            category_ids.append(int(str(item).strip()))
+        except ValueError:
+            continue
+    return sorted(set(category_ids))
+
+
+def parse_weekday(value):
+    """0 for Monday .. 6 for Sunday; accepts full or abbreviated names. None if unknown."""
+    name = str(value).strip().lower()
+    if len(name) < 3:
+        return None
+    for index, weekday in enumerate(WEEKDAYS):
+        if weekday.lower().startswith(name):
+            return index
+    return None
+
+
+def _parse_slots(value) -> list[int]:
+    if value is None or value == "":
+        return []
+    if isinstance(value, (int, str)):
+        value = str(value).split(",")
+    slots = []
+    for item in value:
+        try:
+            slot = int(str(item).strip())
+        except ValueError:
+            continue
+        if slot in TIME_SLOTS:
+            slots.append(slot)
+    return slots
+
+
+def parse_availability(day_of_week, time_slot) -> list[tuple[int, time, time]]:
+    """Return sorted, de-duplicated (weekday, start, end) windows."""
+    days = [day_of_week] if isinstance(day_of_week, str) else list(day_of_week or [])
+    weekdays = [parse_weekday(day) for day in days]
+
+    if isinstance(time_slot, list) and time_slot and all(isinstance(item, list) for item in time_slot):
+        per_day = [_parse_slots(slots) for slots in time_slot]
+        if len(per_day) == 1:
+            per_day = per_day * len(weekdays)
+    else:
+        per_day = [_parse_slots(time_slot)] * len(weekdays)
+
+    windows = set()
+    for weekday, slots in zip(weekdays, per_day):
+        if weekday is None:
+            continue
+        for slot in slots:
+            start, end = TIME_SLOTS[slot]
+            windows.add((weekday, start, end))
+    return sorted(windows)
+
+
+def merge_windows(windows) -> list[tuple[int, time, time]]:
+    """Join overlapping or back-to-back windows of the same weekday, e.g. 8-12 and 12-16 into 8-16."""
+    merged = []
+    for weekday, start, end in sorted(windows):
+        if merged and merged[-1][0] == weekday and start <= merged[-1][2]:
+            merged[-1] = (weekday, merged[-1][1], max(end, merged[-1][2]))
+        else:
+            merged.append((weekday, start, end))
+    return merged
+
+
+def availability_windows(day_of_week, time_slot) -> list[tuple[int, time, time]]:
+    """The agent_availability rows for the given fields: one row per continuous stretch."""
+    return merge_windows(parse_availability(day_of_week, time_slot))
+
+
+def canonical_category_ids(value) -> list[str]:
+    return [str(category_id) for category_id in parse_category_ids(value)]
+
+
+def canonical_schedule(day_of_week, time_slot) -> tuple[list[str], list[list[int]]]:
+    """(day_of_week, time_slot) as parallel lists of weekday names and slot numbers, in weekday order."""
+    days, slots = [], []
+    for weekday, start, end in parse_availability(day_of_week, time_slot):
+        if not days or days[-1] != WEEKDAYS[weekday]:
+            days.append(WEEKDAYS[weekday])
+            slots.append([])
+        slots[-1].append(SLOT_NUMBERS[(start, end)])
+    return days, slots
@@ -1,7 +1,7 @@
-from ninja import Schema
-from typing import List, Optional
+from ninja import Field, Schema
+from typing import List, Optional, Tuple
 from products.schemas import ProductOut
-from datetime import datetime
+from datetime import datetime, time
 
 class DeliveryAgentOut(Schema):
     agent_id: int
@@ -11,7 +11,8 @@ class DeliveryAgentOut(Schema):
     email: str
     phone_number: str
     transport_mode: str
-    reviews: List[dict]
+    review_count: int = 0
+    average_rating: Optional[float] = None
     deliveries_completed: int
     identity_img_url: Optional[str]
     day_of_week: List[str]
@@ -42,6 +43,9 @@ class DeliveryRequestIn(Schema):
     delivery_notes: Optional[str] = None
     delivery_mode: Optional[str] = "standard"  # Default to "standard" if not provided
 
+class DeliveryRequestBatchIn(Schema):
+    requests: List[DeliveryRequestIn] = Field(..., min_length=1, max_length=100)
+
 class DeliveryAgentSignup(Schema):
     first_name: str
     last_name: str
@@ -81,4 +85,96 @@ class DeliveryAgentStats(Schema):
     pending_requests: int
     accepted_deliveries: int
     completed_deliveries: int
-    total_earnings: float
\ No newline at end of file
+    total_earnings: float
+
+class RouteStopOut(Schema):
+    request_id: int
+    kind: str  # "pickup" or "dropoff"
+    location: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    visit: Optional[int] = None  # consecutive stops at the same place share a visit
+    leg_km: Optional[float] = None
+
+class RouteOut(Schema):
+    agent_id: int
+    distance_km: float
+    stops: List[RouteStopOut]
+    unlocated: List[RouteStopOut]
+
+class TelemetryIn(Schema):
+    pings: List[Tuple[float, float, float]] = Field(..., min_length=1, max_length=1000)  # [unix seconds, latitude, longitude]
+
+class TelemetryAckOut(Schema):
+    accepted: int
+
+class DeliveryLocationOut(Schema):
+    request_id: int
+    agent_id: int
+    latitude: float
+    longitude: float
+    recorded_at: datetime
+    age_seconds: float
+
+class DeliveryStatusEventOut(Schema):
+    from_status: Optional[str] = None
+    status: str
+    agent_id: Optional[int] = None
+    at: datetime
+    seconds_in_previous: Optional[float] = None
+
+class StatusDurationOut(Schema):
+    status: str
+    transitions: int
+    avg_seconds: Optional[float] = None
+    max_seconds: Optional[float] = None
+
+class SlaBreachOut(Schema):
+    request_id: int
+    status: str
+    level: str
+    entered_at: datetime
+    detected_at: datetime
+    agent_id: Optional[int] = None
+
+class QuoteOptionIn(Schema):
+    product_id: Optional[int] = None
+    pickup_location: Optional[str] = None  # defaults to the product's location
+    dropoff_location: str
+    delivery_mode: str = "standard"
+    size: Optional[str] = None  # defaults to the size class of the product's category
+    delivery_date_time: Optional[datetime] = None
+
+class QuoteIn(Schema):
+    options: List[QuoteOptionIn] = Field(..., min_length=1, max_length=1000)
+
+class QuoteLineOut(Schema):
+    index: int
+    product_id: Optional[int] = None
+    delivery_mode: str
+    size: str
+    distance_km: Optional[float] = None  # None when a location is not geocoded and the fallback distance was used
+    fee: float
+    currency: str
+
+class QuoteOut(Schema):
+    options: List[QuoteLineOut]
+
+class AvailableAgentsOut(Schema):
+    weekday: int  # 0 = Monday
+    start: time
+    end: time
+    agent_ids: List[int]
+
+class AgentReviewIn(Schema):
+    user_id: int
+    rating: int = Field(..., ge=1, le=5)
+    comment: Optional[str] = None
+
+class AgentReviewOut(Schema):
+    review_id: int
+    agent_id: int
+    request_id: Optional[int] = None
+    rating: int
+    comment: str
+    created_at: datetime
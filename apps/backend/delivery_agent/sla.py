@@ -0,0 +1,150 @@
+"""
+SLA scanner for delivery requests that stay too long in a status.
+
+Each rule says that a request may stay in a status for some hours before it gets
+a breach of the given level. "warning" breaches are only recorded; "escalated"
+ones are also logged as errors. Rules come from DELIVERY_SLA_RULES, a list of
+(status, level, hours).
+
+Every rule keeps a watermark: the (status_changed_at, request_id) of the last
+request it checked. A run reads at most batch_size requests per rule, from the
+watermark up to now minus the rule's hours, along the (status, status_changed_at)
+index, and moves the watermark past them. A request that enters the status later
+has a status_changed_at after the watermark, so every stint is seen exactly once.
+The cost of a run therefore depends on the batch size, not the table size; a
+scanner that falls behind catches up over the following runs (see caught_up and
+max_lag_seconds in the run metrics). Requests that predate the status log got
+their request_date as status_changed_at in migration 0009, before any watermark
+existed, so none of them can land behind one.
+
+Run it with the scan_delivery_sla command, once from cron or as a loop.
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from loguru import logger
+
+from .models import DeliveryRequest, SlaBreach, SlaScanRun, SlaWatermark
+
+WARNING = "warning"
+ESCALATED = "escalated"
+DEFAULT_RULES = [
+    ("pending", WARNING, 24),
+    ("pending", ESCALATED, 72),
+    ("accepted", WARNING, 24),
+    ("accepted", ESCALATED, 72),
+    ("out_for_delivery", ESCALATED, 12),
+    ("on_the_way", ESCALATED, 12),
+]
+SCAN_BATCH_SIZE = getattr(settings, 'DELIVERY_SLA_SCAN_BATCH_SIZE', 500)
+
+
+@dataclass(frozen=True)
+class SlaRule:
+    status: str
+    level: str
+    after: timedelta
+
+    @property
+    def key(self) -> str:
+        return f"{self.status}:{self.level}"
+
+
+def get_rules() -> list[SlaRule]:
+    rules = [
+        SlaRule(status, level, timedelta(hours=hours))
+        for status, level, hours in getattr(settings, 'DELIVERY_SLA_RULES', DEFAULT_RULES)
+    ]
+    for rule in rules:
+        if rule.level not in (WARNING, ESCALATED):
+            raise ImproperlyConfigured(f"Unknown SLA level '{rule.level}' in DELIVERY_SLA_RULES")
+    return rules
+
+
+def scan_rule(rule: SlaRule, now: datetime, batch_size: int) -> tuple[int, bool, Optional[float]]:
+    """
+    Record a breach for the next batch of requests past the rule's cutoff; returns
+    (breaches, caught up, watermark lag in seconds if not caught up).
+    """
+    cutoff = now - rule.after
+    with transaction.atomic():
+        watermark, _ = SlaWatermark.objects.select_for_update().get_or_create(rule=rule.key)
+        candidates = DeliveryRequest.objects.filter(status=rule.status, status_changed_at__lte=cutoff)
+        if watermark.scanned_until is not None:
+            candidates = candidates.filter(
+                Q(status_changed_at__gt=watermark.scanned_until)
+                | Q(status_changed_at=watermark.scanned_until, request_id__gt=watermark.last_request_id)
+            )
+        rows = list(
+            candidates.order_by('status_changed_at', 'request_id')
+            .values_list('request_id', 'status_changed_at')[:batch_size]
+        )
+        if rows:
+            SlaBreach.objects.bulk_create(
+                [SlaBreach(request_id=request_id, status=rule.status, level=rule.level,
+                           entered_at=entered_at, detected_at=now)
+                 for request_id, entered_at in rows],
+                ignore_conflicts=True,
+            )
+            watermark.last_request_id, watermark.scanned_until = rows[-1]
+            watermark.save()
+
+    caught_up = len(rows) < batch_size
+    lag = None
+    if not caught_up and watermark.scanned_until is not None:
+        lag = (cutoff - watermark.scanned_until).total_seconds()
+    if rows:
+        log = logger.error if rule.level == ESCALATED else logger.warning
+        log(f"SLA {rule.level}: {len(rows)} requests in '{rule.status}' for over {rule.after} "
+            f"(request ids {[request_id for request_id, _ in rows[:20]]}{'...' if len(rows) > 20 else ''})")
+    return len(rows), caught_up, lag
+
+
+def run_sla_scan(now: Optional[datetime] = None, batch_size: int = SCAN_BATCH_SIZE) -> SlaScanRun:
+    """One bounded pass over every rule; records and returns the run's metrics."""
+    now = now or timezone.now()
+    started = time.perf_counter()
+    rules = get_rules()
+
+    found, caught_up, lags = {WARNING: 0, ESCALATED: 0}, True, []
+    for rule in rules:
+        breaches, rule_caught_up, lag = scan_rule(rule, now, batch_size)
+        found[rule.level] += breaches
+        caught_up &= rule_caught_up
+        if lag is not None:
+            lags.append(lag)
+
+    run = SlaScanRun.objects.create(
+        started_at=now,
+        duration_ms=(time.perf_counter() - started) * 1000,
+        warnings=found[WARNING],
+        escalations=found[ESCALATED],
+        max_lag_seconds=max(lags) if lags else None,
+        caught_up=caught_up,
+    )
+    logger.info(
+        f"SLA scan: {run.warnings} warnings, {run.escalations} escalations "
+        f"in {run.duration_ms:.1f}ms{'' if run.caught_up else ' (behind)'}."
+    )
+    return run
+
+
+def open_breaches(level: Optional[str] = None, status: Optional[str] = None, limit: int = 100) -> list[dict]:
+    """Breaches whose request is still in the breached status, oldest stint first."""
+    breaches = SlaBreach.objects.filter(request__status=F('status'), request__status_changed_at=F('entered_at'))
+    if level is not None:
+        breaches = breaches.filter(level=level)
+    if status is not None:
+        breaches = breaches.filter(status=status)
+    return list(
+        breaches.order_by('entered_at', 'breach_id').values(
+            'request_id', 'status', 'level', 'entered_at', 'detected_at', agent_id=F('request__agent_id'),
+        )[:limit]
+    )
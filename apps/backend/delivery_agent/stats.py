@@ -0,0 +1,116 @@
+"""
+Dashboard statistics for delivery agents.
+
+The per-agent numbers live in the delivery_agent_stats rollup, adjusted with F()
+increments inside the transaction of every status transition of an assigned
+request and of every new review. The count of unassigned pending requests is shared by all agents and
+comes from the (status, agent) index, so the dashboard is a single query.
+rebuild_agent_stats() recomputes the rollup from delivery_requests and
+delivery_agent_reviews.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Func, IntegerField, Max, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from loguru import logger
+
+from .models import AgentReview, AgentStats, DeliveryAgent, DeliveryRequest
+
+ACCEPTED_STATUS = "accepted"
+COMPLETED_STATUS = "completed"
+
+
+def adjust_agent_stats(agent_id, old_status: str, new_status: str, fee):
+    """Call inside the transaction that moves an assigned request from old_status to new_status."""
+    if agent_id is None or old_status == new_status:
+        return
+    fee = Decimal(fee or 0)
+    changes = {}
+    for status, field in ((ACCEPTED_STATUS, "accepted_deliveries"), (COMPLETED_STATUS, "completed_deliveries")):
+        delta = (new_status == status) - (old_status == status)
+        if delta:
+            changes[field] = F(field) + delta
+            if status == COMPLETED_STATUS:
+                changes["total_earnings"] = F("total_earnings") + delta * fee
+    if changes and not AgentStats.objects.filter(agent_id=agent_id).update(**changes):
+        # No rollup row yet; the transition is already visible to this transaction
+        rebuild_agent_stats_for([agent_id])
+
+
+def adjust_agent_rating(agent_id: int, rating: int):
+    """Call inside the transaction that adds a review with this rating."""
+    if not AgentStats.objects.filter(agent_id=agent_id).update(
+        review_count=F("review_count") + 1, rating_sum=F("rating_sum") + rating
+    ):
+        rebuild_agent_stats_for([agent_id])
+
+
+def rebuild_agent_stats_for(agent_ids):
+    totals = {
+        row['agent_id']: row for row in
+        DeliveryRequest.objects.filter(agent_id__in=agent_ids).order_by().values('agent_id').annotate(
+            accepted=Count('request_id', filter=Q(status=ACCEPTED_STATUS)),
+            completed=Count('request_id', filter=Q(status=COMPLETED_STATUS)),
+            earnings=Sum('delivery_fee', filter=Q(status=COMPLETED_STATUS)),
+        )
+    }
+    ratings = {
+        row['agent_id']: row for row in
+        AgentReview.objects.filter(agent_id__in=agent_ids).order_by().values('agent_id').annotate(
+            count=Count('review_id'), total=Sum('rating'),
+        )
+    }
+    rows = []
+    for agent_id in agent_ids:
+        row = totals.get(agent_id, {})
+        rating = ratings.get(agent_id, {})
+        rows.append(AgentStats(
+            agent_id=agent_id,
+            accepted_deliveries=row.get('accepted', 0),
+            completed_deliveries=row.get('completed', 0),
+            total_earnings=row.get('earnings') or 0,
+            review_count=rating.get('count', 0),
+            rating_sum=rating.get('total') or 0,
+        ))
+    AgentStats.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['agent'],
+        update_fields=['accepted_deliveries', 'completed_deliveries', 'total_earnings', 'review_count', 'rating_sum'],
+    )
+
+
+def rebuild_agent_stats(chunk_size: int = 1000) -> int:
+    """Recompute every agent's rollup row, one agent-id range at a time."""
+    rebuilt = 0
+    max_id = DeliveryAgent.objects.aggregate(last=Max('agent_id'))['last'] or 0
+    for start in range(0, max_id, chunk_size):
+        with transaction.atomic():
+            agent_ids = list(
+                DeliveryAgent.objects.select_for_update()
+                .filter(agent_id__gt=start, agent_id__lte=start + chunk_size)
+                .values_list('agent_id', flat=True)
+            )
+            if agent_ids:
+                rebuild_agent_stats_for(agent_ids)
+        rebuilt += len(agent_ids)
+    logger.success(f"Rebuilt delivery stats for {rebuilt} agents.")
+    return rebuilt
+
+
+def get_agent_stats(agent_id: int):
+    """The agent's dashboard numbers in one query, or None if the agent does not exist."""
+    # A plain COUNT() function rather than the Count aggregate, so the subquery gets no GROUP BY
+    pending = (
+        DeliveryRequest.objects.filter(status="pending", agent__isnull=True)
+        .order_by().annotate(total=Func('request_id', function='COUNT')).values('total')
+    )
+    return (
+        DeliveryAgent.objects.filter(agent_id=agent_id)
+        .values(
+            pending_requests=Coalesce(Subquery(pending, output_field=IntegerField()), 0),
+            accepted_deliveries=Coalesce('stats__accepted_deliveries', 0),
+            completed_deliveries=Coalesce('stats__completed_deliveries', 0),
+            total_earnings=Coalesce('stats__total_earnings', Value(0), output_field=DecimalField()),
+        )
+        .first()
+    )
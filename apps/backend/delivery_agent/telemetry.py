@@ -0,0 +1,260 @@
+"""
+Agent GPS telemetry: location pings buffered in memory and written in batches.
+
+Agents send pings, [unix seconds, latitude, longitude], every few seconds over
+ws/delivery/telemetry/ or in batches to POST /api/delivery-agent/telemetry. They
+are not written one by one: each worker keeps a fixed-size ring buffer per agent
+(NumPy arrays of times and coordinates), and at most every
+DELIVERY_TELEMETRY_FLUSH_SECONDS writes what arrived since the last flush in one
+transaction:
+
+- the first ping of every DELIVERY_TELEMETRY_SAMPLE_SECONDS bucket goes to
+  AgentTrackPoint, so the stored track has a fixed resolution however often the
+  app pings;
+- each agent's newest ping is upserted into AgentPosition, one row per agent,
+  unless the row already holds a newer ping (written by another worker).
+
+There is no background thread: a flush runs on the ingest call that finds it
+due, and when a telemetry socket closes. Pings out of range, not newer than the
+agent's last one or too far in the future are dropped.
+
+Buffers are per process, and batched HTTP ingest can land on any worker, so a
+latest-position query takes the newer of this worker's buffer and AgentPosition.
+The answer is at most one flush interval behind, and a crashed worker loses at
+most one flush interval of pings.
+"""
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from loguru import logger
+from ninja.errors import HttpError
+
+from .models import AgentPosition, AgentTrackPoint
+
+BUFFER_SIZE = getattr(settings, 'DELIVERY_TELEMETRY_BUFFER_SIZE', 64)
+SAMPLE_SECONDS = getattr(settings, 'DELIVERY_TELEMETRY_SAMPLE_SECONDS', 15)
+FLUSH_SECONDS = getattr(settings, 'DELIVERY_TELEMETRY_FLUSH_SECONDS', 5)
+# Buffers of agents that sent nothing for this long are dropped once flushed
+IDLE_SECONDS = getattr(settings, 'DELIVERY_TELEMETRY_IDLE_SECONDS', 600)
+MAX_PINGS = 1000
+MAX_CLOCK_SKEW = 60
+
+
+class RingBuffer:
+    """The last `capacity` pings of one agent, in arrival (and time) order."""
+    __slots__ = ("times", "coordinates", "head", "size", "flushed_until", "sampled_bucket", "touched")
+
+    def __init__(self, capacity: int):
+        self.times = np.zeros(capacity)
+        self.coordinates = np.zeros((capacity, 2))
+        self.head = 0  # slot of the next ping
+        self.size = 0
+        self.flushed_until = -np.inf  # time of the newest ping already flushed
+        self.sampled_bucket = -np.inf  # sample bucket of the newest stored track point
+        self.touched = 0.0
+
+    @property
+    def latest_time(self) -> float:
+        return self.times[self.head - 1] if self.size else -np.inf
+
+    def append(self, times: np.ndarray, coordinates: np.ndarray):
+        capacity = len(self.times)
+        count = len(times)
+        if count == 1:
+            self.times[self.head] = times[0]
+            self.coordinates[self.head] = coordinates[0]
+        else:
+            if count > capacity:
+                times, coordinates, count = times[-capacity:], coordinates[-capacity:], capacity
+            slots = (self.head + np.arange(count)) % capacity
+            self.times[slots] = times
+            self.coordinates[slots] = coordinates
+        self.head = (self.head + count) % capacity
+        self.size = min(self.size + count, capacity)
+
+    def latest(self) -> tuple[float, float, float]:
+        latitude, longitude = self.coordinates[self.head - 1]
+        return float(self.times[self.head - 1]), float(latitude), float(longitude)
+
+    def unflushed(self) -> tuple[np.ndarray, np.ndarray]:
+        """Buffered pings newer than the last flush, oldest first."""
+        if self.size < len(self.times):
+            times, coordinates = self.times[:self.size], self.coordinates[:self.size]
+        else:
+            times = np.concatenate((self.times[self.head:], self.times[:self.head]))
+            coordinates = np.concatenate((self.coordinates[self.head:], self.coordinates[:self.head]))
+        start = np.searchsorted(times, self.flushed_until, side="right")
+        return times[start:], coordinates[start:]
+
+
+def _as_datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+def _save_positions(positions: list[AgentPosition], batch_size: int = 1000):
+    """Insert missing AgentPosition rows and move existing ones forward, never back to an older ping."""
+    AgentPosition.objects.bulk_create(positions, batch_size=batch_size, ignore_conflicts=True)
+    for start in range(0, len(positions), batch_size):
+        batch = positions[start:start + batch_size]
+
+        def newer(field):
+            return Case(
+                *[When(agent_id=position.agent_id, recorded_at__lt=position.recorded_at,
+                       then=Value(getattr(position, field)))
+                  for position in batch],
+                default=F(field), output_field=AgentPosition._meta.get_field(field),
+            )
+
+        # recorded_at goes last: MySQL applies assignments left to right, so the
+        # coordinates must be compared against the old recorded_at
+        AgentPosition.objects.filter(agent_id__in=[position.agent_id for position in batch]).update(
+            latitude=newer('latitude'), longitude=newer('longitude'), recorded_at=newer('recorded_at'),
+        )
+
+
+class TelemetryStore:
+    """The ring buffers of one worker process, keyed by agent id."""
+
+    def __init__(self, buffer_size: int = BUFFER_SIZE, sample_seconds: float = SAMPLE_SECONDS,
+                 flush_seconds: float = FLUSH_SECONDS, idle_seconds: float = IDLE_SECONDS):
+        self.buffer_size = buffer_size
+        self.sample_seconds = sample_seconds
+        self.flush_seconds = flush_seconds
+        self.idle_seconds = idle_seconds
+        self.buffers: dict[int, RingBuffer] = {}
+        self.lock = threading.Lock()
+        self.flushing = False
+        self.last_flush = time.monotonic()
+
+    def ingest(self, agent_id: int, pings, now: Optional[float] = None) -> int:
+        """Buffer an agent's [timestamp, latitude, longitude] pings; returns how many were kept."""
+        now = time.time() if now is None else now
+        try:
+            data = np.asarray(pings, dtype=float)
+        except (TypeError, ValueError):
+            raise HttpError(400, "Pings must be [timestamp, latitude, longitude] triples")
+        if data.ndim != 2 or data.shape[1] != 3:
+            raise HttpError(400, "Pings must be [timestamp, latitude, longitude] triples")
+        if len(data) > MAX_PINGS:
+            raise HttpError(400, f"At most {MAX_PINGS} pings can be sent at once")
+
+        times, latitudes, longitudes = data[:, 0], data[:, 1], data[:, 2]
+        valid = (
+            np.isfinite(data).all(axis=1)
+            & (np.abs(latitudes) <= 90) & (np.abs(longitudes) <= 180)
+            & (times <= now + MAX_CLOCK_SKEW)
+        )
+        data = data[valid]
+        if len(data) > 1:
+            data = data[np.argsort(data[:, 0], kind="stable")]
+            data = data[np.concatenate(([True], np.diff(data[:, 0]) > 0))]
+
+        with self.lock:
+            buffer = self.buffers.get(agent_id)
+            if buffer is None:
+                buffer = self.buffers[agent_id] = RingBuffer(self.buffer_size)
+            data = data[data[:, 0] > buffer.latest_time]
+            if len(data):
+                buffer.append(data[:, 0], data[:, 1:])
+                buffer.touched = now
+        return len(data)
+
+    def latest(self, agent_id: int) -> Optional[tuple[float, float, float]]:
+        """(timestamp, latitude, longitude) of the agent's newest ping seen by this worker."""
+        with self.lock:
+            buffer = self.buffers.get(agent_id)
+            return buffer.latest() if buffer is not None and buffer.size else None
+
+    def flush_due(self) -> bool:
+        return not self.flushing and time.monotonic() - self.last_flush >= self.flush_seconds
+
+    def collect(self, now: float) -> list[tuple]:
+        """Take the pings that arrived since the last flush, marking them flushed."""
+        pending, idle = [], []
+        for agent_id, buffer in self.buffers.items():
+            times, coordinates = buffer.unflushed()
+            if not len(times):
+                if now - buffer.touched >= self.idle_seconds:
+                    idle.append(agent_id)
+                continue
+            buckets = np.floor(times / self.sample_seconds)
+            new = buckets > buffer.sampled_bucket
+            _, first = np.unique(buckets[new], return_index=True)
+            samples = np.flatnonzero(new)[first]
+            pending.append((
+                agent_id, buffer.flushed_until, buffer.sampled_bucket,
+                times[samples], coordinates[samples], buffer.latest(),
+            ))
+            buffer.flushed_until = times[-1]
+            if len(samples):
+                buffer.sampled_bucket = buckets[samples[-1]]
+        for agent_id in idle:
+            del self.buffers[agent_id]
+        return pending
+
+    def flush(self, now: Optional[float] = None) -> int:
+        """Write the pending track points and latest positions; returns the number of agents written."""
+        with self.lock:
+            if self.flushing:
+                return 0
+            self.flushing = True
+            self.last_flush = time.monotonic()
+            pending = self.collect(time.time() if now is None else now)
+        try:
+            if not pending:
+                return 0
+            points = [
+                AgentTrackPoint(agent_id=agent_id, recorded_at=_as_datetime(at), latitude=latitude, longitude=longitude)
+                for agent_id, _, _, times, coordinates, _ in pending
+                for at, (latitude, longitude) in zip(times.tolist(), coordinates.tolist())
+            ]
+            positions = [
+                AgentPosition(agent_id=agent_id, recorded_at=_as_datetime(at), latitude=latitude, longitude=longitude)
+                for agent_id, _, _, _, _, (at, latitude, longitude) in pending
+            ]
+            with transaction.atomic():
+                AgentTrackPoint.objects.bulk_create(points, batch_size=1000)
+                _save_positions(positions)
+            logger.debug(f"Flushed telemetry of {len(positions)} agents ({len(points)} track points).")
+            return len(positions)
+        except Exception as e:
+            logger.error(f"Failed to flush telemetry of {len(pending)} agents, keeping it for the next flush: {e}")
+            with self.lock:
+                for agent_id, flushed_until, sampled_bucket, times, _, (latest_at, _, _) in pending:
+                    buffer = self.buffers.get(agent_id)
+                    if buffer is not None and buffer.flushed_until == latest_at:
+                        buffer.flushed_until, buffer.sampled_bucket = flushed_until, sampled_bucket
+            return 0
+        finally:
+            self.flushing = False
+
+
+telemetry = TelemetryStore()
+
+
+def record_pings(agent_id: int, pings) -> int:
+    """Buffer an agent's pings and flush if one is due; returns how many were kept."""
+    accepted = telemetry.ingest(agent_id, pings)
+    if telemetry.flush_due():
+        telemetry.flush()
+    return accepted
+
+
+def latest_position(agent_id: int) -> Optional[dict]:
+    """The agent's newest known position: this worker's buffer or the last flush, whichever is newer."""
+    stored = (
+        AgentPosition.objects.filter(agent_id=agent_id)
+        .values('latitude', 'longitude', 'recorded_at').first()
+    )
+    latest = telemetry.latest(agent_id)
+    if latest is not None:
+        at, latitude, longitude = latest
+        if stored is None or at > stored["recorded_at"].timestamp():
+            return {"latitude": latitude, "longitude": longitude, "recorded_at": _as_datetime(at)}
+    return stored
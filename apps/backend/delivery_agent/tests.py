@@ -1,3 +1,901 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import JsonResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken  # type: ignore
+from ninja.errors import HttpError
+
+from backend.auth import DELIVERY_AGENT, authenticate_token_cached, get_principal
+from backend.revocation import revocations
+from products.models import Category, Product
+from users.models import Address, Role, UserProfile
+
+from .database import (
+    accept_delivery_request, create_delivery_agent, create_delivery_request, create_delivery_requests, generate_tokens, get_available_agents,
+    serialize_delivery_agent, update_delivery_status,
+)
+from . import events, routing
+from .geocoding import candidate_keys, geocode_many
+from .middleware import DeliveryAgentAuthMiddleware
+from .matching import get_agent_profile, rebuild_matching_index
+from .models import (
+    AgentPosition, AgentStats, AgentTrackPoint, DeliveryAgent, DeliveryRequest, DeliveryStatusEvent, Geocode,
+    OpenDeliveryRequest, SlaBreach, SlaWatermark,
+)
+from .pricing import get_tariff
+from .schemas import DeliveryAgentSignup, DeliveryRequestIn
+from .sla import open_breaches, run_sla_scan
+from .telemetry import TelemetryStore, latest_position, telemetry
+from .stats import get_agent_stats, rebuild_agent_stats
+
+REQUESTS_PER_STATUS = 5
+CONTENDERS = 200
+
+
+class DeliveryAgentTestCase(TestCase):
+    """An approved agent with REQUESTS_PER_STATUS pending, accepted and completed requests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(role_name="user")
+        category = Category.objects.create(category_name="Books")
+        cls.buyer = UserProfile.objects.create(
+            first_name="Bea", last_name="Buyer", email="buyer@example.com", user_type="user",
+            joined_date=date(2024, 1, 1), address=Address.objects.create(postal_code="36037"), role=role,
+        )
+        seller = UserProfile.objects.create(
+            first_name="Sam", last_name="Seller", email="seller@example.com", user_type="user",
+            joined_date=date(2024, 1, 1), role=role,
+        )
+        cls.agent = DeliveryAgent.objects.create(
+            first_name="Alex", last_name="Agent", email="agent@example.com", password="x",
+            phone_number="0151000000", transport_mode="bike", joined_date=date(2024, 1, 1),
+            approval_status="approved",
+        )
+        for status, agent in (("pending", None), ("accepted", cls.agent), ("completed", cls.agent)):
+            for _ in range(REQUESTS_PER_STATUS):
+                product = Product.objects.create(
+                    name="Book", description="A book", price=10.0, condition="good",
+                    seller=seller, category=category, status="Sold", approve_status="approved",
+                )
+                DeliveryRequest.objects.create(
+                    agent=agent, product_id=product.product_id, seller_id=seller.user_id,
+                    buyer_id=cls.buyer.user_id, dropoff_location="A", pickup_location="B", status=status,
+                )
+        rebuild_matching_index()
+        rebuild_agent_stats()
+
+    def setUp(self):
+        # Warm the auth caches so only the endpoint's own queries are counted
+        cache.clear()
+        revocations.rebuild()
+        get_principal(DELIVERY_AGENT, self.agent.agent_id)
+        get_agent_profile(self.agent.agent_id)
+        access_token, _ = generate_tokens(self.agent)
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {access_token}"}
+
+
+class DeliveryRequestListQueryTests(DeliveryAgentTestCase):
+    """Listing endpoints must cost a fixed number of queries, however many requests they return."""
+
+    def assertListQueries(self, url, expected_queries, expected_items, **headers):
+        with self.assertNumQueries(expected_queries):
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(len(body), expected_items)
+        self.assertTrue(all(item["product"]["name"] == "Book" for item in body))
+
+    def test_pending_requests(self):
+        # matched requests, products
+        self.assertListQueries(
+            f"/api/delivery-agent/pending-requests/{self.agent.agent_id}", 2, REQUESTS_PER_STATUS, **self.auth
+        )
+
+    def test_accepted_deliveries(self):
+        self.assertListQueries(
+            f"/api/delivery-agent/accepted-deliveries/{self.agent.agent_id}", 2, 2 * REQUESTS_PER_STATUS, **self.auth
+        )
+
+    def test_previous_deliveries_for_agent(self):
+        self.assertListQueries(
+            f"/api/delivery-agent/previous-deliveries/{self.agent.agent_id}", 2, REQUESTS_PER_STATUS, **self.auth
+        )
+
+    def test_previous_deliveries_for_user(self):
+        # user check, requests, products
+        self.assertListQueries(f"/api/users/{self.buyer.user_id}", 3, 3 * REQUESTS_PER_STATUS)
+
+    def test_history_pages_by_cursor(self):
+        url = f"/api/delivery-agent/accepted-deliveries/{self.agent.agent_id}?limit=3"
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(2):
+                response = self.client.get(url + (f"&cursor={cursor}" if cursor else ""), **self.auth)
+            self.assertEqual(response.status_code, 200)
+            seen += [(item["request_date"], item["request_id"]) for item in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 2 * REQUESTS_PER_STATUS)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+        response = self.client.get(url + "&cursor=bogus", **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+    def test_history_date_range(self):
+        today = timezone.localdate()
+        url = f"/api/users/{self.buyer.user_id}"
+        self.assertEqual(len(self.client.get(f"{url}?from={today}&to={today}").json()), 3 * REQUESTS_PER_STATUS)
+        self.assertEqual(self.client.get(f"{url}?to={today - timedelta(days=1)}").json(), [])
+        self.assertEqual(self.client.get(f"{url}?from={today + timedelta(days=1)}").json(), [])
+
+    def test_order_details(self):
+        request_id = DeliveryRequest.objects.values_list("request_id", flat=True).first()
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/users/orders/{request_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["product"]["name"], "Book")
+
+
+class AgentStatsTests(DeliveryAgentTestCase):
+    """The dashboard stats come from the rollup in one query and follow every transition."""
+
+    def test_stats_endpoint_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/delivery-agent/stats/{self.agent.agent_id}", **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "pending_requests": REQUESTS_PER_STATUS,
+            "accepted_deliveries": REQUESTS_PER_STATUS,
+            "completed_deliveries": REQUESTS_PER_STATUS,
+            "total_earnings": 0.0,
+        })
+
+    def test_rollup_follows_accept_and_complete(self):
+        pending = DeliveryRequest.objects.filter(status="pending").first()
+        DeliveryRequest.objects.filter(pk=pending.pk).update(delivery_fee=7.5)
+        accept_delivery_request(pending.request_id, self.agent.agent_id)
+        update_delivery_status(pending.request_id, "delivered")
+
+        stats = get_agent_stats(self.agent.agent_id)
+        self.assertEqual(
+            (stats["pending_requests"], stats["accepted_deliveries"], stats["completed_deliveries"]),
+            (REQUESTS_PER_STATUS - 1, REQUESTS_PER_STATUS, REQUESTS_PER_STATUS + 1),
+        )
+        self.assertEqual(float(stats["total_earnings"]), 7.5)
+        rebuild_agent_stats()
+        self.assertEqual(get_agent_stats(self.agent.agent_id), stats)
+
+
+class DeliveryQuoteTests(DeliveryAgentTestCase):
+    """Batch quotes follow the tariff formula, and new requests store the quoted fee."""
+
+    def expected_fee(self, mode, size, road_km, hour=None, weekday=None):
+        tariff = get_tariff()
+        m = tariff.modes[mode]
+        fee = (tariff.base[m] + tariff.per_km[m] * road_km) * tariff.size_multipliers[tariff.sizes[size]]
+        if hour is not None:
+            fee *= tariff.hour_multipliers[hour] * tariff.weekday_multipliers[weekday]
+        return round(min(max(fee, tariff.min_fee[m]), tariff.max_fee[m]), 2)
+
+    def test_batch_quote(self):
+        product = Product.objects.first()
+        saturday_evening = "2025-06-07T19:00:00Z"
+        options = [
+            {"product_id": product.product_id, "pickup_location": "36037", "dropoff_location": "Petersberg",
+             "delivery_mode": mode, "delivery_date_time": saturday_evening}
+            for mode in get_tariff().modes
+        ] + [{"pickup_location": "Nowhere", "dropoff_location": "B", "size": "bulky"}]
+
+        # products, geocodes
+        with self.assertNumQueries(2):
+            response = self.client.post("/api/delivery-agent/quote", {"options": options},
+                                        content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        lines = response.json()["options"]
+        self.assertEqual([line["index"] for line in lines], list(range(len(options))))
+        road_km = lines[0]["distance_km"]
+        self.assertGreater(road_km, 0)
+        for line in lines[:-1]:
+            self.assertEqual(line["size"], "small")  # Books
+            # distance_km is rounded, so allow a cent either way
+            self.assertAlmostEqual(line["fee"], self.expected_fee(line["delivery_mode"], "small", road_km, 19, 5),
+                                   delta=0.011)
+        fallback = lines[-1]
+        self.assertIsNone(fallback["distance_km"])
+        self.assertEqual(fallback["fee"], self.expected_fee("standard", "bulky", get_tariff().fallback_distance_km))
+
+    def test_quote_rejects_unknown_mode(self):
+        response = self.client.post("/api/delivery-agent/quote",
+                                    {"options": [{"dropoff_location": "A", "delivery_mode": "drone"}]},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_created_request_stores_server_fee(self):
+        first = Product.objects.first()
+        product = Product.objects.create(
+            name="Book", description="A book", price=10.0, condition="good",
+            seller_id=first.seller_id, category_id=first.category_id, status="Sold", approve_status="approved",
+        )
+        created = create_delivery_request(DeliveryRequestIn(
+            product_id=product.product_id, pickup_location="36037", dropoff_location="36037",
+            buyer_id=self.buyer.user_id, delivery_fee=0.01, delivery_mode="express",
+            delivery_date_time=datetime(2025, 6, 4, 12, tzinfo=dt_timezone.utc),
+        ))
+        expected = self.expected_fee("express", "small", 0.0, 12, 2)
+        self.assertEqual(float(created["delivery_fee"]), expected)
+        self.assertEqual(float(DeliveryRequest.objects.get(pk=created["request_id"]).delivery_fee), expected)
+
+
+class BatchDeliveryRequestTests(DeliveryAgentTestCase):
+    """A multi-item checkout creates all its requests with a fixed number of queries."""
+
+    def new_products(self, count):
+        template = Product.objects.first()
+        return [
+            Product.objects.create(
+                name="Book", description="A book", price=10.0, condition="good", location="36037",
+                seller_id=template.seller_id, category_id=template.category_id, status="Sold", approve_status="approved",
+            )
+            for _ in range(count)
+        ]
+
+    def entries(self, products):
+        return [
+            DeliveryRequestIn(product_id=product.product_id, pickup_location="36037", dropoff_location="Petersberg",
+                              buyer_id=self.buyer.user_id)
+            for product in products
+        ]
+
+    def test_query_count_does_not_grow_with_batch(self):
+        counts = []
+        for size in (1, 4):
+            entries = self.entries(self.new_products(size))
+            with CaptureQueriesContext(connection) as queries:
+                created = create_delivery_requests(entries)
+            counts.append(len(queries))
+            self.assertEqual([item["product_id"] for item in created], [entry.product_id for entry in entries])
+        self.assertEqual(counts[0], counts[1])
+
+        request_ids = [item["request_id"] for item in created]
+        self.assertEqual(OpenDeliveryRequest.objects.filter(request_id__in=request_ids).count(), 4)
+        self.assertEqual(
+            DeliveryStatusEvent.objects.filter(request_id__in=request_ids, from_status=None, to_status="pending").count(), 4
+        )
+        self.assertTrue(all(item["product"]["name"] == "Book" and float(item["delivery_fee"]) > 0 for item in created))
+
+    def test_batch_is_validated_up_front(self):
+        products = self.new_products(2)
+        taken = DeliveryRequest.objects.first().product_id
+        for entries, status in (
+            (self.entries([products[0], products[0]]), 400),
+            (self.entries(products) + [DeliveryRequestIn(product_id=taken, pickup_location="A", dropoff_location="B",
+                                                         buyer_id=self.buyer.user_id)], 409),
+        ):
+            with self.assertRaises(HttpError) as raised:
+                create_delivery_requests(entries)
+            self.assertEqual(raised.exception.status_code, status)
+        self.assertFalse(DeliveryRequest.objects.filter(product_id__in=[p.product_id for p in products]).exists())
+
+        response = self.client.post(
+            "/api/delivery-agent/create-delivery-requests",
+            {"requests": [{"product_id": 10 ** 9, "pickup_location": "A", "dropoff_location": "B",
+                           "buyer_id": self.buyer.user_id}]},
+            content_type="application/json", HTTP_X_CSRFTOKEN="unchecked", **self.auth,
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_duplicates_are_reported_once_each(self):
+        first, second, third = self.new_products(3)
+        entries = self.entries([second, first, second, third, first, second])
+        with self.assertRaises(HttpError) as raised:
+            create_delivery_requests(entries)
+        self.assertEqual(raised.exception.status_code, 400)
+        self.assertEqual(str(raised.exception), f"Products listed more than once: {[first.product_id, second.product_id]}")
+
+
+class AgentAvailabilityTests(DeliveryAgentTestCase):
+    """Schedules are stored canonically and "who is free when" is one indexed query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        created = create_delivery_agent(DeliveryAgentSignup(
+            first_name="Fay", last_name="Free", email="free@example.com", password="secret",
+            phone_number="0151000001", transport_mode="car", category_ids=["2", "1", "x"],
+            day_of_week=["Fri", "Monday"], time_slot=[[3], [2, 1]],
+        ))
+        cls.free_agent_id = created["agent_id"]
+        DeliveryAgent.objects.filter(pk=cls.free_agent_id).update(approval_status="approved")
+
+    def test_schedule_is_stored_canonically(self):
+        agent = DeliveryAgent.objects.get(pk=self.free_agent_id)
+        self.assertEqual(
+            (agent.category_ids, agent.day_of_week, agent.time_slot),
+            (["1", "2"], ["Monday", "Friday"], [[1, 2], [3]]),
+        )
+        # Monday's back-to-back slots 8-12 and 12-16 are one window
+        self.assertEqual(len(get_agent_profile(self.free_agent_id)[1]), 2)
+
+    def test_available_agents(self):
+        monday = datetime(2025, 6, 2, tzinfo=dt_timezone.utc)
+
+        def available(at, until=None):
+            return get_available_agents(monday + at, monday + until if until else None)["agent_ids"]
+
+        with self.assertNumQueries(1):
+            self.assertEqual(available(timedelta(hours=10)), [self.free_agent_id])
+        self.assertEqual(available(timedelta(hours=10), timedelta(hours=15)), [self.free_agent_id])
+        self.assertEqual(available(timedelta(hours=15), timedelta(hours=17)), [])
+        self.assertEqual(available(timedelta(hours=16)), [])
+        self.assertEqual(available(timedelta(days=4, hours=17)), [self.free_agent_id])
+
+        DeliveryAgent.objects.filter(pk=self.free_agent_id).update(approval_status="pending")
+        self.assertEqual(available(timedelta(hours=10)), [])
+
+    def test_available_endpoint(self):
+        response = self.client.get("/api/delivery-agent/available?at=2025-06-02T10:00:00Z", **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["agent_ids"], [self.free_agent_id])
+        response = self.client.get(
+            "/api/delivery-agent/available?at=2025-06-02T10:00:00Z&until=2025-06-03T10:00:00Z", **self.auth
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class AgentReviewTests(DeliveryAgentTestCase):
+    """Reviews live in their own table; the agent payload only carries the rollup's aggregate."""
+
+    def review(self, request, rating, user_id=None):
+        return self.client.post(
+            f"/api/users/orders/{request.request_id}/review",
+            {"user_id": user_id or self.buyer.user_id, "rating": rating, "comment": "ok"},
+            content_type="application/json",
+        )
+
+    def test_reviews_update_rollup_and_page(self):
+        completed = list(DeliveryRequest.objects.filter(status="completed").order_by('request_id'))
+        for request, rating in zip(completed, [5, 4, 3, 5, 4]):
+            self.assertEqual(self.review(request, rating).status_code, 201)
+
+        stats = AgentStats.objects.get(agent=self.agent)
+        self.assertEqual((stats.review_count, stats.rating_sum, stats.average_rating), (5, 21, 4.2))
+        self.assertEqual(DeliveryRequest.objects.get(pk=completed[0].pk).delivery_rating, 5)
+        serialized = serialize_delivery_agent(DeliveryAgent.objects.select_related('stats').get(pk=self.agent.pk))
+        self.assertEqual((serialized["review_count"], serialized["average_rating"]), (5, 4.2))
+        self.assertNotIn("reviews", serialized)
+        rebuild_agent_stats()
+        self.assertEqual(AgentStats.objects.get(agent=self.agent).rating_sum, 21)
+
+        url = f"/api/delivery-agent/reviews/{self.agent.agent_id}?limit=2"
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(url + (f"&cursor={cursor}" if cursor else ""), **self.auth)
+            self.assertEqual(response.status_code, 200)
+            seen += [review["review_id"] for review in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(seen), 5)
+
+    def test_review_rules(self):
+        completed = DeliveryRequest.objects.filter(status="completed").first()
+        pending = DeliveryRequest.objects.filter(status="pending").first()
+        self.assertEqual(self.review(completed, 4, user_id=self.buyer.user_id + 1000).status_code, 403)
+        self.assertEqual(self.review(pending, 4).status_code, 400)
+        self.assertEqual(self.review(completed, 6).status_code, 422)
+        self.assertEqual(self.review(completed, 4).status_code, 201)
+        self.assertEqual(self.review(completed, 4).status_code, 409)
+        self.assertEqual(AgentStats.objects.get(agent=self.agent).review_count, 1)
+
+
+class SlaScanTests(DeliveryAgentTestCase):
+    """The scan records each overdue stint once and only reads past its watermark."""
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        pending = list(DeliveryRequest.objects.filter(status="pending").order_by('request_id'))
+        # Two pending requests are past the 24h warning, one also past the 72h escalation
+        for request, hours in zip(pending, [100, 30, 2, 1, 1]):
+            request.status_changed_at = self.now - timedelta(hours=hours)
+            request.save(update_fields=["status_changed_at"])
+        self.overdue = pending[:2]
+        DeliveryRequest.objects.exclude(status="pending").update(status_changed_at=self.now)
+
+    def test_breaches_are_recorded_once(self):
+        run = run_sla_scan(now=self.now)
+        self.assertEqual((run.warnings, run.escalations, run.caught_up), (2, 1, True))
+        watermark = SlaWatermark.objects.get(rule="pending:warning")
+        self.assertEqual(watermark.last_request_id, self.overdue[1].request_id)
+
+        run = run_sla_scan(now=self.now + timedelta(minutes=5))
+        self.assertEqual((run.warnings, run.escalations), (0, 0))
+        self.assertEqual(SlaBreach.objects.count(), 3)
+
+        escalated = open_breaches(level="escalated")
+        self.assertEqual([b["request_id"] for b in escalated], [self.overdue[0].request_id])
+        response = self.client.get("/api/moderator/delivery-sla-breaches?level=warning")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+        # Leaving the status closes the breach; coming back later is a new stint
+        DeliveryRequest.objects.filter(pk=self.overdue[0].pk).update(status="accepted", status_changed_at=self.now)
+        self.assertEqual(len(open_breaches(level="escalated")), 0)
+        DeliveryRequest.objects.filter(pk=self.overdue[0].pk).update(
+            status="pending", status_changed_at=self.now + timedelta(minutes=1)
+        )
+        run_sla_scan(now=self.now + timedelta(hours=25))
+        self.assertEqual(SlaBreach.objects.filter(request=self.overdue[0], level="warning").count(), 2)
+
+    def test_small_batches_catch_up_over_runs(self):
+        run = run_sla_scan(now=self.now, batch_size=1)
+        self.assertFalse(run.caught_up)
+        self.assertIsNotNone(run.max_lag_seconds)
+        run = run_sla_scan(now=self.now, batch_size=1)
+        self.assertEqual(run.warnings, 1)
+        run = run_sla_scan(now=self.now, batch_size=1)
+        self.assertTrue(run.caught_up)
+        self.assertEqual(SlaBreach.objects.filter(level="warning").count(), 2)
+
+    def test_legacy_rows_are_all_scanned(self):
+        # More legacy rows than fit in one batch, older than where the first batch leaves the watermark
+        legacy = DeliveryRequest.objects.filter(status="pending").exclude(pk__in=[r.pk for r in self.overdue])
+        legacy.update(status_changed_at=None, request_date=self.now - timedelta(hours=200))
+        migration = importlib.import_module("delivery_agent.migrations.0009_sla_scanner")
+        migration.backfill_entered_at(django_apps, None)
+        self.assertFalse(DeliveryRequest.objects.filter(status_changed_at__isnull=True).exists())
+
+        runs = [run_sla_scan(now=self.now, batch_size=1) for _ in range(REQUESTS_PER_STATUS + 1)]
+        self.assertTrue(runs[-1].caught_up)
+        self.assertEqual(SlaBreach.objects.filter(level="warning").count(), REQUESTS_PER_STATUS)
+
+
+class TelemetryTests(DeliveryAgentTestCase):
+    """Pings are buffered per agent and written as downsampled track points plus one position row."""
+
+    def setUp(self):
+        super().setUp()
+        telemetry.buffers.clear()
+        self.now = timezone.now().timestamp()
+
+    def test_ring_buffer_keeps_newest_pings_in_order(self):
+        store = TelemetryStore(buffer_size=4)
+        agent_id = self.agent.agent_id
+        self.assertEqual(store.ingest(agent_id, [[self.now - 60 + k, 52.0, 13.0 + k] for k in range(3)], now=self.now), 3)
+        self.assertEqual(store.ingest(agent_id, [[self.now - 50, 52.0, 14.0]], now=self.now), 1)
+        self.assertEqual(store.ingest(agent_id, [[self.now - 40, 52.0, 15.0], [self.now - 45, 52.0, 14.5]], now=self.now), 2)
+        # Out of range, older than the newest ping, or from the future
+        rejected = [[self.now - 30, 91.0, 13.0], [self.now - 100, 52.0, 13.0], [self.now + 3600, 52.0, 13.0]]
+        self.assertEqual(store.ingest(agent_id, rejected, now=self.now), 0)
+
+        times, coordinates = store.buffers[agent_id].unflushed()
+        self.assertEqual(times.tolist(), [self.now - 58, self.now - 50, self.now - 45, self.now - 40])
+        self.assertEqual(coordinates[:, 1].tolist(), [15.0, 14.0, 14.5, 15.0])
+        self.assertEqual(store.latest(agent_id), (self.now - 40, 52.0, 15.0))
+        with self.assertRaises(HttpError):
+            store.ingest(agent_id, [[1.0, 2.0]], now=self.now)
+
+    def test_flush_downsamples_and_upserts_position(self):
+        store = TelemetryStore(sample_seconds=10)
+        start = (self.now // 10) * 10 - 100
+        store.ingest(self.agent.agent_id, [[start + k, 52.0, 13.0 + k / 100] for k in range(0, 30, 2)], now=self.now)
+        self.assertEqual(store.flush(now=self.now), 1)
+        self.assertEqual(AgentTrackPoint.objects.count(), 3)
+        # The next flush only samples buckets that have no track point yet
+        store.ingest(self.agent.agent_id, [[start + 29, 52.0, 14.0], [start + 31, 52.0, 14.5]], now=self.now)
+        self.assertEqual(store.flush(now=self.now), 1)
+        self.assertEqual(AgentTrackPoint.objects.count(), 4)
+        position = AgentPosition.objects.get(agent=self.agent)
+        self.assertEqual((position.longitude, position.recorded_at.timestamp()), (14.5, start + 31))
+        self.assertEqual(store.flush(now=self.now), 0)
+        # Flushed buffers of agents that went quiet are dropped
+        store.flush(now=self.now + store.idle_seconds)
+        self.assertEqual(store.buffers, {})
+
+    def test_buyer_sees_latest_location(self):
+        accepted = DeliveryRequest.objects.filter(status="accepted").first()
+        pending = DeliveryRequest.objects.filter(status="pending").first()
+        buyer = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(self.buyer).access_token}"}
+        url = f"/api/users/orders/{accepted.request_id}/location"
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, **buyer).status_code, 404)
+        self.assertEqual(self.client.get(f"/api/users/orders/{pending.request_id}/location", **buyer).status_code, 409)
+
+        response = self.client.post(
+            "/api/delivery-agent/telemetry", {"pings": [[self.now - 5, 52.52, 13.40], [self.now - 1, 52.53, 13.41]]},
+            content_type="application/json", HTTP_X_CSRFTOKEN="unchecked", **self.auth,
+        )
+        self.assertEqual(response.json(), {"accepted": 2})
+        response = self.client.get(url, **buyer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["latitude"], response.json()["agent_id"]), (52.53, self.agent.agent_id))
+        self.assertEqual(self.client.get(url, **self.auth).status_code, 200)
+
+        # Another worker only knows what was flushed
+        telemetry.flush()
+        telemetry.buffers.clear()
+        self.assertEqual(self.client.get(url, **buyer).json()["longitude"], 13.41)
+
+    def test_older_pings_never_replace_a_newer_position(self):
+        fresh = AgentPosition.objects.create(agent=self.agent, latitude=52.6, longitude=13.5,
+                                             recorded_at=timezone.now())
+        # A worker that still buffers an older ping neither answers with it nor writes it over the row
+        stale = TelemetryStore()
+        stale.ingest(self.agent.agent_id, [[self.now - 120, 52.0, 13.0]], now=self.now)
+        with mock.patch("delivery_agent.telemetry.telemetry", stale):
+            self.assertEqual(latest_position(self.agent.agent_id)["latitude"], 52.6)
+        self.assertEqual(stale.flush(now=self.now), 1)
+        position = AgentPosition.objects.get(agent=self.agent)
+        self.assertEqual((position.latitude, position.recorded_at), (52.6, fresh.recorded_at))
+
+        stale.ingest(self.agent.agent_id, [[self.now + 1, 52.7, 13.6]], now=self.now + 1)
+        with mock.patch("delivery_agent.telemetry.telemetry", stale):
+            self.assertEqual(latest_position(self.agent.agent_id)["latitude"], 52.7)
+        stale.flush(now=self.now + 1)
+        position = AgentPosition.objects.get(agent=self.agent)
+        self.assertEqual((position.latitude, position.longitude, position.recorded_at.timestamp()),
+                         (52.7, 13.6, self.now + 1))
+
+    def test_location_is_only_shown_to_the_parties(self):
+        accepted = DeliveryRequest.objects.filter(status="accepted").first()
+        AgentPosition.objects.create(agent=self.agent, latitude=52.5, longitude=13.4, recorded_at=timezone.now())
+        stranger = UserProfile.objects.create(
+            first_name="Sid", last_name="Stranger", email="stranger@example.com", user_type="user",
+            joined_date=date(2024, 1, 1), role=self.buyer.role,
+        )
+        other_agent = DeliveryAgent.objects.create(
+            first_name="Olga", last_name="Other", email="other@example.com", password="x",
+            phone_number="0151000001", transport_mode="car", joined_date=date(2024, 1, 1), approval_status="approved",
+        )
+        url = f"/api/users/orders/{accepted.request_id}/location"
+        for token in (str(RefreshToken.for_user(stranger).access_token), generate_tokens(other_agent)[0]):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f"Bearer {token}").status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer not-a-jwt").status_code, 401)
+
+
+class DeliveryEventTests(DeliveryAgentTestCase):
+    """Events go out only once their transaction commits, and only to the groups that should hear them."""
+
+    def subscribe(self, groups):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        for group in groups:
+            async_to_sync(layer.group_add)(group, channel)
+        return channel
+
+    def received(self, channel):
+        layer = get_channel_layer()
+
+        async def drain():
+            messages = []
+            while True:
+                try:
+                    messages.append(await asyncio.wait_for(layer.receive(channel), 0.05))
+                except asyncio.TimeoutError:
+                    return messages
+        return async_to_sync(drain)()
+
+    def create_request(self):
+        template = Product.objects.first()
+        product = Product.objects.create(
+            name="Book", description="A book", price=10.0, condition="good",
+            seller_id=template.seller_id, category_id=template.category_id, status="Sold", approve_status="approved",
+        )
+        return create_delivery_request(DeliveryRequestIn(
+            product_id=product.product_id, pickup_location="B", dropoff_location="A", buyer_id=self.buyer.user_id,
+        )), product.category_id
+
+    def test_nothing_is_sent_on_rollback(self):
+        channel = self.subscribe([events.ALL_JOBS_GROUP])
+        with mock.patch.object(events, "_send") as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(RuntimeError):
+                    with transaction.atomic():
+                        self.create_request()
+                        raise RuntimeError("checkout failed")
+            send.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                self.create_request()
+            send.assert_not_called()
+            for callback in callbacks:
+                callback()
+            self.assertEqual(
+                sorted(call.args[1]["type"] for call in send.call_args_list), ["job.opened", "order.status"],
+            )
+        self.assertEqual(self.received(channel), [])
+
+    def test_jobs_reach_the_agents_of_their_category(self):
+        category_id = Product.objects.first().category_id
+        other_category = Category.objects.create(category_name="Garden").category_id
+        same = self.subscribe(events.agent_job_groups([category_id]))
+        other = self.subscribe(events.agent_job_groups([other_category]))
+        every = self.subscribe(events.agent_job_groups([]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            created, _ = self.create_request()
+        opened = [m for m in self.received(same) if m["type"] == "job.opened"]
+        self.assertEqual([m["request_id"] for m in opened], [created["request_id"]])
+        self.assertEqual([m["request_id"] for m in self.received(every)], [created["request_id"]])
+        self.assertEqual(self.received(other), [])
+
+        order = self.subscribe([events.order_group(created["request_id"])])
+        with self.captureOnCommitCallbacks(execute=True):
+            accept_delivery_request(created["request_id"], self.agent.agent_id)
+        self.assertEqual([m["type"] for m in self.received(same)], ["job.taken"])
+        self.assertEqual([(m["type"], m["status"]) for m in self.received(order)], [("order.status", "accepted")])
+
+
+class DeliveryTimelineTests(DeliveryAgentTestCase):
+    """The timeline lists transitions oldest first and is only shown to the agent assigned to the request."""
+
+    def test_transitions_in_order(self):
+        product = Product.objects.create(
+            name="Book", description="A book", price=10.0, condition="good", seller_id=Product.objects.first().seller_id,
+            category_id=Product.objects.first().category_id, status="Sold", approve_status="approved",
+        )
+        request_id = create_delivery_request(DeliveryRequestIn(
+            product_id=product.product_id, pickup_location="B", dropoff_location="A", buyer_id=self.buyer.user_id,
+        ))["request_id"]
+        accept_delivery_request(request_id, self.agent.agent_id)
+        update_delivery_status(request_id, "out_for_delivery")
+        update_delivery_status(request_id, "delivered")
+
+        timeline = self.client.get(f"/api/users/orders/{request_id}/timeline").json()
+        self.assertEqual(
+            [(event["from_status"], event["status"]) for event in timeline],
+            [(None, "pending"), ("pending", "accepted"), ("accepted", "out_for_delivery"), ("out_for_delivery", "completed")],
+        )
+        self.assertIsNone(timeline[0]["seconds_in_previous"])
+        self.assertTrue(all(event["seconds_in_previous"] >= 0 for event in timeline[1:]))
+        self.assertEqual([event["agent_id"] for event in timeline[1:]], [self.agent.agent_id] * 3)
+        agent_view = self.client.get(f"/api/delivery-agent/timeline/{request_id}", **self.auth)
+        self.assertEqual(agent_view.json(), timeline)
+
+    def test_requests_from_before_the_log_fall_back_to_request_date(self):
+        legacy = DeliveryRequest.objects.filter(status="accepted").first()
+        DeliveryRequest.objects.filter(pk=legacy.pk).update(
+            status_changed_at=None, request_date=timezone.now() - timedelta(hours=2),
+        )
+        self.assertEqual(self.client.get(f"/api/users/orders/{legacy.request_id}/timeline").json(), [])
+
+        update_delivery_status(legacy.request_id, "out_for_delivery")
+        timeline = self.client.get(f"/api/users/orders/{legacy.request_id}/timeline").json()
+        self.assertEqual([(event["from_status"], event["status"]) for event in timeline], [("accepted", "out_for_delivery")])
+        self.assertAlmostEqual(timeline[0]["seconds_in_previous"], 7200, delta=60)
+
+    def test_other_agents_requests_are_not_found(self):
+        other = DeliveryAgent.objects.create(
+            first_name="Olga", last_name="Other", email="other@example.com", password="x",
+            phone_number="0151000001", transport_mode="car", joined_date=date(2024, 1, 1), approval_status="approved",
+        )
+        access_token, _ = generate_tokens(other)
+        request = DeliveryRequest.objects.filter(status="accepted").first()
+        url = f"/api/delivery-agent/timeline/{request.request_id}"
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f"Bearer {access_token}").status_code, 404)
+        self.assertEqual(self.client.get(url, **self.auth).status_code, 200)
+        self.assertEqual(self.client.get("/api/delivery-agent/timeline/999999", **self.auth).status_code, 404)
+        self.assertEqual(self.client.get("/api/users/orders/999999/timeline").status_code, 404)
+
+
+class AgentAuthMiddlewareTests(DeliveryAgentTestCase):
+    """Agent API requests need a CSRF token when unsafe and an approved agent's bearer token, in both stacks."""
+
+    URL = "/api/delivery-agent/accepted-deliveries/{}"
+
+    def setUp(self):
+        super().setUp()
+        self.url = self.URL.format(self.agent.agent_id)
+
+    def reject(self, response, status, error):
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(json.loads(response.content), {"error": error})
+
+    def test_missing_or_invalid_token(self):
+        self.reject(self.client.get(self.url), 401, "Authentication required")
+        self.reject(self.client.get(self.url, HTTP_AUTHORIZATION="Token abc"), 401, "Authentication required")
+        response = self.client.get(self.url, HTTP_AUTHORIZATION="Bearer not-a-jwt")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.get(self.url, **self.auth).status_code, 200)
+
+    def test_unapproved_agent(self):
+        DeliveryAgent.objects.filter(pk=self.agent.pk).update(approval_status="pending")
+        cache.clear()
+        self.reject(self.client.get(self.url, **self.auth), 403, "Account is not approved")
+
+    def test_unsafe_methods_need_csrf(self):
+        pending = DeliveryRequest.objects.filter(status="pending").first()
+        url = f"/api/delivery-agent/accept-request/{pending.request_id}/{self.agent.agent_id}"
+        self.reject(self.client.post(url, **self.auth), 403, "CSRF token missing")
+        checked = Client(enforce_csrf_checks=True)
+        self.reject(checked.post(url, HTTP_X_CSRFTOKEN="forged", **self.auth), 403, "CSRF token validation failed")
+        self.assertEqual(DeliveryRequest.objects.get(pk=pending.pk).status, "pending")
+
+    def test_public_paths_pass_through(self):
+        self.assertEqual(self.client.get("/api/delivery-agent/csrf-token").status_code, 200)
+        response = self.client.post("/api/delivery-agent/quote", {"options": [{"dropoff_location": "A"}]},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post("/api/delivery-agent/login", {"email": "agent@example.com", "password": "wrong"},
+                                    content_type="application/json")
+        # Rejected by the login endpoint itself, not by the middleware
+        self.assertIn("detail", response.json())
+        # Preflights reach the API, which has no OPTIONS handler
+        self.assertEqual(self.client.options(self.url).status_code, 405)
+
+    def test_async_path(self):
+        seen = []
+
+        async def view(request):
+            seen.append(getattr(request, "delivery_agent", None))
+            return JsonResponse({})
+
+        middleware = DeliveryAgentAuthMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        factory = RequestFactory()
+        call = async_to_sync(middleware)
+
+        self.reject(call(factory.get(self.url)), 401, "Authentication required")
+        self.assertEqual(call(factory.get(self.url, HTTP_AUTHORIZATION="Bearer not-a-jwt")).status_code, 401)
+        self.reject(call(factory.post(self.url, **self.auth)), 403, "CSRF token missing")
+        self.assertEqual(call(factory.post("/api/delivery-agent/quote")).status_code, 200)
+        self.assertEqual(call(factory.get("/api/users/")).status_code, 200)
+        self.assertEqual(seen, [None, None])
+
+        # Served from the cached principal, then from the database once the cache is cleared
+        for _ in range(2):
+            self.assertEqual(call(factory.get(self.url, **self.auth)).status_code, 200)
+            self.assertEqual(seen[-1].subject_id, self.agent.agent_id)
+            cache.clear()
+
+    def test_async_path_leaves_shared_caches_to_a_thread(self):
+        access_token = self.auth["HTTP_AUTHORIZATION"].split(" ")[1]
+        self.assertIsNotNone(authenticate_token_cached(access_token))
+        with self.settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}):
+            self.assertIsNone(authenticate_token_cached(access_token))
+
+
+class RoutePlanningTests(TestCase):
+    """Nearest neighbour + 2-opt never loses to nearest neighbour alone and keeps every pickup first."""
+
+    def random_jobs(self, rng, jobs):
+        points, predecessors = [], []
+        for _ in range(jobs):
+            pickup = len(points)
+            points += [(50.5 + rng.random(), 9.5 + rng.random()), (50.5 + rng.random(), 9.5 + rng.random())]
+            predecessors += [-1, pickup]
+        return points, predecessors
+
+    def test_two_opt_never_lengthens_the_route(self):
+        rng = random.Random(3)
+        for jobs in (1, 2, 5, 12):
+            for start in (None, (51.0, 10.0)):
+                points, predecessors = self.random_jobs(rng, jobs)
+                order, length = routing.plan_route(points, predecessors, start)
+                with mock.patch.object(routing, "_two_opt", lambda dist, path, *args, **kwargs: path):
+                    _, nearest_neighbour_length = routing.plan_route(points, predecessors, start)
+                self.assertLessEqual(length, nearest_neighbour_length + 1e-9)
+                self.assertEqual(sorted(order), list(range(len(points))))
+                position = {stop: k for k, stop in enumerate(order)}
+                for stop, pickup in enumerate(predecessors):
+                    if pickup >= 0:
+                        self.assertLess(position[pickup], position[stop])
+
+    def test_geocode_falls_back_to_postal_code_then_place(self):
+        Geocode.objects.bulk_create([
+            Geocode(key="36037", latitude=50.55, longitude=9.68),
+            Geocode(key="kassel", latitude=51.31, longitude=9.48),
+        ], update_conflicts=True, unique_fields=['key'], update_fields=['latitude', 'longitude'])
+        self.assertEqual(candidate_keys("Leipziger Str. 123, 36037 Fulda")[:2], ["leipziger str. 123, 36037 fulda", "36037"])
+        located = geocode_many(["Leipziger Str. 123, 36037 Fulda", "Königsplatz 1,  Kassel", "Nowhere 5"])
+        self.assertEqual(located["Leipziger Str. 123, 36037 Fulda"], (50.55, 9.68))
+        self.assertEqual(located["Königsplatz 1,  Kassel"], (51.31, 9.48))
+        self.assertIsNone(located["Nowhere 5"])
+
+
+class RouteEndpointTests(DeliveryAgentTestCase):
+    """The route keeps pickups before dropoffs, skips picked-up pickups and lists unlocated jobs."""
+
+    def setUp(self):
+        super().setUp()
+        telemetry.buffers.clear()
+        Geocode.objects.bulk_create([
+            Geocode(key=f"p{k}", latitude=50.5 + k / 10, longitude=9.6) for k in range(5)
+        ] + [
+            Geocode(key=f"d{k}", latitude=50.55 + k / 10, longitude=9.7) for k in range(5)
+        ], update_conflicts=True, unique_fields=['key'], update_fields=['latitude', 'longitude'])
+        self.jobs = list(DeliveryRequest.objects.filter(status="accepted").order_by('request_id'))
+        for k, job in enumerate(self.jobs):
+            job.pickup_location, job.dropoff_location = f"P{k}", f"D{k}"
+        self.jobs[0].status = "out_for_delivery"
+        self.jobs[1].dropoff_location = "Nowhere"
+        DeliveryRequest.objects.bulk_update(self.jobs, ["pickup_location", "dropoff_location", "status"])
+
+    def route(self, query=""):
+        response = self.client.get(f"/api/delivery-agent/route/{self.agent.agent_id}{query}", **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_route_precedence(self):
+        route = self.route()
+        stops = [(stop["request_id"], stop["kind"]) for stop in route["stops"]]
+        picked_up, unlocated = self.jobs[0].request_id, self.jobs[1].request_id
+        self.assertNotIn((picked_up, "pickup"), stops)
+        self.assertIn((picked_up, "dropoff"), stops)
+        for job in self.jobs[2:]:
+            self.assertLess(stops.index((job.request_id, "pickup")), stops.index((job.request_id, "dropoff")))
+        self.assertEqual(
+            [(stop["request_id"], stop["kind"]) for stop in route["unlocated"]],
+            [(unlocated, "pickup"), (unlocated, "dropoff")],
+        )
+        self.assertEqual(len(stops), 1 + 2 * 3)
+
+    def test_route_starts_from_given_position_before_telemetry(self):
+        telemetry.ingest(self.agent.agent_id, [[timezone.now().timestamp(), 50.55, 9.7]])
+        # From the telemetry ping (at D0) the picked-up dropoff comes first
+        self.assertEqual(self.route()["stops"][0]["request_id"], self.jobs[0].request_id)
+        self.assertEqual(self.route()["stops"][0]["leg_km"], 0.0)
+        # An explicit position wins over the ping
+        far = self.route("?latitude=50.9&longitude=9.6")
+        self.assertEqual((far["stops"][0]["kind"], far["stops"][0]["location"]), ("pickup", "P4"))
+
+
+class AcceptDeliveryRequestRaceTests(TransactionTestCase):
+    """Simultaneous accepts of one request must produce exactly one winner."""
+
+    def setUp(self):
+        DeliveryAgent.objects.bulk_create([
+            DeliveryAgent(
+                first_name="Racer", last_name=str(i), email=f"racer-{i}@example.com", password="x",
+                phone_number=f"0151{i:06d}", transport_mode="bike", joined_date=date(2024, 1, 1),
+                approval_status="approved",
+            )
+            for i in range(CONTENDERS)
+        ])
+        self.agent_ids = list(DeliveryAgent.objects.values_list("agent_id", flat=True))
+        self.request = DeliveryRequest.objects.create(
+            product_id=1, seller_id=1, buyer_id=2, dropoff_location="A", pickup_location="B", status="pending",
+        )
+        rebuild_matching_index()
+
+    def test_exactly_one_agent_wins(self):
+        start = threading.Event()
+
+        def accept(agent_id):
+            start.wait()
+            try:
+                accept_delivery_request(self.request.request_id, agent_id)
+                return agent_id, 200
+            except HttpError as e:
+                return agent_id, e.status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=50) as pool:
+            futures = [pool.submit(accept, agent_id) for agent_id in self.agent_ids]
+            start.set()
+            outcomes = [future.result() for future in futures]
+
+        winners = [agent_id for agent_id, status in outcomes if status == 200]
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(sorted(status for _, status in outcomes), [200] + [409] * (CONTENDERS - 1))
+        self.request.refresh_from_db()
+        self.assertEqual((self.request.status, self.request.agent_id), ("accepted", winners[0]))
+        self.assertFalse(OpenDeliveryRequest.objects.filter(request_id=self.request.request_id).exists())
@@ -0,0 +1,78 @@
+"""
+Delivery status history, recorded in delivery_status_events alongside every
+transition: one INSERT per transition, in the transition's own transaction, or
+one bulk INSERT when several requests change together.
+
+The time a request entered its current status is kept on
+DeliveryRequest.status_changed_at (falling back to request_date for older rows),
+so each event can carry the time spent in the previous status without reading
+the log.
+"""
+from datetime import datetime
+from typing import Optional
+
+from django.db.models import Avg, Count, F, Max, Q
+from django.utils import timezone
+
+from .models import DeliveryRequest, DeliveryStatusEvent
+
+
+def status_entered_at(request: DeliveryRequest) -> Optional[datetime]:
+    return request.status_changed_at or request.request_date
+
+
+def build_event(request_id: int, from_status, to_status: str, agent_id=None,
+                entered_at: Optional[datetime] = None, at: Optional[datetime] = None) -> DeliveryStatusEvent:
+    at = at or timezone.now()
+    return DeliveryStatusEvent(
+        request_id=request_id,
+        from_status=from_status,
+        to_status=to_status,
+        agent_id=agent_id,
+        occurred_at=at,
+        seconds_in_previous=(at - entered_at).total_seconds() if entered_at and from_status else None,
+    )
+
+
+def record_transition(*args, **kwargs) -> DeliveryStatusEvent:
+    """Append one event; call inside the transaction that changes the status."""
+    event = build_event(*args, **kwargs)
+    event.save()
+    return event
+
+
+def record_transitions(events: list):
+    """Append events built with build_event() in a single INSERT."""
+    DeliveryStatusEvent.objects.bulk_create(events)
+
+
+def get_timeline(request_id: int) -> list[dict]:
+    return [
+        {
+            "from_status": event.from_status,
+            "status": event.to_status,
+            "agent_id": event.agent_id,
+            "at": event.occurred_at,
+            "seconds_in_previous": event.seconds_in_previous,
+        }
+        for event in DeliveryStatusEvent.objects.filter(request_id=request_id).order_by('occurred_at', 'event_id')
+    ]
+
+
+def status_durations(since: Optional[datetime] = None, until: Optional[datetime] = None) -> list[dict]:
+    """
+    Count, mean and maximum seconds spent in each status, over the transitions out
+    of it that happened in [since, until).
+    """
+    window = Q(from_status__isnull=False)
+    if since:
+        window &= Q(occurred_at__gte=since)
+    if until:
+        window &= Q(occurred_at__lt=until)
+    return list(
+        DeliveryStatusEvent.objects.filter(window).order_by('from_status').values(status=F('from_status')).annotate(
+            transitions=Count('event_id'),
+            avg_seconds=Avg('seconds_in_previous'),
+            max_seconds=Max('seconds_in_previous'),
+        )
+    )
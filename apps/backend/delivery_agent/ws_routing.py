@@ -0,0 +1,9 @@
+from django.urls import re_path
+from .consumers import AgentTelemetryConsumer, DeliveryJobsConsumer, DeliveryOrderConsumer
+
+# WebSocket URL patterns for delivery events (delivery_agent/routing.py is the route planner)
+websocket_urlpatterns = [
+    re_path(r"ws/delivery/jobs/?$", DeliveryJobsConsumer.as_asgi()),
+    re_path(r"ws/delivery/orders/(?P<request_id>\d+)/?$", DeliveryOrderConsumer.as_asgi()),
+    re_path(r"ws/delivery/telemetry/?$", AgentTelemetryConsumer.as_asgi()),
+]
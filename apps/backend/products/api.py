@@ -1,12 +1,13 @@
-from typing import List, Optional
+from typing import List, Literal, Optional, Union
 from ninja import Query, Router
 from ninja.errors import HttpError
 from django.shortcuts import get_object_or_404
 from .models import Category, Product
-from .schemas import ProductIn, ProductOut, CategoryOut
+from .schemas import ProductIn, ProductOut, ProductCardOut, CategoryOut
 from .database import (
     create_product_entry,
     get_filtered_products,
+    get_filtered_product_cards,
     get_product_by_id,
     update_product_entry,
     delete_product_entry,
@@ -14,13 +15,14 @@ from .database import (
     mark_product_as_available,
     serialize_product,
 )
+from .popularity import record_product_view
 from django.http import Http404
 from loguru import logger
 from typing import List
 
 prodcut_router = Router()
 
-@prodcut_router.get("", response=List[ProductOut], tags=["Products"])
+@prodcut_router.get("", response=Union[List[ProductOut], List[ProductCardOut]], tags=["Products"])
 def list_products(
     request,
     category: Optional[int] = Query(None),
@@ -28,17 +30,21 @@ def list_products(
     condition: Optional[str] = Query(None),
     location: Optional[str] = Query(None),
     min_price: Optional[float] = Query(None),
-    max_price: Optional[float] = Query(None)
+    max_price: Optional[float] = Query(None),
+    view: Literal["full", "card"] = Query("full"),
+    sort: Literal["newest", "popular"] = Query("newest")
 ):
-    logger.info(f"Listing products with filters: category={category}, name={name}, condition={condition}, location={location}, min_price={min_price}, max_price={max_price}")
+    logger.info(f"Listing products with filters: category={category}, name={name}, condition={condition}, location={location}, min_price={min_price}, max_price={max_price}, view={view}, sort={sort}")
     try:
-        result = get_filtered_products(
+        fetch = get_filtered_product_cards if view == "card" else get_filtered_products
+        result = fetch(
             category=category,
             name=name,
             condition=condition,
             location=location,
             min_price=min_price,
-            max_price=max_price
+            max_price=max_price,
+            sort=sort
         )
         logger.info(f"Found {len(result)} products")
         return result
@@ -57,7 +63,7 @@ def list_categories(request):
         raise HttpError(500, str(e))
 
 # MOVED THIS BEFORE /{id} TO AVOID ROUTE CONFLICT
-@prodcut_router.get("/wanted", response=List[ProductOut], tags=["Products"])
+@prodcut_router.get("/wanted", response=Union[List[ProductOut], List[ProductCardOut]], tags=["Products"])
 def list_wanted_items(
     request,
     search: Optional[str] = Query(None),
@@ -66,12 +72,14 @@ def list_wanted_items(
     category: Optional[int] = Query(None),
     location: Optional[str] = Query(None),
     max_price: Optional[float] = Query(None),
+    view: Literal["full", "card"] = Query("full"),
 ):
     logger.info("Listing wanted items")
     try:
         search_term = search or name or q
         
-        result = get_filtered_products(
+        fetch = get_filtered_product_cards if view == "card" else get_filtered_products
+        result = fetch(
             name=search_term,
             category=category,
             location=location,
@@ -91,6 +99,7 @@ def product_detail_view(request, id: int):
     try:
         product = get_product_by_id(id)
         logger.info(f"Product found: {product}")
+        record_product_view(id)
         return product
     except Http404 as e:
         logger.warning(f"Product not found: {e}")
@@ -1,8 +1,11 @@
 from .schemas import ProductIn
-from .models import Product, Category  
+from .models import Product, Category, ProductCard
 from django.http import Http404
+from django.db import transaction
+from django.db.models import F
 from enum import Enum
 from loguru import logger 
+from users.counters import adjust_sell_count
 
 class ProductStatus(str, Enum):
     AVAILABLE = "Available"
@@ -15,7 +18,8 @@ def create_product_entry(data: ProductIn):
     try:
         product_data = data.dict()
         product_data["status"] = ProductStatus.AVAILABLE
-        product = Product.objects.create(**product_data)
+        product = Product(**product_data)
+        save_product_with_card(product)
         logger.info(f"Product entry created: {product}")
         return serialize_product(product) 
     except Exception as e:
@@ -29,7 +33,8 @@ def get_filtered_products(
     location=None,
     min_price=None,
     max_price=None,
-    is_wanted=None
+    is_wanted=None,
+    sort="newest"
     
 ):
     logger.info(f"Filtering products with: category={category}, name={name}, condition={condition}, location={location}, min_price={min_price}, max_price={max_price}")
@@ -78,12 +83,53 @@ def get_filtered_products(
     if max_price is not None:
         queryset = queryset.filter(price__lte=max_price)
         logger.info(f"Filtered by max_price: {max_price}")
+    if sort == "popular":
+        queryset = queryset.order_by(F('stats__popularity_score').desc(nulls_last=True), '-created_at')
 
     result = []
     for product in queryset:
         result.append(serialize_product(product))
     return result
 
+CARD_FIELDS = ("product_id", "name", "price", "image_url", "location", "category_name", "created_at")
+
+def get_filtered_product_cards(
+    category=None,
+    name=None,
+    condition=None,
+    location=None,
+    min_price=None,
+    max_price=None,
+    is_wanted=None,
+    sort="newest"
+):
+    """
+    Same filters as get_filtered_products, served from the ProductCard read model.
+    """
+    logger.info(f"Filtering product cards with: category={category}, name={name}, condition={condition}, location={location}, min_price={min_price}, max_price={max_price}")
+    queryset = ProductCard.objects.filter(
+        approve_status="approved",
+        status=ProductStatus.AVAILABLE,
+        is_wanted=is_wanted is True
+    ).order_by('-created_at')
+
+    if category:
+        queryset = queryset.filter(category_id=category)
+    if name:
+        queryset = queryset.filter(name__icontains=name)
+    if condition:
+        queryset = queryset.filter(condition__icontains=condition)
+    if location:
+        queryset = queryset.filter(location__icontains=location)
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+    if sort == "popular":
+        queryset = queryset.order_by('-popularity_score', '-created_at')
+
+    return list(queryset.values(*CARD_FIELDS))
+
 def get_product_by_id(product_id):
     logger.info(f"Getting product by id: {product_id}")
     try:
@@ -103,7 +149,7 @@ def update_product_entry(product_id: int, data: ProductIn):
         product = Product.objects.get(product_id=product_id)
         for attr, value in data.dict().items():
             setattr(product, attr, value)
-        product.save()
+        save_product_with_card(product)
         logger.info(f"Product updated: {product}")
         return serialize_product(product) 
     except Product.DoesNotExist:
@@ -118,7 +164,7 @@ def delete_product_entry(product_id: int):
     try:
         product = Product.objects.get(product_id=product_id)
         product.status = ProductStatus.DELETED
-        product.save()
+        save_product_with_card(product)
         return {"detail": f"Product with ID {product_id} deleted successfully"}
     except Product.DoesNotExist:
         raise Http404(f"Product with ID {product_id} not found")
@@ -128,9 +174,10 @@ def delete_product_entry(product_id: int):
 
 def mark_product_as_sold(product_id: int):
     try:
-        product = Product.objects.get(product_id=product_id)
-        product.status = ProductStatus.SOLD
-        product.save()
+        with transaction.atomic():
+            product = Product.objects.select_for_update().get(product_id=product_id)
+            product.status = ProductStatus.SOLD
+            save_product_with_card(product)
         return {"detail": f"Product with ID {product_id} marked as sold successfully"}
     except Product.DoesNotExist:
         raise Http404(f"Product with ID {product_id} not found")
@@ -140,9 +187,10 @@ def mark_product_as_sold(product_id: int):
 
 def mark_product_as_available(product_id: int):
     try:
-        product = Product.objects.get(product_id=product_id)
-        product.status = ProductStatus.AVAILABLE
-        product.save()
+        with transaction.atomic():
+            product = Product.objects.select_for_update().get(product_id=product_id)
+            product.status = ProductStatus.AVAILABLE
+            save_product_with_card(product)
         return {"detail": f"Product with ID {product_id} marked as available successfully"}
     except Product.DoesNotExist:
         raise Http404(f"Product with ID {product_id} not found")
@@ -158,7 +206,7 @@ def serialize_product(product):
         "price": product.price,
         "condition": product.condition,
         "image_urls": product.image_urls,
-        "seller_id": product.seller.user_id,
+        "seller_id": product.seller_id,
         "category_id": product.category.category_id if product.category else None,
         "is_wanted": product.is_wanted,
         "location": product.location,
@@ -170,6 +218,52 @@ def serialize_product(product):
         "status": product.status
     }
 
+def build_product_card(product):
+    return ProductCard(
+        product_id=product.product_id,
+        name=product.name,
+        price=product.price,
+        image_url=product.image_urls[0] if product.image_urls else "",
+        location=product.location,
+        category_id=product.category_id,
+        category_name=product.category.category_name if product.category else "Unknown",
+        condition=product.condition,
+        is_wanted=product.is_wanted,
+        status=product.status,
+        approve_status=product.approve_status,
+        created_at=product.created_at,
+    )
+
+# popularity_score is owned by products/popularity.py and left untouched here
+CARD_SYNC_FIELDS = [
+    field.attname for field in ProductCard._meta.concrete_fields
+    if not field.primary_key and field.name != "popularity_score"
+]
+
+def save_product_with_card(product):
+    """
+    Save a product and refresh its ProductCard in the same transaction.
+    Every write to Product should go through here so listings never go stale.
+    It also moves the seller's sell_count when the product enters or leaves
+    "Sold" (or changes seller while sold), comparing against the locked row.
+    """
+    with transaction.atomic():
+        previous = None
+        if product.pk is not None:
+            previous = Product.objects.select_for_update().filter(pk=product.pk).values('status', 'seller_id').first()
+        was_sold_by = previous['seller_id'] if previous and previous['status'] == ProductStatus.SOLD else None
+        now_sold_by = product.seller_id if product.status == ProductStatus.SOLD else None
+        product.save()
+        if was_sold_by != now_sold_by:
+            if was_sold_by is not None:
+                adjust_sell_count(was_sold_by, -1)
+            if now_sold_by is not None:
+                adjust_sell_count(now_sold_by, 1)
+        card = build_product_card(product)
+        card_values = {field: getattr(card, field) for field in CARD_SYNC_FIELDS}
+        if not ProductCard.objects.filter(pk=card.pk).update(**card_values):
+            card.save(force_insert=True)
+
 def approve_product_listing(product_id: int):
     logger.info(f"Approving product listing with ID {product_id}.")
     try:
@@ -178,7 +272,7 @@ def approve_product_listing(product_id: int):
             logger.warning(f"Product {product_id} is already approved.")
             raise ValueError("Product is already approved.")
         product.approve_status = "approved"
-        product.save()
+        save_product_with_card(product)
         logger.success(f"Product listing {product_id} approved.")
         return True
     except Product.DoesNotExist:
@@ -200,7 +294,7 @@ def reject_product_listing(product_id: int, reason: str):
             raise ValueError("Product is already rejected.")
         product.approve_status = "rejected"
         product.rejection_reason = reason
-        product.save()
+        save_product_with_card(product)
         logger.success(f"Product listing {product_id} rejected.")
         return True
     except Product.DoesNotExist:
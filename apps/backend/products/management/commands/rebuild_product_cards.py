@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from loguru import logger
+from products.models import Product, ProductCard
+from products.database import build_product_card
+from products.popularity import sync_card_scores
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ProductCard read model from the products table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        logger.info("Rebuilding product cards.")
+        total = 0
+        with transaction.atomic():
+            ProductCard.objects.all().delete()
+            chunk = []
+            for product in Product.objects.select_related("category").iterator(chunk_size=chunk_size):
+                chunk.append(build_product_card(product))
+                if len(chunk) >= chunk_size:
+                    ProductCard.objects.bulk_create(chunk)
+                    total += len(chunk)
+                    chunk = []
+            if chunk:
+                ProductCard.objects.bulk_create(chunk)
+                total += len(chunk)
+            sync_card_scores()
+        logger.success(f"Rebuilt {total} product cards.")
+        self.stdout.write(f"Rebuilt {total} product cards.")
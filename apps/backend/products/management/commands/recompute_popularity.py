@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from products.popularity import recompute_popularity_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold the views and favourites flushed by the web workers into time-decayed popularity "
+        "scores. Runs once (for cron) or, with --loop, every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--interval", type=float, default=900)
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            recompute_popularity_scores(chunk_size=options["chunk_size"])
+            self.stdout.write("Popularity scores recomputed.")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 23:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_productreport_reason'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='products.product')),
+                ('name', models.CharField(max_length=255)),
+                ('price', models.FloatField()),
+                ('image_url', models.TextField(blank=True, default='')),
+                ('location', models.CharField(blank=True, max_length=255, null=True)),
+                ('category_id', models.IntegerField(blank=True, null=True)),
+                ('category_name', models.CharField(max_length=100)),
+                ('condition', models.CharField(max_length=50)),
+                ('is_wanted', models.BooleanField(default=False)),
+                ('status', models.CharField(max_length=50)),
+                ('approve_status', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'product_cards',
+                'indexes': [models.Index(fields=['approve_status', 'status', 'is_wanted', '-created_at'], name='card_browse_idx'), models.Index(fields=['category_id', 'approve_status', 'status', 'is_wanted', '-created_at'], name='card_category_idx'), models.Index(fields=['approve_status', 'status', 'is_wanted', 'price'], name='card_price_idx')],
+            },
+        ),
+    ]
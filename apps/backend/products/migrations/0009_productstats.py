@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-18 23:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def count_existing_favourites(apps, schema_editor):
+    """Seed favourite_count (and pending_favourites, so the first recompute scores them) from existing favourites."""
+    FavouriteProduct = apps.get_model('users', 'FavouriteProduct')
+    ProductStats = apps.get_model('products', 'ProductStats')
+    counts = FavouriteProduct.objects.values('product_id').annotate(total=models.Count('id'))
+    ProductStats.objects.bulk_create(
+        [ProductStats(product_id=row['product_id'], favourite_count=row['total'], pending_favourites=row['total']) for row in counts],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_productcard'),
+        ('users', '0005_favouriteproduct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='products.product')),
+                ('view_count', models.PositiveIntegerField(default=0)),
+                ('favourite_count', models.IntegerField(default=0)),
+                ('pending_views', models.PositiveIntegerField(default=0)),
+                ('pending_favourites', models.IntegerField(default=0)),
+                ('popularity_score', models.FloatField(db_index=True, default=0)),
+                ('score_updated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'product_stats',
+            },
+        ),
+        migrations.AddField(
+            model_name='productcard',
+            name='popularity_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='productcard',
+            index=models.Index(fields=['approve_status', 'status', 'is_wanted', '-popularity_score'], name='card_popular_idx'),
+        ),
+        migrations.RunPython(count_existing_favourites, migrations.RunPython.noop),
+    ]
@@ -33,6 +33,54 @@ class Product(models.Model):
     class Meta:
         db_table = "products"  
 
+class ProductCard(models.Model):
+    """
+    Compact read model of a Product for catalog and favourites listings.
+    Kept in sync by the write functions in products/database.py.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    name = models.CharField(max_length=255)
+    price = models.FloatField()
+    image_url = models.TextField(blank=True, default="")  # first entry of Product.image_urls
+    location = models.CharField(max_length=255, null=True, blank=True)
+    category_id = models.IntegerField(null=True, blank=True)
+    category_name = models.CharField(max_length=100)
+    condition = models.CharField(max_length=50)
+    is_wanted = models.BooleanField(default=False)
+    status = models.CharField(max_length=50)
+    approve_status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    popularity_score = models.FloatField(default=0)  # copied from ProductStats by recompute_popularity
+
+    def __str__(self):
+        return self.name
+    class Meta:
+        db_table = "product_cards"
+        indexes = [
+            models.Index(fields=['approve_status', 'status', 'is_wanted', '-popularity_score'], name='card_popular_idx'),
+            models.Index(fields=['approve_status', 'status', 'is_wanted', '-created_at'], name='card_browse_idx'),
+            models.Index(fields=['category_id', 'approve_status', 'status', 'is_wanted', '-created_at'], name='card_category_idx'),
+            models.Index(fields=['approve_status', 'status', 'is_wanted', 'price'], name='card_price_idx'),
+        ]
+
+class ProductStats(models.Model):
+    """
+    Popularity counters for a Product. Views arrive through the write-behind buffer in
+    products/popularity.py; pending_* hold increments not yet folded into popularity_score.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    view_count = models.PositiveIntegerField(default=0)
+    favourite_count = models.IntegerField(default=0)
+    pending_views = models.PositiveIntegerField(default=0)
+    pending_favourites = models.IntegerField(default=0)
+    popularity_score = models.FloatField(default=0, db_index=True)
+    score_updated_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Stats for product {self.product_id}"
+    class Meta:
+        db_table = "product_stats"
+
 # models.py
 class ProductReport(models.Model):
     report_id = models.AutoField(primary_key=True)
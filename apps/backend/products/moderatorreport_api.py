@@ -2,9 +2,11 @@
 from ninja import Router
 from .models import ProductReport, Product
 from .schemas import ProductOut, ProductReportResponse, ProductReportRequest, RejectionReasonSchema
+from .database import save_product_with_card
 from users.models import UserProfile
 from typing import List
 from django.http import Http404
+from backend.throttling import RateLimit
 
 report_router = Router()
 
@@ -50,7 +52,7 @@ def delete_reported_product(request, report_id: int, data: RejectionReasonSchema
         product.status = "removed"  
         product.approve_status = "rejected"
         product.rejection_reason = data.rejection_reason
-        product.save() 
+        save_product_with_card(product)
         report.status = "deleted"
         report.rejection_reason = data.rejection_reason
         report.save()
@@ -69,7 +71,8 @@ def keep_reported_product(request, report_id: int):
     except ProductReport.DoesNotExist:
         raise Http404("Report not found")
 
-@report_router.post("/{product_id}")
+@report_router.post("/{product_id}", throttle=[RateLimit("60/h", scope="report-product"),
+                                                RateLimit("10/h", scope="report-product", key="user", user_field="user_id")])
 def report_product(request, product_id: int, productRequest: ProductReportRequest):
     if product_id != productRequest.product_id:
         return {"detail": "Mismatch between URL and body product_id"}, 400
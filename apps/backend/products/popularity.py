@@ -0,0 +1,149 @@
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, FloatField, IntegerField, Max, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from loguru import logger
+
+from .models import ProductCard, ProductStats
+
+VIEW_FLUSH_INTERVAL = getattr(settings, 'POPULARITY_VIEW_FLUSH_SECONDS', 30)
+SCORE_HALF_LIFE_HOURS = getattr(settings, 'POPULARITY_HALF_LIFE_HOURS', 72)
+VIEW_WEIGHT = 1.0
+FAVOURITE_WEIGHT = 5.0
+FLUSH_CHUNK_SIZE = 500
+
+_pending_views = Counter()
+_pending_lock = threading.Lock()
+_flusher_pid = None
+
+
+def record_product_view(product_id: int):
+    """
+    Buffer a product view in memory. A background thread writes the buffer out with
+    bulk UPDATEs every VIEW_FLUSH_INTERVAL, so a page view never costs a write.
+    """
+    with _pending_lock:
+        _pending_views[product_id] += 1
+        if _flusher_pid != os.getpid():
+            _start_flusher()
+
+
+def _start_flusher():
+    """Start this process's flush thread; call with _pending_lock held."""
+    global _flusher_pid
+    _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_periodically, name="product-view-flusher", daemon=True).start()
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(VIEW_FLUSH_INTERVAL)
+        flush_product_views()
+        # The thread keeps its own connection; drop it if it went stale meanwhile
+        close_old_connections()
+
+
+def flush_product_views():
+    """
+    Write buffered view counts to product_stats, one transaction per chunk. On
+    failure the counts of the chunks that did not commit are put back into the
+    buffer and retried on the next flush; returns the number of products written.
+    """
+    with _pending_lock:
+        if not _pending_views:
+            return 0
+        views = dict(_pending_views)
+        _pending_views.clear()
+
+    product_ids = list(views)
+    start = 0
+    try:
+        for start in range(0, len(product_ids), FLUSH_CHUNK_SIZE):
+            chunk = product_ids[start:start + FLUSH_CHUNK_SIZE]
+            increment = Case(
+                *[When(product_id=product_id, then=Value(views[product_id])) for product_id in chunk],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            with transaction.atomic():
+                ProductStats.objects.bulk_create(
+                    [ProductStats(product_id=product_id) for product_id in chunk],
+                    ignore_conflicts=True,
+                )
+                ProductStats.objects.filter(product_id__in=chunk).update(
+                    view_count=F('view_count') + increment,
+                    pending_views=F('pending_views') + increment,
+                )
+        logger.info(f"Flushed {sum(views.values())} buffered views for {len(views)} products.")
+        return len(views)
+    except Exception as e:
+        unwritten = product_ids[start:]
+        logger.error(f"Error flushing product views, keeping {len(unwritten)} products for the next flush: {e}")
+        with _pending_lock:
+            _pending_views.update({product_id: views[product_id] for product_id in unwritten})
+        return start
+
+
+atexit.register(flush_product_views)
+
+
+def adjust_favourite_count(product_id: int, delta: int):
+    """
+    Add delta to a product's favourite counter. Call inside the transaction that
+    adds or removes the favourite row.
+    """
+    updated = ProductStats.objects.filter(product_id=product_id).update(
+        favourite_count=F('favourite_count') + delta,
+        pending_favourites=F('pending_favourites') + delta,
+    )
+    if not updated:
+        ProductStats.objects.bulk_create(
+            [ProductStats(product_id=product_id)],
+            ignore_conflicts=True,
+        )
+        ProductStats.objects.filter(product_id=product_id).update(
+            favourite_count=F('favourite_count') + delta,
+            pending_favourites=F('pending_favourites') + delta,
+        )
+
+
+def recompute_popularity_scores(chunk_size: int = 1000):
+    """
+    Decay every score by the time since the previous run, fold in the pending
+    view/favourite increments and copy the result onto the product cards.
+    Works in primary-key chunks so each UPDATE holds its row locks briefly.
+    """
+    now = timezone.now()
+    last_run = ProductStats.objects.aggregate(last=Max('score_updated_at'))['last']
+    elapsed_hours = (now - last_run).total_seconds() / 3600 if last_run else 0
+    decay = 0.5 ** (elapsed_hours / SCORE_HALF_LIFE_HOURS)
+
+    max_id = ProductStats.objects.aggregate(last=Max('product_id'))['last'] or 0
+    for start in range(0, max_id, chunk_size):
+        id_range = {'pk__gt': start, 'pk__lte': start + chunk_size}
+        with transaction.atomic():
+            # popularity_score is assigned first: MySQL evaluates SET clauses left to right
+            ProductStats.objects.filter(**id_range).update(
+                popularity_score=F('popularity_score') * decay
+                + F('pending_views') * VIEW_WEIGHT
+                + F('pending_favourites') * FAVOURITE_WEIGHT,
+                pending_views=0,
+                pending_favourites=0,
+                score_updated_at=now,
+            )
+        sync_card_scores(ProductCard.objects.filter(**id_range))
+    logger.success(f"Recomputed popularity scores (decay factor {decay:.4f}).")
+
+
+def sync_card_scores(cards=None):
+    """Copy popularity_score from product_stats onto the given product cards."""
+    cards = ProductCard.objects.all() if cards is None else cards
+    score = ProductStats.objects.filter(product_id=OuterRef('pk')).values('popularity_score')[:1]
+    return cards.update(popularity_score=Coalesce(Subquery(score), Value(0.0), output_field=FloatField()))
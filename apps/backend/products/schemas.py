@@ -22,6 +22,15 @@ class ProductOut(ProductIn):
     approve_status: Optional[str] = None
     status: Optional[str] = None
 
+class ProductCardOut(Schema):
+    product_id: int
+    name: str
+    price: float
+    image_url: str
+    location: Optional[str] = None
+    category_name: str
+    created_at: datetime
+
 class CategoryOut(Schema):
     category_id: int
     category_name: str
@@ -1,3 +1,135 @@
-from django.test import TestCase
+import os
+import time
+from collections import Counter
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, TransactionTestCase
+
+from users.counters import reconcile_user_counters
+from users.models import Role, UserProfile
+
+from .database import delete_product_entry, mark_product_as_available, mark_product_as_sold, update_product_entry
+from . import popularity
+from .models import Category, Product, ProductReport, ProductStats
+from .schemas import ProductIn
+
+
+class SellCountTests(TestCase):
+    """Every transition into or out of "Sold" moves the seller's sell_count, matching a reconcile."""
+
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(role_name="user")
+        cls.category = Category.objects.create(category_name="Books")
+        cls.seller, cls.other_seller = (
+            UserProfile.objects.create(
+                first_name="Sam", last_name=name, email=f"{name}@example.com", user_type="user",
+                joined_date=date(2024, 1, 1), role=role,
+            )
+            for name in ("seller", "other")
+        )
+
+    def sold_product(self):
+        product = Product.objects.create(
+            name="Book", description="A book", price=10.0, condition="good",
+            seller=self.seller, category=self.category, status="Available", approve_status="approved",
+        )
+        mark_product_as_sold(product.product_id)
+        return product
+
+    def sell_counts(self):
+        return tuple(
+            UserProfile.objects.get(pk=user.pk).sell_count for user in (self.seller, self.other_seller)
+        )
+
+    def assert_counts(self, expected):
+        self.assertEqual(self.sell_counts(), expected)
+        # The event-driven counters agree with a full recount
+        self.assertEqual(reconcile_user_counters(), 0)
+
+    def test_sold_and_available(self):
+        product = self.sold_product()
+        mark_product_as_sold(product.product_id)
+        self.assert_counts((1, 0))
+        mark_product_as_available(product.product_id)
+        self.assert_counts((0, 0))
+
+    def test_deleting_a_sold_product(self):
+        product = self.sold_product()
+        delete_product_entry(product.product_id)
+        self.assert_counts((0, 0))
+
+    def test_removing_a_reported_sold_product(self):
+        product = self.sold_product()
+        report = ProductReport.objects.create(product=product, reported_by=self.other_seller, reason="spam")
+        response = self.client.post(
+            f"/api/reports/{report.report_id}/delete", {"rejection_reason": "spam"}, content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_counts((0, 0))
+
+    def test_moving_a_sold_product_to_another_seller(self):
+        product = self.sold_product()
+        update_product_entry(product.product_id, ProductIn(
+            name="Book", description="A book", price=12.0, condition="good", image_urls=[],
+            seller_id=self.other_seller.user_id, category_id=self.category.category_id, is_wanted=False,
+        ))
+        self.assert_counts((0, 1))
+
+
+class ProductViewFlushTests(TransactionTestCase):
+    """Buffered views reach product_stats on a timer, without waiting for another view."""
+
+    def test_views_are_flushed_without_further_traffic(self):
+        seller = UserProfile.objects.create(
+            first_name="Sam", last_name="Seller", email="seller@example.com", user_type="user",
+            joined_date=date(2024, 1, 1), role=Role.objects.create(role_name="user"),
+        )
+        product = Product.objects.create(
+            name="Book", description="A book", price=10.0, condition="good", seller=seller,
+            category=Category.objects.create(category_name="Books"), status="Available", approve_status="approved",
+        )
+        with mock.patch.object(popularity, "VIEW_FLUSH_INTERVAL", 0.05), \
+                mock.patch.object(popularity, "_flusher_pid", None):
+            popularity.record_product_view(product.product_id)
+            popularity.record_product_view(product.product_id)
+            deadline = time.monotonic() + 5
+            while not ProductStats.objects.filter(product=product, view_count=2).exists():
+                self.assertLess(time.monotonic(), deadline, "views were not flushed")
+                time.sleep(0.05)
+
+    def test_failed_chunk_keeps_only_its_own_views(self):
+        seller = UserProfile.objects.create(
+            first_name="Sam", last_name="Seller", email="seller@example.com", user_type="user",
+            joined_date=date(2024, 1, 1), role=Role.objects.create(role_name="user"),
+        )
+        category = Category.objects.create(category_name="Books")
+        first, second = (
+            Product.objects.create(
+                name="Book", description="A book", price=10.0, condition="good", seller=seller,
+                category=category, status="Available", approve_status="approved",
+            )
+            for _ in range(2)
+        )
+        bulk_create = ProductStats.objects.bulk_create
+        calls = []
+
+        def fail_second_chunk(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("lost connection")
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(popularity, "FLUSH_CHUNK_SIZE", 1), \
+                mock.patch.object(popularity, "_flusher_pid", os.getpid()), \
+                mock.patch.object(popularity, "_pending_views", Counter({first.product_id: 2, second.product_id: 3})), \
+                mock.patch.object(ProductStats.objects, "bulk_create", fail_second_chunk):
+            # The first chunk committed, so only the second one goes back into the buffer
+            self.assertEqual(popularity.flush_product_views(), 1)
+            self.assertEqual(popularity._pending_views, Counter({second.product_id: 3}))
+            self.assertEqual(popularity.flush_product_views(), 1)
+        self.assertEqual(
+            dict(ProductStats.objects.values_list('product_id', 'view_count')),
+            {first.product_id: 2, second.product_id: 3},
+        )
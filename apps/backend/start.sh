@@ -19,6 +19,16 @@ python manage.py shell -c "from django.contrib.auth.models import User; import o
 
 python manage.py loaddata fixtures/*.json
 
+# Fixtures bypass products/database.py and delivery_agent/database.py, so rebuild the read models
+python manage.py rebuild_product_cards
+python manage.py rebuild_matching_index
+python manage.py rebuild_agent_stats
+
+# Record delivery SLA breaches every five minutes alongside the server
+python manage.py scan_delivery_sla --loop &
+# Fold product views and favourites into the popular sort every fifteen minutes
+python manage.py recompute_popularity --loop &
+
 # Check DEBUG value to determine server type
 if [ "$DEBUG" = "False" ] || [ "$DEBUG" = "false" ]; then
   echo "🔧 Starting Gunicorn server for production..."
@@ -1,24 +1,27 @@
-from ninja import Router 
+from ninja import Query, Router 
 from ninja.errors import HttpError 
-from typing import Union
-from .schemas import UserSignupIn, UserLoginIn, UserOut, FavouritesOut, FavouritesIn, UserIn, AddressOut, TokenRefreshIn, TwoFASetupOut, TwoFAVerifyIn, TwoFAStatusOut, TwoFARequiredOut
+from typing import Literal, Optional, Union
+from datetime import date
+from .schemas import UserSignupIn, UserLoginIn, UserOut, FavouritesOut, FavouritesIn, UserIn, TokenRefreshIn, TwoFASetupOut, TwoFAVerifyIn, TwoFAStatusOut, TwoFARequiredOut
 from .database import create_user_entry, validate_user_login, add_product_to_favourites, get_user_favourites, remove_product_from_favourites
-from django.http import Http404 , JsonResponse
+from django.http import Http404 , HttpResponse, JsonResponse
 from loguru import logger
 from .models import UserProfile, Address
-from delivery_agent.database import get_previous_deliveries_for_user, get_delivery_request_by_id
-from delivery_agent.schemas import DeliveryRequestOut
+from delivery_agent.database import NEXT_CURSOR_HEADER, add_delivery_review, get_delivery_location, get_previous_deliveries_for_user, get_delivery_request_by_id, get_delivery_timeline
+from delivery_agent.schemas import AgentReviewIn, AgentReviewOut, DeliveryLocationOut, DeliveryRequestOut, DeliveryStatusEventOut
 from products.schemas import ProductOut
 from products.database import get_user_listings
-from .schemas import UserIn, UserOut, AddressIn  # import AddressIn/Out
+from .schemas import UserIn, UserOut
 from rest_framework_simplejwt.tokens import AccessToken, RefreshToken # type: ignore
-from rest_framework_simplejwt.exceptions import TokenError # type: ignore
 import pyotp
 from django.conf import settings
+from backend.auth import AuthError, BearerAuth, USER, consume_refresh_token, invalidate_principal
+from backend.throttling import RateLimit
+from .profiles import cache_profile, get_profile, invalidate_profile, load_user, profile_out, profile_version, serialize_profile
 
 user_router = Router()
 
-@user_router.post("/signup", response={201: UserOut, 400: str}, tags=["Authentication"])
+@user_router.post("/signup", response={201: UserOut, 400: str, 429: str}, tags=["Authentication"])
 def user_signup(request, data: UserSignupIn):
     try:
         if data.password != data.confirm_password:
@@ -29,80 +32,45 @@ def user_signup(request, data: UserSignupIn):
         refresh = RefreshToken.for_user(user)
         access_token = str(refresh.access_token)
         refresh_token = str(refresh)
-        
-        # Create AddressOut object from user's address
-        address_out = None
-        if user.address:
-            address_out = AddressOut(
-                street=user.address.street,
-                city=user.address.city,
-                state=user.address.state,
-                postal_code=user.address.postal_code
-            )
-            
-        return 201, UserOut(
-            user_id=user.user_id,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            email=user.email,
-            user_type=user.user_type,
-            badge=user.badge,
-            sell_count=user.sell_count,
-            buy_count=user.buy_count,
-            joined_date=user.joined_date,
-            profile_pic_url=user.profile_pic_url,
-            role_name=user.role.role_name if user.role else None,
-            address=address_out,
-            token=access_token,
-            refresh_token=refresh_token
-        )
+
+        return 201, profile_out(serialize_profile(user), token=access_token, refresh_token=refresh_token)
+    except HttpError:
+        raise
     except Exception as e:
         raise HttpError(400, str(e))
 
-@user_router.post("/login", response={200: UserOut, 400: str, 404: str}, tags=["Authentication"])
+@user_router.post("/login", response={200: UserOut, 400: str, 404: str, 429: str}, tags=["Authentication"],
+                  throttle=[RateLimit("30/m", scope="user-login"),
+                            RateLimit("5/m", scope="user-login", key="user", user_field="email")])
 def user_login(request, data: UserLoginIn):
     try:
         user = validate_user_login(data)
         refresh = RefreshToken.for_user(user)
         access_token = str(refresh.access_token)
         refresh_token = str(refresh)
-        
-        # Create AddressOut object from user's address
-        address_out = None
-        if user.address:
-            address_out = AddressOut(
-                street=user.address.street,
-                city=user.address.city,
-                state=user.address.state,
-                postal_code=user.address.postal_code
-            )
-            
-        return 200, UserOut(
-            user_id=user.user_id,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            email=user.email,
-            user_type=user.user_type,
-            badge=user.badge,
-            sell_count=user.sell_count,
-            buy_count=user.buy_count,
-            joined_date=user.joined_date,
-            profile_pic_url=user.profile_pic_url,
-            role_name=user.role.role_name if user.role else None,
-            address=address_out,
+
+        snapshot = serialize_profile(user)
+        return 200, profile_out(
+            snapshot,
             token=access_token,
             refresh_token=refresh_token,
-            twofa_required=user.totp_secret is not None  #This is to check if 2FA is enabled by the user or not
+            twofa_required=snapshot["twofa_enabled"]  #This is to check if 2FA is enabled by the user or not
         )
     except Http404 as e:
         raise HttpError(404, str(e))
+    except HttpError:
+        raise
     except Exception as e:
         raise HttpError(400, str(e))
 
 @user_router.post("/token/refresh", response={200: dict, 400: str}, tags=["Authentication"])
 def refresh_token(request, data: TokenRefreshIn):
     try:
-        refresh = RefreshToken(data.refresh_token)
+        # The presented refresh token is revoked here, so each one can be rotated only once
+        principal, _ = consume_refresh_token(data.refresh_token)
+        if principal.kind != USER:
+            raise HttpError(400, "Invalid or expired refresh token")
+        refresh = RefreshToken.for_user(principal.as_user_profile())
         access_token = str(refresh.access_token)
         new_refresh_token = str(refresh)
         
@@ -110,8 +78,10 @@ def refresh_token(request, data: TokenRefreshIn):
             "access_token": access_token,
             "refresh_token": new_refresh_token
         }
-    except TokenError as e:
+    except AuthError as e:
         raise HttpError(400, "Invalid or expired refresh token")
+    except HttpError:
+        raise
     except Exception as e:
         raise HttpError(400, str(e))
 
@@ -127,9 +97,15 @@ def add_favourite(request, data: FavouritesIn):
         raise HttpError(400, str(e))
     
 @user_router.get("/favourites/{user_id}", response=FavouritesOut, tags=["User"])
-def get_favourites(request, user_id: int):
+def get_favourites(
+    request,
+    user_id: int,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    view: Literal["full", "card"] = Query("full")
+):
     try:
-        return get_user_favourites(user_id)
+        return get_user_favourites(user_id, offset=offset, limit=limit, view=view)
     except Http404 as e:
         raise HttpError(404, str(e))
     except Exception as e:
@@ -147,15 +123,24 @@ def remove_favourite(request, user_id: int, product_id: str):
         raise HttpError(400, str(e))
     
 @user_router.get("/{user_id}", response=list[DeliveryRequestOut], tags=["User"])
-def get_users_previous_deliveries(request, user_id: int):
+def get_users_previous_deliveries(request, response: HttpResponse, user_id: int,
+                                  cursor: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=200),
+                                  date_from: Optional[date] = Query(None, alias="from"),
+                                  date_to: Optional[date] = Query(None, alias="to")):
     """
-    API endpoint to fetch user details by user ID.
+    API endpoint to fetch a user's deliveries, newest first.
+    With a limit, the X-Next-Cursor header holds the cursor of the next page.
     """
     try:
         user = UserProfile.objects.get(user_id=user_id)
-        return get_previous_deliveries_for_user(user_id)
+        deliveries, next_cursor = get_previous_deliveries_for_user(user_id, cursor, limit, date_from, date_to)
+        if next_cursor:
+            response[NEXT_CURSOR_HEADER] = next_cursor
+        return deliveries
     except UserProfile.DoesNotExist:
         raise HttpError(404, f"User with ID {user_id} not found.")
+    except HttpError:
+        raise
     except Exception as e:
         logger.error(f"Error fetching user details for ID {user_id}: {e}")
         raise HttpError(500, f"An error occurred while fetching user details: {str(e)}")
@@ -175,6 +160,53 @@ def get_order_details(request, request_id: int):
         logger.error(f"Error fetching order details for request ID {request_id}: {e}")
         raise HttpError(500, f"An error occurred while fetching order details: {str(e)}")
 
+@user_router.get("/orders/{request_id}/timeline", response=list[DeliveryStatusEventOut], tags=["User"])
+def get_order_timeline(request, request_id: int):
+    """
+    API endpoint to fetch the status history of an order, oldest first.
+    """
+    try:
+        return get_delivery_timeline(request_id)
+    except Http404 as e:
+        raise HttpError(404, str(e))
+    except Exception as e:
+        logger.error(f"Error fetching timeline for request ID {request_id}: {e}")
+        raise HttpError(500, f"An error occurred while fetching the order timeline: {str(e)}")
+
+@user_router.get("/orders/{request_id}/location", response=DeliveryLocationOut, tags=["User"], auth=BearerAuth())
+def get_order_location(request, request_id: int):
+    """
+    API endpoint to fetch where the agent delivering an order is, for live tracking
+    by the order's buyer, seller or agent.
+    """
+    principal = request.auth
+    try:
+        if principal.kind == USER:
+            return get_delivery_location(request_id, user_id=principal.subject_id)
+        return get_delivery_location(request_id, agent_id=principal.subject_id)
+    except Http404 as e:
+        raise HttpError(404, str(e))
+    except HttpError:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching location for request ID {request_id}: {e}")
+        raise HttpError(500, f"An error occurred while fetching the order location: {str(e)}")
+
+@user_router.post("/orders/{request_id}/review", response={201: AgentReviewOut}, tags=["User"])
+def review_order_delivery(request, request_id: int, review: AgentReviewIn):
+    """
+    API endpoint for the buyer to rate the agent who delivered a completed order.
+    """
+    try:
+        return 201, add_delivery_review(request_id, review.user_id, review.rating, review.comment)
+    except Http404 as e:
+        raise HttpError(404, str(e))
+    except HttpError:
+        raise
+    except Exception as e:
+        logger.error(f"Error reviewing delivery for request ID {request_id}: {e}")
+        raise HttpError(500, f"An error occurred while saving the review: {str(e)}")
+
 @user_router.get("/my-listings/{user_id}", response=list[ProductOut], tags=["User-Listings"])
 def my_listings(request, user_id: int):
     try:
@@ -188,7 +220,8 @@ def my_listings(request, user_id: int):
 @user_router.put("/edit/{user_id}", response={200: UserOut, 404: str}, tags=["User"])
 def edit_user_profile(request, user_id: int, data: UserIn):
     try:
-        user = UserProfile.objects.get(user_id=user_id)
+        user = load_user(user_id)
+        changed = []
 
         # Update fields…
         if data.address:
@@ -199,36 +232,18 @@ def edit_user_profile(request, user_id: int, data: UserIn):
                 user.address.save()
             else:
                 user.address = Address.objects.create(**addr_data)
+                changed.append("address")
 
+        # Only write the edited columns, so concurrent F() updates of the counters survive
         for field, value in data.dict(exclude_unset=True, exclude={"address"}).items():
             setattr(user, field, value)
-        user.save()
+            changed.append(field)
+        if changed:
+            user.save(update_fields=changed)
+        invalidate_principal(USER, user_id)
+        invalidate_profile(user_id)
 
-        # Build nested address dict
-        address_obj = None
-        if user.address:
-            address_obj = AddressIn(
-                street=user.address.street,
-                city=user.address.city,
-                state=user.address.state,
-                postal_code=user.address.postal_code
-            )
-
-        return 200, UserOut(
-            user_id=user.user_id,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            email=user.email,
-            user_type=user.user_type,
-            badge=user.badge,
-            sell_count=user.sell_count,
-            buy_count=user.buy_count,
-            joined_date=user.joined_date,
-            profile_pic_url=user.profile_pic_url,
-            role_name=user.role.role_name if user.role else None,
-            address=address_obj,           # ← now an object
-            token=None
-        )
+        return 200, profile_out(serialize_profile(user))
 
     except UserProfile.DoesNotExist:
         raise HttpError(404, f"User with ID {user_id} not found")
@@ -238,33 +253,8 @@ def edit_user_profile(request, user_id: int, data: UserIn):
 @user_router.get("/edit/{user_id}", response={200: UserOut, 404: str}, tags=["User"])
 def get_user_profile(request, user_id: int):
     try:
-        user = UserProfile.objects.get(user_id=user_id)
-
-        address_obj = None
-        if user.address:
-            address_obj = AddressIn(
-                street=user.address.street,
-                city=user.address.city,
-                state=user.address.state,
-                postal_code=user.address.postal_code
-            )
-
-        return 200, UserOut(
-            user_id=user.user_id,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            email=user.email,
-            user_type=user.user_type,
-            badge=user.badge,
-            sell_count=user.sell_count,
-            buy_count=user.buy_count,
-            joined_date=user.joined_date,
-            profile_pic_url=user.profile_pic_url,
-            role_name=user.role.role_name if user.role else None,
-            address=address_obj,
-            token=None,
-            twofa_required=user.totp_secret is not None
-        )
+        snapshot = get_profile(user_id)
+        return 200, profile_out(snapshot, twofa_required=snapshot["twofa_enabled"])
     except UserProfile.DoesNotExist:
         raise HttpError(404, f"User with ID {user_id} not found")
 
@@ -277,6 +267,7 @@ def setup_2fa(request, user_id: int):
         secret = pyotp.random_base32()
         user.totp_secret = secret
         user.save()
+        invalidate_profile(user_id)
         issuer = getattr(settings, 'PROJECT_NAME', 'Hand2Hand')
         provisioning_uri = pyotp.totp.TOTP(secret).provisioning_uri(name=user.email, issuer_name=issuer)
         return 200, TwoFASetupOut(provisioning_uri=provisioning_uri)
@@ -285,10 +276,13 @@ def setup_2fa(request, user_id: int):
     except Exception as e:
         raise HttpError(400, str(e))
 
-@user_router.post("/2fa/verify", response={200: UserOut, 400: str, 404: str}, tags=["2FA"])
+@user_router.post("/2fa/verify", response={200: UserOut, 400: str, 404: str, 429: str}, tags=["2FA"],
+                  throttle=[RateLimit("30/m", scope="2fa-verify"),
+                            RateLimit("5/m", scope="2fa-verify", key="user", user_field="user_id")])
 def verify_2fa(request, data: TwoFAVerifyIn):
     try:
-        user = UserProfile.objects.get(user_id=data.user_id)
+        version = profile_version(data.user_id)
+        user = load_user(data.user_id)
         if not user.totp_secret:
             raise HttpError(400, "2FA not enabled for this user.")
         totp = pyotp.TOTP(user.totp_secret)
@@ -296,27 +290,8 @@ def verify_2fa(request, data: TwoFAVerifyIn):
             refresh = RefreshToken.for_user(user)
             access_token = str(refresh.access_token)
             refresh_token = str(refresh)
-            address_out = None
-            if user.address:
-                address_out = AddressOut(
-                    street=user.address.street,
-                    city=user.address.city,
-                    state=user.address.state,
-                    postal_code=user.address.postal_code
-                )
-            return 200, UserOut(
-                user_id=user.user_id,
-                first_name=user.first_name,
-                last_name=user.last_name,
-                email=user.email,
-                user_type=user.user_type,
-                badge=user.badge,
-                sell_count=user.sell_count,
-                buy_count=user.buy_count,
-                joined_date=user.joined_date,
-                profile_pic_url=user.profile_pic_url,
-                role_name=user.role.role_name if user.role else None,
-                address=address_out,
+            return 200, profile_out(
+                cache_profile(user, version),
                 token=access_token,
                 refresh_token=refresh_token,
                 twofa_required=False  # 2FA is now complete
@@ -0,0 +1,73 @@
+"""
+Denormalized sell_count / buy_count on UserProfile.
+
+sell_count is the number of the user's products with status "Sold"; buy_count is
+the number of the user's delivery requests that reached "completed". Both are kept
+up to date with F() increments inside the transaction of the transition that
+changes them, and reconcile_user_counters() repairs any drift in batches.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Max
+from loguru import logger
+
+from .models import UserProfile
+from .profiles import invalidate_profile
+
+SOLD_STATUS = "Sold"  # products.database.ProductStatus.SOLD
+COMPLETED_STATUS = "completed"
+
+
+def _adjust(user_id: int, field: str, delta: int):
+    UserProfile.objects.filter(user_id=user_id).update(**{field: F(field) + delta})
+    transaction.on_commit(lambda: invalidate_profile(user_id))
+
+
+def adjust_sell_count(seller_id: int, delta: int):
+    """Call inside the transaction that moves a product into or out of "Sold"."""
+    _adjust(seller_id, "sell_count", delta)
+
+
+def adjust_buy_count(buyer_id: int, delta: int):
+    """Call inside the transaction that moves a delivery request into or out of "completed"."""
+    _adjust(buyer_id, "buy_count", delta)
+
+
+def reconcile_user_counters(chunk_size: int = 1000) -> int:
+    """
+    Recompute both counters from products and delivery requests, one user-id range
+    at a time, and write back only the rows that drifted. Returns the number fixed.
+    """
+    from delivery_agent.models import DeliveryRequest
+    from products.models import Product
+
+    fixed = 0
+    max_id = UserProfile.objects.aggregate(last=Max('user_id'))['last'] or 0
+    for start in range(0, max_id, chunk_size):
+        end = start + chunk_size
+        with transaction.atomic():
+            # Lock the users first: a concurrent transition either committed before the
+            # counts below are read, or is still waiting to apply its increment after us
+            users = list(
+                UserProfile.objects.select_for_update().filter(user_id__gt=start, user_id__lte=end)
+                .only('user_id', 'sell_count', 'buy_count')
+            )
+            sold = dict(
+                Product.objects.filter(seller_id__gt=start, seller_id__lte=end, status=SOLD_STATUS)
+                .order_by().values_list('seller_id').annotate(total=Count('product_id'))
+            )
+            bought = dict(
+                DeliveryRequest.objects.filter(buyer_id__gt=start, buyer_id__lte=end, status=COMPLETED_STATUS)
+                .order_by().values_list('buyer_id').annotate(total=Count('request_id'))
+            )
+            drifted = []
+            for user in users:
+                sell_count, buy_count = sold.get(user.user_id, 0), bought.get(user.user_id, 0)
+                if (user.sell_count, user.buy_count) != (sell_count, buy_count):
+                    user.sell_count, user.buy_count = sell_count, buy_count
+                    drifted.append(user)
+            UserProfile.objects.bulk_update(drifted, ['sell_count', 'buy_count'])
+        for user in drifted:
+            invalidate_profile(user.user_id)
+        fixed += len(drifted)
+    logger.success(f"Reconciled sell/buy counters, {fixed} users corrected.")
+    return fixed
@@ -1,12 +1,16 @@
-from .models import UserProfile, Address, Role, UserFavourites
+from .models import UserProfile, Address, Role, FavouriteProduct
 from .schemas import UserSignupIn, UserLoginIn, FavouritesOut,  UserOut
-from products.database import serialize_product 
+from products.database import serialize_product, CARD_FIELDS
 from django.http import Http404 # type: ignore
-from django.contrib.auth.hashers import make_password, check_password # type: ignore
+from ninja.errors import HttpError
+from .passwords import hash_password, verify_password
+from backend.auth import USER, invalidate_principal
+from .profiles import invalidate_profile
 from loguru import logger
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from typing import Optional
-from products.models import Product
+from products.models import Product, ProductCard
+from products.popularity import adjust_favourite_count
 
 def create_user_entry(data: UserSignupIn):
     try:
@@ -16,20 +20,26 @@ def create_user_entry(data: UserSignupIn):
         password = signup_data.pop("password")
         signup_data.pop("confirm_password")  # Clean up
 
-        # Create Address
-        address = Address.objects.create(**address_data)
+        # Hash first: a full hashing queue (429) must not leave rows behind
+        hashed_password = hash_password(password)
 
         # Fetch Role
         role = Role.objects.get(role_id=role_id)
 
-        # Create UserProfile with hashed password
-        user = UserProfile.objects.create(
-            address=address,
-            role=role,
-            password=make_password(password),
-            **signup_data
-        )
+        with transaction.atomic():
+            # Create Address
+            address = Address.objects.create(**address_data)
+
+            # Create UserProfile with hashed password
+            user = UserProfile.objects.create(
+                address=address,
+                role=role,
+                password=hashed_password,
+                **signup_data
+            )
         return user
+    except HttpError:
+        raise
     except Exception as e:
         raise Exception(f"Error creating user: {str(e)}")
 
@@ -37,45 +47,43 @@ def validate_user_login(data: UserLoginIn):
     try:
         email = data.email
         password = data.password
-        user = UserProfile.objects.get(email=email)
+        user = UserProfile.objects.select_related('address', 'role').get(email=email)
 
-        if not check_password(password, user.password):
+        def rehash(new_password):
+            user.password = new_password
+            UserProfile.objects.filter(user_id=user.user_id).update(password=new_password)
+
+        if not verify_password(password, user.password, setter=rehash):
             raise Http404("Invalid password")
 
         return user
     except UserProfile.DoesNotExist:
         raise Http404(f"User with email {email} not found")
+    except HttpError:
+        raise
     except Exception as e:
         raise Exception(f"Login error: {str(e)}")
     
 
 def add_product_to_favourites(user_id: int, product_id: str):
     try:
-        # Check if user exists
-        try:
-            user = UserProfile.objects.get(user_id=user_id)
-            product = Product.objects.get(product_id=product_id)  # Assuming Product model exists
-        except UserProfile.DoesNotExist:
+        if not UserProfile.objects.filter(user_id=user_id).exists():
             logger.error(f"User with id={user_id} does not exist.")
             raise Exception("User does not exist.")
-        except Product.DoesNotExist:    
+        if not Product.objects.filter(product_id=product_id).exists():
             logger.error(f"Product with id={product_id} does not exist.")
             raise Exception("Product does not exist.")
 
-        try:
-            userFavourites = UserFavourites.objects.get(user=user)
-            if product_id in userFavourites.product_ids:
-                logger.warning(f"Product_id={product_id} already in favourites for user_id={user_id}")
-                raise Exception("Product already in favourites")
-
-            logger.info(f"Adding product_id={product_id} to favourites for user_id={user_id}")
-            userFavourites.product_ids.append(product_id)
-            userFavourites.save()
-            return userFavourites
-        except UserFavourites.DoesNotExist:
-            logger.info(f"Creating new favourites entry for user_id={user_id}")
-            userFavourites = UserFavourites.objects.create(user=user, product_ids=[product_id])
-            return userFavourites
+        with transaction.atomic():
+            favourite, created = FavouriteProduct.objects.get_or_create(user_id=user_id, product_id=product_id)
+            if created:
+                adjust_favourite_count(favourite.product_id, 1)
+        if not created:
+            logger.warning(f"Product_id={product_id} already in favourites for user_id={user_id}")
+            raise Exception("Product already in favourites")
+
+        logger.info(f"Added product_id={product_id} to favourites for user_id={user_id}")
+        return favourite
 
     except IntegrityError as e:
         logger.error(f"Database integrity error: {str(e)}")
@@ -84,35 +92,44 @@ def add_product_to_favourites(user_id: int, product_id: str):
         logger.error(f"Error adding product to favourites: {str(e)}")
         raise Exception(f"Error adding product to favourites: {str(e)}")
 
-def get_user_favourites(user_id: int):
+def get_user_favourites(user_id: int, offset: int = 0, limit: Optional[int] = None, view: str = "full"):
+    """
+    Fetch a user's favourites, most recent first, hydrated in a single query.
+    Without a limit the whole list is returned; with one, next_offset points at the next page.
+    """
     try:
-        favouritesOut = FavouritesOut(user_id=user_id, products=[])
-        userFavourites = UserFavourites.objects.get(user_id=user_id)
-        for product_id in userFavourites.product_ids:
-            try:
-                favouritesOut.products.append(serialize_product(Product.objects.get(product_id=product_id)))
-            except Product.DoesNotExist:
-                logger.warning(f"Product with id={product_id} does not exist in favourites for user_id={user_id}")
-                continue
-        return favouritesOut
-    except UserFavourites.DoesNotExist:
-        return FavouritesOut(user_id=user_id, products=[])
-    except UserProfile.DoesNotExist:
-        raise Http404(f"User with ID {user_id} not found")
+        favourites = FavouriteProduct.objects.filter(user_id=user_id).order_by('-created_at', '-id')
+        end = offset + limit + 1 if limit is not None else None
+
+        if view == "card":
+            rows = list(
+                ProductCard.objects.filter(product__favourited_by__user_id=user_id)
+                .order_by('-product__favourited_by__created_at', '-product__favourited_by__id')
+                .values(*CARD_FIELDS)[offset:end]
+            )
+        else:
+            rows = [
+                serialize_product(favourite.product)
+                for favourite in favourites.select_related('product__category')[offset:end]
+            ]
+
+        next_offset = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_offset = offset + limit
+        return FavouritesOut(user_id=user_id, products=rows, next_offset=next_offset)
     except Exception as e:
         raise Exception(f"Error fetching user favourites: {str(e)}")
 
 def remove_product_from_favourites(user_id: int, product_id: str):
     try:
-        userFavourites = UserFavourites.objects.get(user_id=user_id)
-        if product_id not in userFavourites.product_ids:
+        with transaction.atomic():
+            deleted, _ = FavouriteProduct.objects.filter(user_id=user_id, product_id=product_id).delete()
+            if deleted:
+                adjust_favourite_count(int(product_id), -1)
+        if not deleted:
             raise Exception("Product not found in favourites")
-
-        userFavourites.product_ids.remove(product_id)
-        userFavourites.save()
-        return userFavourites
-    except UserFavourites.DoesNotExist:
-        raise Http404(f"User with ID {user_id} not found")
+        return deleted
     except Exception as e:
         raise Exception(f"Error removing product from favourites: {str(e)}")
     
@@ -134,9 +151,11 @@ def update_moderator(moderator_id, **kwargs):
 
         address_data = kwargs.pop("address", None)
 
+        changed = []
         for key, value in kwargs.items():
             if hasattr(moderator, key) and value not in [None, ""]:
                 setattr(moderator, key, value)
+                changed.append(key)
 
         if address_data:
             if moderator.address:
@@ -149,8 +168,13 @@ def update_moderator(moderator_id, **kwargs):
                 from .models import Address
                 new_address = Address.objects.create(**address_data)
                 moderator.address = new_address
+                changed.append("address")
 
-        moderator.save()
+        # Only write the edited columns, so concurrent F() updates of the counters survive
+        if changed:
+            moderator.save(update_fields=changed)
+        invalidate_principal(USER, moderator_id)
+        invalidate_profile(moderator_id)
         return 200, serialize_moderator(moderator)
 
     except UserProfile.DoesNotExist:
@@ -0,0 +1,226 @@
+"""
+Bulk user import from CSV or NDJSON, for onboarding partner marketplaces.
+
+Rows are streamed and validated with UserSignupIn, then processed in chunks:
+passwords are hashed in parallel on a dedicated process pool, roles come from a
+single lookup, and each chunk's addresses and users are inserted with bulk_create
+in one transaction. Rows that fail are collected with their line number instead
+of aborting the import.
+
+CSV files use the UserSignupIn field names as headers, with the address given as
+street, city, state and postal_code columns (an "address." prefix is accepted too).
+NDJSON rows may nest the address or use the same flat fields. confirm_password
+may be omitted, in which case it is taken to match password.
+
+Uploads over the moderator API go through import_uploaded_users(), which caps the
+file size and the hashing pool and runs one import per process at a time; large
+files belong to the import_users management command.
+"""
+import csv
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, connection, transaction
+from loguru import logger
+from ninja.errors import HttpError
+from pydantic import ValidationError
+
+from .models import Address, Role, UserProfile
+from .passwords import new_hashing_pool
+from .schemas import UserSignupIn
+
+CHUNK_SIZE = getattr(settings, 'USER_IMPORT_CHUNK_SIZE', 500)
+HASHING_WORKERS = getattr(settings, 'USER_IMPORT_WORKERS', os.cpu_count() or 1)
+UPLOAD_MAX_BYTES = getattr(settings, 'USER_IMPORT_UPLOAD_MAX_BYTES', 256 * 1024)
+UPLOAD_WORKERS = getattr(settings, 'USER_IMPORT_UPLOAD_WORKERS', 2)
+ADDRESS_FIELDS = ("street", "city", "state", "postal_code")
+
+_upload_slot = threading.BoundedSemaphore(1)
+FORMATS = ("csv", "ndjson")
+
+
+@dataclass
+class RowError:
+    line: int
+    email: Optional[str]
+    error: str
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    errors: list = field(default_factory=list)
+
+    def fail(self, line: int, email: Optional[str], error: str):
+        self.errors.append(RowError(line, email, error))
+
+
+def _nest_address(row: dict) -> dict:
+    if isinstance(row.get("address"), dict):
+        return row
+    address = {}
+    for name in ADDRESS_FIELDS:
+        for key in (f"address.{name}", name):
+            if key in row:
+                address[name] = row.pop(key)
+    row["address"] = address
+    return row
+
+
+def read_rows(lines: Iterable[str], fmt: str) -> Iterator[tuple[int, Optional[dict], Optional[str]]]:
+    """Yield (line number, raw row, parse error) without loading the whole input."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            # Empty cells fall back to the schema defaults
+            row = {key: value for key, value in row.items() if key and value not in ("", None)}
+            yield reader.line_num, _nest_address(row), None
+    elif fmt == "ndjson":
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, "Expected a JSON object"
+                continue
+            yield line_number, _nest_address(row), None
+    else:
+        raise ValueError(f"Unsupported import format '{fmt}', expected one of {FORMATS}")
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in exc.errors())
+
+
+def import_users(lines: Iterable[str], fmt: str = "csv", chunk_size: int = CHUNK_SIZE,
+                 workers: int = HASHING_WORKERS) -> ImportResult:
+    result = ImportResult()
+    roles = Role.objects.in_bulk()
+    seen_emails = set()
+    chunk = []
+
+    with new_hashing_pool(workers) as pool:
+        for line, row, error in read_rows(lines, fmt):
+            if error:
+                result.fail(line, None, error)
+                continue
+            row.setdefault("confirm_password", row.get("password"))
+            try:
+                data = UserSignupIn.model_validate(row)
+            except ValidationError as e:
+                result.fail(line, row.get("email"), _validation_message(e))
+                continue
+            if data.password != data.confirm_password:
+                result.fail(line, data.email, "Passwords do not match")
+                continue
+            if data.role_id not in roles:
+                result.fail(line, data.email, f"Role {data.role_id} does not exist")
+                continue
+            email = data.email.lower()
+            if email in seen_emails:
+                result.fail(line, data.email, "Duplicate email in import")
+                continue
+            seen_emails.add(email)
+
+            chunk.append((line, data))
+            if len(chunk) >= chunk_size:
+                _import_chunk(chunk, roles, pool, workers, result)
+                chunk = []
+        if chunk:
+            _import_chunk(chunk, roles, pool, workers, result)
+
+    logger.success(f"User import finished: {result.created} created, {len(result.errors)} failed.")
+    return result
+
+
+def import_uploaded_users(lines: Iterable[str], fmt: str, size: int) -> ImportResult:
+    """import_users() for an upload handled inside an HTTP request."""
+    if size > UPLOAD_MAX_BYTES:
+        raise HttpError(413, f"Uploads are limited to {UPLOAD_MAX_BYTES // 1024} KB; "
+                             "use the import_users management command for larger files")
+    if not _upload_slot.acquire(blocking=False):
+        raise HttpError(429, "Another user import is running, please retry later")
+    try:
+        return import_users(lines, fmt, workers=UPLOAD_WORKERS)
+    finally:
+        _upload_slot.release()
+
+
+def _import_chunk(chunk: list, roles: dict, pool, workers: int, result: ImportResult):
+    existing = set(
+        email.lower() for email in
+        UserProfile.objects.filter(email__in=[data.email for _, data in chunk]).values_list('email', flat=True)
+    )
+    rows = []
+    for line, data in chunk:
+        if data.email.lower() in existing:
+            result.fail(line, data.email, "A user with this email already exists")
+        else:
+            rows.append((line, data))
+    if not rows:
+        return
+
+    hashes = list(pool.map(
+        make_password,
+        [data.password for _, data in rows],
+        chunksize=max(1, len(rows) // (workers * 4)),
+    ))
+    users = [_build_user(data, roles, password) for (_, data), password in zip(rows, hashes)]
+
+    try:
+        with transaction.atomic():
+            _insert(users)
+        result.created += len(users)
+        logger.info(f"Imported {len(users)} users (up to line {rows[-1][0]}).")
+    except IntegrityError:
+        # Someone signed up with one of these emails meanwhile; isolate the offending rows
+        for (line, data), user in zip(rows, users):
+            try:
+                with transaction.atomic():
+                    _insert([user])
+                result.created += 1
+            except IntegrityError as e:
+                result.fail(line, data.email, f"Could not insert user: {e}")
+
+
+def _build_user(data: UserSignupIn, roles: dict, password: str) -> UserProfile:
+    fields = data.dict(exclude={"address", "role_id", "password", "confirm_password"})
+    return UserProfile(
+        address=Address(**data.address.dict()),
+        role=roles[data.role_id],
+        password=password,
+        **fields,
+    )
+
+
+def _insert(users: list):
+    # Primary keys are cleared so a chunk can be retried row by row after a rolled-back attempt
+    addresses = [user.address for user in users]
+    for address in addresses:
+        address.pk = None
+    if connection.features.can_return_rows_from_bulk_insert:
+        Address.objects.bulk_create(addresses)
+    else:
+        # MySQL cannot return the ids of a multi-row insert, and the users need them
+        for address in addresses:
+            address.save()
+    for user, address in zip(users, addresses):
+        user.pk = None
+        user.address = address  # picks up the new address_id
+    UserProfile.objects.bulk_create(users)
+
+
+def write_error_report(errors: list, out):
+    writer = csv.writer(out)
+    writer.writerow(["line", "email", "error"])
+    for error in errors:
+        writer.writerow([error.line, error.email or "", error.error])
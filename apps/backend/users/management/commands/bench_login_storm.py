@@ -0,0 +1,69 @@
+import statistics
+import threading
+import time
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+
+from users.passwords import PasswordHashingBusy, verify_password
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure catalog latency (GET /api/products?view=card) while a burst of logins "
+        "hashes passwords either inline or on the bounded hashing pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--storm-threads", type=int, default=16)
+        parser.add_argument("--catalog-requests", type=int, default=200)
+
+    def handle(self, *args, **options):
+        encoded = make_password("bench-password")
+        verify_password("warm-up", encoded)  # start the pool outside the measurement
+
+        self.report("baseline", self.catalog_latencies(options["catalog_requests"]))
+        for mode, check in (
+            ("inline", lambda: check_password("bench-password", encoded)),
+            ("pool", lambda: verify_password("bench-password", encoded)),
+        ):
+            stop = threading.Event()
+            rejected = [0]
+
+            def storm():
+                while not stop.is_set():
+                    try:
+                        check()
+                    except PasswordHashingBusy:
+                        rejected[0] += 1
+                        time.sleep(0.01)
+
+            threads = [threading.Thread(target=storm, daemon=True) for _ in range(options["storm_threads"])]
+            for thread in threads:
+                thread.start()
+            try:
+                self.report(f"{mode} storm", self.catalog_latencies(options["catalog_requests"]), rejected[0])
+            finally:
+                stop.set()
+                for thread in threads:
+                    thread.join()
+
+    def catalog_latencies(self, count):
+        client = Client()
+        latencies = []
+        for _ in range(count):
+            started = time.perf_counter()
+            client.get("/api/products", {"view": "card"})
+            latencies.append((time.perf_counter() - started) * 1000)
+        connection.close()
+        return latencies
+
+    def report(self, label, latencies, rejected=0):
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f"{label:>14}: p50={statistics.median(latencies):.2f}ms p99={p99:.2f}ms"
+            + (f" rejected_logins={rejected}" if rejected else "")
+        )
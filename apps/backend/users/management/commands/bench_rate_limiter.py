@@ -0,0 +1,54 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from backend.throttling import RateLimit
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request cost of the login rate limits (IP and per-email sliding "
+        "windows) over many distinct clients, without the view itself."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50_000)
+        parser.add_argument("--clients", type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        throttles = [
+            RateLimit("30/m", scope="bench-login"),
+            RateLimit("5/m", scope="bench-login", key="user", user_field="email"),
+        ]
+        factory = RequestFactory()
+        requests = [
+            factory.post(
+                "/api/users/login",
+                data=json.dumps({"email": f"user{i}@example.com", "password": "x"}),
+                content_type="application/json",
+                REMOTE_ADDR=f"10.0.{i // 256 % 256}.{i % 256}",
+            )
+            for i in range(options["clients"])
+        ]
+
+        latencies = []
+        refused = 0
+        for i in range(options["requests"]):
+            request = requests[i % len(requests)]
+            started = time.perf_counter()
+            for throttle in throttles:
+                if not throttle.allow_request(request):
+                    throttle.wait()
+                    refused += 1
+            latencies.append((time.perf_counter() - started) * 1_000_000)
+
+        latencies.sort()
+        self.stdout.write(
+            f"{len(latencies)} requests, {refused} refusals: "
+            f"mean={statistics.mean(latencies):.1f}us "
+            f"p50={latencies[len(latencies) // 2]:.1f}us "
+            f"p99={latencies[int(len(latencies) * 0.99)]:.1f}us"
+        )
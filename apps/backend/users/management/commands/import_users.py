@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.importer import CHUNK_SIZE, FORMATS, HASHING_WORKERS, import_users, write_error_report
+
+
+class Command(BaseCommand):
+    help = "Import users with their addresses from a CSV or NDJSON file, writing a per-row error report."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument("--report", help="Where to write the error report CSV (default: stderr).")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        parser.add_argument("--workers", type=int, default=HASHING_WORKERS)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+        try:
+            with open(path, encoding="utf-8", newline="") as lines:
+                result = import_users(lines, fmt, chunk_size=options["chunk_size"], workers=options["workers"])
+        except OSError as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+
+        if result.errors:
+            if options["report"]:
+                with open(options["report"], "w", encoding="utf-8", newline="") as out:
+                    write_error_report(result.errors, out)
+            else:
+                write_error_report(result.errors, sys.stderr)
+        self.stdout.write(f"Imported {result.created} users, {len(result.errors)} rows failed.")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from backend.revocation import prune_expired_revocations
+
+
+class Command(BaseCommand):
+    help = "Delete revoked-token rows whose tokens have expired. Run periodically (e.g. from cron)."
+
+    def handle(self, *args, **options):
+        deleted = prune_expired_revocations()
+        self.stdout.write(f"Pruned {deleted} expired revoked tokens.")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from users.counters import reconcile_user_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute sell_count/buy_count from sold products and completed deliveries and fix drifted users."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = reconcile_user_counters(chunk_size=options["chunk_size"])
+        self.stdout.write(f"Corrected counters for {fixed} users.")
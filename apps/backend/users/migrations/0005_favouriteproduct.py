@@ -0,0 +1,80 @@
+# Generated by Django 5.2 on 2026-10-18 23:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_json_favourites(apps, schema_editor):
+    """Back-fill one FavouriteProduct row per entry of the legacy product_ids JSON list."""
+    UserFavourites = apps.get_model('users', 'UserFavourites')
+    FavouriteProduct = apps.get_model('users', 'FavouriteProduct')
+    Product = apps.get_model('products', 'Product')
+
+    existing_products = set(Product.objects.values_list('product_id', flat=True))
+    rows = []
+    stamps = []
+    for favourites in UserFavourites.objects.all().iterator():
+        seen = set()
+        for raw_id in favourites.product_ids or []:
+            try:
+                product_id = int(raw_id)
+            except (TypeError, ValueError):
+                continue
+            if product_id in seen or product_id not in existing_products:
+                continue
+            seen.add(product_id)
+            rows.append(FavouriteProduct(user_id=favourites.user_id, product_id=product_id))
+        if seen:
+            stamps.append((favourites.user_id, seen, favourites.updated_at))
+    FavouriteProduct.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+    # created_at is auto_now_add, so bulk_create stamped every row with the migration time
+    for user_id, product_ids, updated_at in stamps:
+        FavouriteProduct.objects.filter(user_id=user_id, product_id__in=product_ids).update(created_at=updated_at)
+
+
+def restore_json_favourites(apps, schema_editor):
+    UserFavourites = apps.get_model('users', 'UserFavourites')
+    FavouriteProduct = apps.get_model('users', 'FavouriteProduct')
+
+    product_ids = {}
+    for favourite in FavouriteProduct.objects.order_by('created_at', 'id').iterator():
+        product_ids.setdefault(favourite.user_id, []).append(str(favourite.product_id))
+    UserFavourites.objects.bulk_create(
+        [UserFavourites(user_id=user_id, product_ids=ids) for user_id, ids in product_ids.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_productcard'),
+        ('users', '0004_userprofile_totp_secret'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FavouriteProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favourited_by', to='products.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favourites', to='users.userprofile')),
+            ],
+            options={
+                'db_table': 'user_favourite_products',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='favouriteproduct',
+            index=models.Index(fields=['user', '-created_at'], name='favourite_user_recent_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favouriteproduct',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_user_favourite'),
+        ),
+        migrations.RunPython(copy_json_favourites, restore_json_favourites),
+        migrations.DeleteModel(
+            name='UserFavourites',
+        ),
+    ]
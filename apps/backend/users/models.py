@@ -46,17 +46,22 @@ class UserProfile(models.Model):
     class Meta:
         db_table = "users"
 
-class UserFavourites(models.Model):
+class FavouriteProduct(models.Model):
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='favourites')
-    product_ids = models.JSONField(default=list)
+    product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='favourited_by')
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Favourites of {self.user.first_name} {self.user.last_name} - {len(self.product_ids)} products favourited"
+        return f"Favourite of user {self.user_id}: product {self.product_id}"
 
     class Meta:
-        db_table = "user_favourites"
+        db_table = "user_favourite_products"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_user_favourite'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='favourite_user_recent_idx'),
+        ]
 
 
 class Moderator(models.Model):
@@ -70,4 +75,22 @@ class Moderator(models.Model):
         return f"Moderator: {self.first_name} {self.last_name}"
 
     class Meta:
-        db_table = "moderators"
\ No newline at end of file
+        db_table = "moderators"
+
+
+class RevokedToken(models.Model):
+    """
+    Append-only record of revoked JWT ids for both token families (users and
+    delivery agents). Rows are pruned once the token would have expired anyway.
+    """
+    jti = models.CharField(max_length=64, unique=True)
+    token_family = models.CharField(max_length=20)  # "user" or "delivery_agent"
+    subject_id = models.IntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Revoked {self.token_family} token {self.jti}"
+
+    class Meta:
+        db_table = "revoked_tokens"
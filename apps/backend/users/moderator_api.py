@@ -1,16 +1,25 @@
-from ninja import Router
+import codecs
+from datetime import datetime
+from typing import Literal, Optional
+from ninja import File, Router
 from ninja.errors import HttpError, Http404
-from .schemas import ModeratorIn, UserOut, UserIn
+from ninja.files import UploadedFile
+from .schemas import ModeratorIn, UserOut, UserIn, UserImportOut
 from .schemas import RejectReasonIn
 from products.database import approve_product_listing, reject_product_listing, get_pending_product_listings
 from delivery_agent.database import get_pending_delivery_agent, get_pending_delivery_agents, approve_agent, reject_agent
 from delivery_agent.models import DeliveryAgent
-from delivery_agent.schemas import DeliveryAgentOut
+from delivery_agent.schemas import DeliveryAgentOut, SlaBreachOut, StatusDurationOut
+from delivery_agent.sla import open_breaches
+from delivery_agent.timeline import status_durations
 from products.schemas import ProductOut
 from products.models import Product, ProductReport
 from users.models import UserProfile
 from loguru import logger
 from .database import get_moderator_by_id, update_moderator
+from .importer import import_uploaded_users
+from backend.auth import ModeratorAuth
+from backend.throttling import RateLimit
 
 moderator_router = Router()
 
@@ -166,6 +175,59 @@ def get_moderator_stats(request):
         raise HttpError(500, f"An error occurred while fetching stats: {str(e)}")
     
 
+@moderator_router.get("/delivery-status-durations", response=list[StatusDurationOut], tags=["Moderator-Stats"])
+def delivery_status_durations(request, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """
+    How long delivery requests stay in each status, from the status event log.
+    """
+    try:
+        return status_durations(since, until)
+    except Exception as e:
+        logger.error(f"Error fetching delivery status durations: {e}")
+        raise HttpError(500, f"An error occurred while fetching status durations: {str(e)}")
+
+
+@moderator_router.get("/delivery-sla-breaches", response=list[SlaBreachOut], tags=["Moderator-Stats"])
+def delivery_sla_breaches(
+    request, level: Optional[Literal["warning", "escalated"]] = None, status: Optional[str] = None, limit: int = 100,
+):
+    """
+    Delivery requests that are still in a status longer than its SLA allows, as found
+    by the scan_delivery_sla command, oldest first.
+    """
+    try:
+        return open_breaches(level, status, min(max(limit, 1), 500))
+    except Exception as e:
+        logger.error(f"Error fetching delivery SLA breaches: {e}")
+        raise HttpError(500, f"An error occurred while fetching SLA breaches: {str(e)}")
+
+
+@moderator_router.post("/import-users", response={200: UserImportOut, 400: str}, tags=["Moderator-Users"],
+                       auth=ModeratorAuth(), throttle=[RateLimit("10/h", scope="import-users", key="user")])
+def import_users_api(request, file: UploadedFile = File(...), format: Literal["csv", "ndjson"] = "csv"):
+    """
+    Bulk-import users from an uploaded CSV or NDJSON file of at most
+    USER_IMPORT_UPLOAD_MAX_BYTES. Valid rows are created, invalid ones are returned
+    with their line number and the reason. Larger files go through the
+    import_users management command.
+    """
+    logger.info(f"Moderator {request.auth.subject_id} importing users from uploaded {format} file {file.name}.")
+    try:
+        result = import_uploaded_users(codecs.iterdecode(file, "utf-8"), format, file.size)
+        return 200, UserImportOut(
+            created=result.created,
+            failed=len(result.errors),
+            errors=[{"line": e.line, "email": e.email, "error": e.error} for e in result.errors],
+        )
+    except UnicodeDecodeError as e:
+        raise HttpError(400, f"Import file must be UTF-8 encoded: {e}")
+    except HttpError:
+        raise
+    except Exception as e:
+        logger.error(f"Error importing users: {e}")
+        raise HttpError(500, f"An error occurred while importing users: {str(e)}")
+
+
 @moderator_router.get("/{id}", response=UserOut, tags=["Moderators"])
 def get_moderator_details(request, id: int):
     """
@@ -187,4 +249,4 @@ def update_moderator_details(request, id: int, data: UserIn):
         raise HttpError(404, str(e))
     except Exception as e:
         logger.error(f"Error updating moderator: {e}")
-        raise HttpError(500, str(e))
\ No newline at end of file
+        raise HttpError(500, str(e))
@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    PBKDF2PasswordHasher,
+    check_password,
+    get_hasher,
+    identify_hasher,
+    make_password,
+)
+from loguru import logger
+from ninja.errors import Throttled
+
+POOL_WORKERS = getattr(settings, 'PASSWORD_HASHING_WORKERS', 2)
+MAX_QUEUE_DEPTH = getattr(settings, 'PASSWORD_HASHING_MAX_QUEUE', 32)
+RESULT_TIMEOUT = getattr(settings, 'PASSWORD_HASHING_TIMEOUT_SECONDS', 10)
+RETRY_AFTER_SECONDS = 1
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the iteration count taken from settings.PASSWORD_HASH_ITERATIONS.
+    Stored hashes with a different count are upgraded on the next successful login.
+    """
+    iterations = getattr(settings, 'PASSWORD_HASH_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+class PasswordHashingBusy(Throttled):
+    """Raised when the hashing queue is full; surfaces to clients as 429 with Retry-After."""
+    def __init__(self):
+        super().__init__(wait=RETRY_AFTER_SECONDS)
+        self.message = "Too many authentication requests. Please retry shortly."
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# One slot per running or queued job, so a login storm cannot queue unbounded work
+_slots = threading.BoundedSemaphore(POOL_WORKERS + MAX_QUEUE_DEPTH)
+
+
+def _init_worker():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+
+def new_hashing_pool(workers: int) -> ProcessPoolExecutor:
+    """A process pool whose workers can run Django's hashers."""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            logger.info(f"Starting password hashing pool with {POOL_WORKERS} workers.")
+            _pool = new_hashing_pool(POOL_WORKERS)
+        return _pool
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        logger.warning("Password hashing queue is full, rejecting request.")
+        raise PasswordHashingBusy()
+    try:
+        future = _get_pool().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    # The slot is held until the job itself finishes, not until we stop waiting for it,
+    # so jobs abandoned after a timeout still count against the queue
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=RESULT_TIMEOUT)
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+
+
+def _reset_pool():
+    """Drop a pool whose worker died so the next call starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            logger.error("Password hashing pool is broken, restarting it.")
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def hash_password(raw_password: str) -> str:
+    """make_password, executed on the hashing pool."""
+    return _run(make_password, raw_password)
+
+
+def verify_password(raw_password: str, encoded: str, setter=None) -> bool:
+    """
+    check_password, executed on the hashing pool. When the stored hash was made
+    with an outdated hasher or iteration count, setter(new_hash) is called after
+    a successful check so the caller can persist the upgraded hash.
+    """
+    if not encoded:
+        return False
+    valid = _run(check_password, raw_password, encoded)
+    if valid and setter is not None and _needs_rehash(encoded):
+        setter(hash_password(raw_password))
+    return valid
+
+
+def _needs_rehash(encoded: str) -> bool:
+    preferred = get_hasher("default")
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
@@ -0,0 +1,108 @@
+"""
+Profile snapshots behind the UserOut responses of signup, login, 2FA verification
+and the profile edit endpoints.
+
+A snapshot is the serialized profile (address and role included) loaded with a
+single select_related query. Snapshots are cached under a per-user version number.
+Writers call invalidate_profile() after saving, which bumps the version; readers
+read the version before loading the row and cache under that one. A reader that
+loaded the old row just before an edit therefore can only ever write to a key
+nobody reads any more.
+
+Responses built from a row the caller saved itself (signup, profile edit) or
+looked up by something other than its id (login) have no version read before
+the load, so they are serialized but not cached.
+"""
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from loguru import logger
+
+from .models import UserProfile
+from .schemas import UserOut
+
+PROFILE_CACHE_SECONDS = getattr(settings, 'PROFILE_CACHE_SECONDS', 300)
+
+
+def _version_key(user_id: int) -> str:
+    return f"users:profile:{user_id}:version"
+
+
+def _snapshot_key(user_id: int, version: int) -> str:
+    return f"users:profile:{user_id}:v{version}"
+
+
+def profile_version(user_id: int) -> int:
+    """The version to cache a snapshot under; read it before loading the row."""
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seeded from the clock so a version key lost to eviction never restarts at a used number
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def load_user(user_id: int) -> UserProfile:
+    """UserProfile with address and role joined in. Raises UserProfile.DoesNotExist."""
+    return UserProfile.objects.select_related('address', 'role').get(user_id=user_id)
+
+
+def serialize_profile(user: UserProfile) -> dict:
+    address = user.address
+    return {
+        "user_id": user.user_id,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "user_type": user.user_type,
+        "badge": user.badge,
+        "sell_count": user.sell_count,
+        "buy_count": user.buy_count,
+        "joined_date": user.joined_date,
+        "profile_pic_url": user.profile_pic_url,
+        "role_name": user.role.role_name if user.role else None,
+        "address": {
+            "street": address.street,
+            "city": address.city,
+            "state": address.state,
+            "postal_code": address.postal_code,
+        } if address else None,
+        "twofa_enabled": user.totp_secret is not None,
+    }
+
+
+def cache_profile(user: UserProfile, version: int) -> dict:
+    """
+    Serialize a profile that is already loaded (address and role joined) and cache
+    it under the version read before it was loaded.
+    """
+    snapshot = serialize_profile(user)
+    cache.set(_snapshot_key(user.user_id, version), snapshot, PROFILE_CACHE_SECONDS)
+    return snapshot
+
+
+def get_profile(user_id: int) -> dict:
+    """Cached profile snapshot. Raises UserProfile.DoesNotExist."""
+    version = profile_version(user_id)
+    snapshot = cache.get(_snapshot_key(user_id, version))
+    if snapshot is None:
+        snapshot = cache_profile(load_user(user_id), version)
+    return snapshot
+
+
+def invalidate_profile(user_id: int):
+    logger.info(f"Invalidating cached profile for user {user_id}.")
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def profile_out(snapshot: dict, token: Optional[str] = None, refresh_token: Optional[str] = None,
+                twofa_required: bool = False) -> UserOut:
+    fields = {key: value for key, value in snapshot.items() if key != "twofa_enabled"}
+    return UserOut(**fields, token=token, refresh_token=refresh_token, twofa_required=twofa_required)
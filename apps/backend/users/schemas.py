@@ -1,7 +1,8 @@
 from ninja import Schema # type: ignore
 from typing import List, Optional
 from datetime import date
-from products.schemas import ProductOut  # Assuming Products schema is defined in products.schemas
+from typing import Union
+from products.schemas import ProductOut, ProductCardOut  # Assuming Products schema is defined in products.schemas
 class AddressIn(Schema):
     street: Optional[str] = ""
     city: Optional[str] = ""
@@ -16,8 +17,6 @@ class UserSignupIn(Schema):
     password: str
     confirm_password: str
     badge: Optional[str] = ""
-    sell_count: Optional[int] = 0
-    buy_count: Optional[int] = 0
     joined_date: date
     profile_pic_url: Optional[str] = ""
     address: AddressIn
@@ -52,14 +51,13 @@ class UserIn(Schema):
     last_name: str = None
     email: str = None
     badge: Optional[str] = None
-    sell_count: Optional[int] = None
-    buy_count: Optional[int] = None
     profile_pic_url: Optional[str] = None
     address: Optional[AddressIn] = None
 
 class FavouritesOut(Schema):
     user_id: int
-    products: Optional[List[ProductOut]]
+    products: Optional[Union[List[ProductOut], List[ProductCardOut]]]
+    next_offset: Optional[int] = None
 
 class FavouritesIn(Schema):
     user_id: int
@@ -96,4 +94,14 @@ class TwoFAStatusOut(Schema):
 
 class TwoFARequiredOut(Schema):
     user_id: int
-    twofa_required: bool
\ No newline at end of file
+    twofa_required: bool
+
+class UserImportErrorOut(Schema):
+    line: int
+    email: Optional[str]
+    error: str
+
+class UserImportOut(Schema):
+    created: int
+    failed: int
+    errors: List[UserImportErrorOut]
@@ -1,3 +1,136 @@
-from django.test import TestCase
+import threading
+from concurrent.futures import Future, TimeoutError
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase
+from rest_framework_simplejwt.tokens import RefreshToken  # type: ignore
+
+from backend.revocation import revocations
+from backend.throttling import RateLimit
+
+from . import passwords, profiles
+from .database import create_user_entry
+from .importer import UPLOAD_MAX_BYTES
+from .models import Address, Role, UserProfile
+from .passwords import PasswordHashingBusy
+from .schemas import UserSignupIn
+
+
+class UserImportApiTests(TestCase):
+    """The upload route is for moderators only and refuses files meant for the command."""
+
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(role_name="user")
+        cls.moderator, cls.user = (
+            UserProfile.objects.create(
+                first_name="Mo", last_name=user_type, email=f"{user_type}@example.com", user_type=user_type,
+                joined_date=date(2024, 1, 1), role=role,
+            )
+            for user_type in ("moderator", "user")
+        )
+
+    def setUp(self):
+        cache.clear()
+        revocations.rebuild()
+
+    def upload(self, content: bytes, user=None):
+        headers = {}
+        if user is not None:
+            headers["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(user).access_token}"
+        return self.client.post(
+            "/api/moderator/import-users", {"file": SimpleUploadedFile("users.csv", content)}, **headers,
+        )
+
+    def test_requires_a_moderator(self):
+        self.assertEqual(self.upload(b"email\n").status_code, 401)
+        self.assertEqual(self.upload(b"email\n", user=self.user).status_code, 403)
+
+    def test_large_files_are_refused(self):
+        response = self.upload(b"x" * (UPLOAD_MAX_BYTES + 1), user=self.moderator)
+        self.assertEqual(response.status_code, 413)
+
+    def test_invalid_rows_are_reported(self):
+        response = self.upload(b"email,password\nnot-an-address,secret\n", user=self.moderator)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["created"], response.json()["failed"]), (0, 1))
+
+
+class PasswordHashingQueueTests(TestCase):
+    """A full hashing queue rejects work up front and leaves nothing behind."""
+
+    def test_busy_signup_leaves_no_address(self):
+        role = Role.objects.create(role_name="user")
+        data = UserSignupIn(
+            first_name="Bea", last_name="Buyer", email="bea@example.com", user_type="user", password="pw",
+            confirm_password="pw", joined_date=date(2024, 1, 1), address={"postal_code": "36037"},
+            role_id=role.role_id,
+        )
+        with mock.patch("users.database.hash_password", side_effect=PasswordHashingBusy()):
+            with self.assertRaises(PasswordHashingBusy):
+                create_user_entry(data)
+        self.assertFalse(Address.objects.exists())
+        self.assertFalse(UserProfile.objects.exists())
+
+    def test_timed_out_job_keeps_its_slot_until_it_finishes(self):
+        job = Future()
+        pool = mock.Mock(submit=mock.Mock(return_value=job))
+        with mock.patch.object(passwords, "_slots", threading.BoundedSemaphore(1)), \
+                mock.patch.object(passwords, "_get_pool", return_value=pool), \
+                mock.patch.object(passwords, "RESULT_TIMEOUT", 0.01):
+            with self.assertRaises(TimeoutError):
+                passwords.hash_password("pw")
+            # The job is still running in the pool, so the queue is still full
+            with self.assertRaises(PasswordHashingBusy):
+                passwords.hash_password("pw")
+            job.set_result("hash")
+            pool.submit.return_value = finished = Future()
+            finished.set_result("hash")
+            self.assertEqual(passwords.hash_password("pw"), "hash")
+
+
+class ProfileCacheTests(TestCase):
+    """A snapshot loaded before an edit is never served after it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserProfile.objects.create(
+            first_name="Pat", last_name="Profile", email="pat@example.com", user_type="user",
+            joined_date=date(2024, 1, 1), role=Role.objects.create(role_name="user"),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_edit_between_load_and_cache(self):
+        load_user = profiles.load_user
+
+        def load_then_edit(user_id):
+            user = load_user(user_id)
+            UserProfile.objects.filter(user_id=user_id).update(first_name="Robin")
+            profiles.invalidate_profile(user_id)
+            return user
+
+        with mock.patch.object(profiles, "load_user", load_then_edit):
+            self.assertEqual(profiles.get_profile(self.user.user_id)["first_name"], "Pat")
+        self.assertEqual(profiles.get_profile(self.user.user_id)["first_name"], "Robin")
+
+
+class RateLimitTests(TestCase):
+    """A refused request gets its own Retry-After even when other threads share the throttle."""
+
+    def test_wait_is_kept_per_thread(self):
+        throttle = RateLimit("1/h", scope="test-wait")
+        factory = RequestFactory()
+        refused = factory.get("/", REMOTE_ADDR="10.0.0.1")
+        self.assertTrue(throttle.allow_request(refused))
+        self.assertFalse(throttle.allow_request(refused))
+
+        # Another client is admitted on another thread in between
+        other = threading.Thread(target=throttle.allow_request, args=(factory.get("/", REMOTE_ADDR="10.0.0.2"),))
+        other.start()
+        other.join()
+        self.assertGreater(throttle.wait(), 0)
@@ -11,7 +11,8 @@ interface Agent {
   phone_number: string;
   category_ids: string[];
   transport_mode: string;
-  reviews: any[];
+  review_count: number;
+  average_rating: number | null;
   deliveries_completed: number;
   identity_img_url: string;
   day_of_week: string[];
@@ -21,8 +21,6 @@ interface FormData {
   password: string;
   confirm_password: string;
   badge?: string;
-  sell_count?: number;
-  buy_count?: number;
   joined_date: string;
   profile_pic_url?: string;
   role_id: number;
@@ -89,8 +87,6 @@ const SignUp: React.FC = () => {
     password: "",
     confirm_password: "",
     badge: "",
-    sell_count: 0,
-    buy_count: 0,
     joined_date: new Date().toISOString().split("T")[0],
     profile_pic_url: "",
     role_id: 0,